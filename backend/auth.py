@@ -1,6 +1,7 @@
 import base64
 import json
 import os
+import time
 from typing import Any, Dict, Optional
 
 import jwt
@@ -8,6 +9,9 @@ from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from sqlalchemy.orm import Session
 
+import cache
+import profiling
+
 CLERK_PUBLIC_KEY_BASE64 = os.getenv("CLERK_PUBLIC_KEY_BASE64")
 
 if CLERK_PUBLIC_KEY_BASE64:
@@ -17,7 +21,13 @@ else:
 
 _security = HTTPBearer(auto_error=True)
 
+# Decoded tokens, until they expire; tokens never change so no invalidation
+# is needed
+TOKEN_CACHE_SECONDS = 300
+_token_cache = cache.get_cache("tokens", maxsize=1024)
+
 
+@profiling.timed("jwt")
 async def verify_token(
     credentials_header: HTTPAuthorizationCredentials = Depends(_security),
 ) -> Dict[str, Any]:
@@ -30,6 +40,10 @@ async def verify_token(
 
     token = credentials_header.credentials
 
+    cached = _token_cache.get(token)
+    if cached is not None:
+        return dict(cached)
+
     try:
         payload = jwt.decode(
             token,
@@ -37,7 +51,13 @@ async def verify_token(
             algorithms=["RS256"],
         )
 
-        return {"uid": payload.get("sub"), "email": payload.get("email")}
+        decoded = {"uid": payload.get("sub"), "email": payload.get("email")}
+        ttl = TOKEN_CACHE_SECONDS
+        if "exp" in payload:
+            ttl = min(ttl, payload["exp"] - time.time())
+        if ttl > 0:
+            _token_cache.set(token, decoded, ttl=ttl)
+        return dict(decoded)
 
     except jwt.ExpiredSignatureError:
         raise HTTPException(
@@ -53,6 +73,7 @@ async def verify_token(
         )
 
 
+@profiling.timed("user")
 def get_user(decoded_token: Dict[str, Any], db: Session) -> Any:
     """Get an existing User record from a Clerk token.
 
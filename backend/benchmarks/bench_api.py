@@ -0,0 +1,279 @@
+"""Benchmark the API end to end on a synthetic dataset.
+
+Generates users, plans, recipes, tags and slot history with synthetic.py,
+then drives the real FastAPI app in-process with `verify_token` stubbed out
+and reports throughput and latency percentiles per scenario as JSON.
+
+Uses a fresh temporary SQLite database unless `--database-url` is given,
+e.g. a local Postgres (needs psycopg2). Requires httpx for the test client.
+
+Usage (from backend/):
+  python benchmarks/bench_api.py
+  python benchmarks/bench_api.py --recipes 5000 --days 1095 --requests 500 --output baseline.json
+  python benchmarks/bench_api.py --compare baseline.json --threshold 20
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, BACKEND_DIR)
+
+SCENARIOS = [
+    "get_recipes",
+    "get_plan",
+    "get_plan_year",
+    "get_plan_year_compact",
+    "update_plan_slot",
+    "bulk_import_recipes",
+    "clone_plan",
+]
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of already sorted values."""
+    if not sorted_values:
+        return 0.0
+    index = min(int(round(fraction * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+def summarize(latencies: List[float], errors: int, elapsed: float) -> Dict[str, float]:
+    """Throughput and latency statistics (in ms) of one scenario."""
+    ordered = sorted(latencies)
+    return {
+        "requests": len(ordered),
+        "errors": errors,
+        "throughput_rps": round(len(ordered) / elapsed, 2) if elapsed > 0 else 0.0,
+        "mean_ms": round(statistics.fmean(ordered), 3) if ordered else 0.0,
+        "p50_ms": round(percentile(ordered, 0.50), 3),
+        "p90_ms": round(percentile(ordered, 0.90), 3),
+        "p99_ms": round(percentile(ordered, 0.99), 3),
+        "max_ms": round(ordered[-1], 3) if ordered else 0.0,
+    }
+
+
+def git_commit() -> str:
+    """Current commit of the checkout, if available."""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run_scenario(make_request: Callable[[random.Random], int], count: int, concurrency: int, seed: int) -> Dict:
+    """Issue `count` requests from `concurrency` threads and time each one."""
+    latencies: List[float] = []
+    errors = 0
+
+    def worker(worker_index: int) -> None:
+        nonlocal errors
+        rng = random.Random(seed + worker_index)
+        for _ in range(worker_index, count, concurrency):
+            started = time.perf_counter()
+            status_code = make_request(rng)
+            latencies.append((time.perf_counter() - started) * 1000)
+            if status_code >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(worker, range(concurrency)))
+    return summarize(latencies, errors, time.perf_counter() - started)
+
+
+def compare(results: Dict, baseline_path: str, threshold: float) -> int:
+    """Print the change against a baseline run; non-zero if p50 regressed."""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+
+    regressions = 0
+    print(f"Compared to {baseline.get('commit', '?')} ({baseline_path}):", file=sys.stderr)
+    for name, current in results["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if not previous:
+            continue
+        for metric in ("p50_ms", "p99_ms", "throughput_rps"):
+            before, after = previous[metric], current[metric]
+            change = (after - before) / before * 100 if before else 0.0
+            print(f"  {name:<22} {metric:<15} {before:>10.2f} -> {after:>10.2f} ({change:+.1f}%)", file=sys.stderr)
+        if previous["p50_ms"] and (current["p50_ms"] - previous["p50_ms"]) / previous["p50_ms"] * 100 > threshold:
+            regressions += 1
+    return 1 if regressions else 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database-url", help="Database to benchmark against (default: temporary SQLite file)")
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--plans", type=int, default=2)
+    parser.add_argument("--recipes", type=int, default=2000, help="Recipes per plan")
+    parser.add_argument("--tags", type=int, default=200)
+    parser.add_argument("--days", type=int, default=730, help="Days of slot history per plan")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per scenario")
+    parser.add_argument("--bulk-size", type=int, default=50, help="Recipes per bulk import request")
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="Write the JSON results here instead of stdout")
+    parser.add_argument("--compare", help="Baseline JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=20.0, help="Allowed p50 regression in percent")
+    args = parser.parse_args()
+
+    # The app reads its configuration at import time
+    if args.database_url:
+        os.environ["MATBURK_DATABASE_URL"] = args.database_url
+        os.environ["MATBURK_DATABASE_TYPE"] = "sqlite" if args.database_url.startswith("sqlite") else "postgresql"
+    else:
+        os.environ["MATBURK_DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp(prefix='matburk-bench-')}/bench.db"
+        os.environ["MATBURK_DATABASE_TYPE"] = "sqlite"
+    os.environ.setdefault("CLERK_PUBLIC_KEY_BASE64", "dW51c2Vk")
+
+    from fastapi import Request
+    from fastapi.testclient import TestClient
+
+    import auth
+    import main as app_main
+    import synthetic
+    from database import engine
+
+    started = time.perf_counter()
+    dataset = synthetic.populate(
+        engine,
+        synthetic.SyntheticConfig(
+            users=args.users,
+            plans=args.plans,
+            recipes_per_plan=args.recipes,
+            tags=args.tags,
+            days=args.days,
+            seed=args.seed,
+        ),
+    )
+    populate_seconds = time.perf_counter() - started
+    print(f"Generated {dataset.rows} in {populate_seconds:.1f}s", file=sys.stderr)
+
+    def stub_verify_token(request: Request) -> Dict:
+        uid = request.headers["X-Bench-User"]
+        return {"uid": uid, "email": f"{uid}@example.com"}
+
+    app_main.app.dependency_overrides[auth.verify_token] = stub_verify_token
+    client = TestClient(app_main.app)
+    bulk_counter = iter(range(10**9))
+
+    def plan_and_headers(rng: random.Random):
+        plan_id = rng.choice(dataset.plan_ids)
+        return plan_id, {"X-Bench-User": dataset.owners[plan_id]}
+
+    def get_recipes(rng: random.Random) -> int:
+        plan_id, headers = plan_and_headers(rng)
+        return client.get(f"/api/plans/{plan_id}/recipes", headers=headers).status_code
+
+    def get_plan(rng: random.Random) -> int:
+        plan_id, headers = plan_and_headers(rng)
+        start = dataset.first_day + timedelta(days=rng.randrange(max(dataset.days - 6, 1)))
+        params = {"start_date": start.isoformat(), "end_date": (start + timedelta(days=6)).isoformat()}
+        return client.get(f"/api/plans/{plan_id}/plan", params=params, headers=headers).status_code
+
+    # Body size of the last response of a scenario, for the one-year ranges
+    response_bytes: Dict[str, int] = {}
+
+    def get_plan_year(rng: random.Random, format: str = "full") -> int:
+        plan_id, headers = plan_and_headers(rng)
+        start = dataset.first_day + timedelta(days=rng.randrange(max(dataset.days - 364, 1)))
+        params = {"start_date": start.isoformat(), "end_date": (start + timedelta(days=364)).isoformat()}
+        if format != "full":
+            params["format"] = format
+        response = client.get(f"/api/plans/{plan_id}/plan", params=params, headers=headers)
+        response_bytes["get_plan_year" if format == "full" else f"get_plan_year_{format}"] = len(response.content)
+        return response.status_code
+
+    def update_plan_slot(rng: random.Random) -> int:
+        plan_id, headers = plan_and_headers(rng)
+        slot = {
+            "plan_date": (dataset.first_day + timedelta(days=rng.randrange(dataset.days))).isoformat(),
+            "meal_type_id": rng.choice(dataset.meal_type_ids),
+            "person": rng.choice(["A", "B"]),
+            "recipe_id": rng.choice(dataset.recipe_ids[plan_id]),
+        }
+        return client.post(f"/api/plans/{plan_id}/plan", json=slot, headers=headers).status_code
+
+    def bulk_import_recipes(rng: random.Random) -> int:
+        plan_id, headers = plan_and_headers(rng)
+        batch = next(bulk_counter)
+        lines = [
+            f"Bench {batch}-{i};{','.join(rng.sample(synthetic.WORDS, 2))};null;null;4" for i in range(args.bulk_size)
+        ]
+        response = client.post(
+            f"/api/plans/{plan_id}/recipes/bulk/import", data={"csv_data": "\n".join(lines)}, headers=headers
+        )
+        return response.status_code
+
+    def clone_plan(rng: random.Random) -> int:
+        plan_id, headers = plan_and_headers(rng)
+        week = dataset.first_day + timedelta(days=rng.randrange(dataset.days))
+        body = {"name": f"Bench clone {next(bulk_counter)}", "week_start": week.isoformat()}
+        return client.post(f"/api/plans/{plan_id}/clone", json=body, headers=headers).status_code
+
+    requests = {
+        "get_recipes": get_recipes,
+        "get_plan": get_plan,
+        "get_plan_year": get_plan_year,
+        "get_plan_year_compact": lambda rng: get_plan_year(rng, "compact"),
+        "update_plan_slot": update_plan_slot,
+        "bulk_import_recipes": bulk_import_recipes,
+        "clone_plan": clone_plan,
+    }
+
+    results = {
+        "commit": git_commit(),
+        "timestamp": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+        "python": platform.python_version(),
+        "database": engine.dialect.name,
+        "concurrency": args.concurrency,
+        "dataset": {
+            "users": args.users,
+            "plans": args.plans,
+            "recipes_per_plan": args.recipes,
+            "tags": args.tags,
+            "days": args.days,
+            "rows": dataset.rows,
+            "populate_seconds": round(populate_seconds, 2),
+        },
+        "scenarios": {},
+    }
+    for name in args.scenarios:
+        # Bulk imports grow the library and clones the database, so run fewer of them
+        count = max(args.requests // 10, 1) if name in ("bulk_import_recipes", "clone_plan") else args.requests
+        run_scenario(requests[name], min(count, 5), 1, args.seed)  # warm up
+        results["scenarios"][name] = run_scenario(requests[name], count, args.concurrency, args.seed)
+        if name in response_bytes:
+            results["scenarios"][name]["response_bytes"] = response_bytes[name]
+        print(f"{name:<22} {json.dumps(results['scenarios'][name])}", file=sys.stderr)
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+    if args.compare:
+        return compare(results, args.compare, args.threshold)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
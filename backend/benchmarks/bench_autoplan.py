@@ -0,0 +1,78 @@
+"""Benchmark the automatic week planner on large synthetic libraries.
+
+Runs the pure planning heuristic (no database) for a grid of library sizes
+and planning horizons and prints the median time per run.
+
+Usage (from backend/):
+  python benchmarks/bench_autoplan.py
+  python benchmarks/bench_autoplan.py --recipes 1000 50000 --weeks 1 12 --runs 3
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import planner  # noqa: E402
+
+TAGS = [f"tag{i}" for i in range(200)]
+
+
+def make_candidates(count: int, today: date, rng: random.Random) -> list:
+    """Generate recipes with skewed votes, random history and 0-5 tags."""
+    candidates = [
+        planner.Candidate(
+            recipe_id=i + 1,
+            default_portions=rng.choice([1, 2, 4, 4, 4, 6, 8]),
+            last_cooked=today - timedelta(days=rng.randint(1, 720)) if rng.random() < 0.7 else None,
+            is_placeholder=False,
+            tags=frozenset(rng.sample(TAGS, rng.randint(0, 5))),
+            votes=int(rng.paretovariate(1.5)) - 1,
+        )
+        for i in range(count)
+    ]
+    candidates += [planner.Candidate(count + i + 1, 1, None, True, frozenset({"snabbval"})) for i in range(4)]
+    return candidates
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--recipes", type=int, nargs="+", default=[100, 1000, 10000, 50000])
+    parser.add_argument("--weeks", type=int, nargs="+", default=[1, 4, 12])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    week_start = date(2026, 1, 5)
+    constraints = planner.Constraints(
+        no_repeat_days=14,
+        placeholder_quota=2,
+        preferences={
+            "A": planner.PersonPreferences(prefer_tags=frozenset({"tag1", "tag2"})),
+            "B": planner.PersonPreferences(avoid_tags=frozenset({"tag3"})),
+        },
+    )
+
+    print(f"{'recipes':>8} {'weeks':>6} {'slots':>6} {'filled':>7} {'median ms':>10}")
+    for count in args.recipes:
+        candidates = make_candidates(count, week_start, rng)
+        for weeks in args.weeks:
+            slots = planner.empty_slots(week_start, 7 * weeks, [1, 2], ["A", "B"], set())
+            timings = []
+            for _ in range(args.runs):
+                started = time.perf_counter()
+                assignment = planner.plan(slots, candidates, constraints, week_start)
+                timings.append((time.perf_counter() - started) * 1000)
+            print(f"{count:>8} {weeks:>6} {len(slots):>6} {len(assignment):>7} {statistics.median(timings):>10.2f}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,174 @@
+"""Benchmark the link metadata fetcher against a local stub server.
+
+Serves recipe pages with JSON-LD (and some with only OpenGraph tags) from a
+threaded HTTP server on localhost that answers after `--latency-ms`, honors
+If-None-Match with 304 and counts the requests. Then looks up `--links`
+links one at a time and concurrently on an empty cache, again with the cache
+fresh, and again after expiring it (revalidation), and finally gives the
+recipes of a synthetic plan, pointed at the stub, the images of their links.
+Prints the time and the requests by status of each round.
+
+Usage (from backend/):
+  python benchmarks/bench_link_metadata.py
+  python benchmarks/bench_link_metadata.py --links 500 --latency-ms 100 --concurrency 16
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Awaitable, Callable, Dict
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Recipe pages at /recept/<n>; odd ones only have OpenGraph tags, /gone/<n> is a 404."""
+
+    latency = 0.0
+    statuses: Counter = Counter()
+    lock = threading.Lock()
+
+    def do_GET(self) -> None:
+        time.sleep(self.latency)
+        parts = self.path.strip("/").split("/")
+        if len(parts) != 2 or parts[0] != "recept" or not parts[1].isdigit():
+            self._send(404, b"Not found", {})
+            return
+        number = int(parts[1])
+        etag = f'"v1-{number}"'
+        if self.headers.get("If-None-Match") == etag:
+            self._send(304, b"", {"ETag": etag})
+            return
+        if number % 2:
+            head = (
+                f'<meta property="og:title" content="Recept {number} &amp; sallad">'
+                f'<meta property="og:image" content="/bilder/{number}.jpg">'
+            )
+        else:
+            recipe = {
+                "@context": "https://schema.org",
+                "@graph": [
+                    {"@type": "WebPage", "name": "Recept"},
+                    {
+                        "@type": "Recipe",
+                        "name": f"Recept {number}",
+                        "image": [{"@type": "ImageObject", "url": f"https://bilder.example.com/{number}.jpg"}],
+                        "recipeYield": ["4", "4 portioner"],
+                    },
+                ],
+            }
+            head = f'<script type="application/ld+json">{json.dumps(recipe)}</script>'
+        page = f"<!doctype html><html><head><title>Sida {number}</title>{head}</head><body>{'x' * 20000}</body></html>"
+        self._send(200, page.encode(), {"ETag": etag, "Content-Type": "text/html; charset=utf-8"})
+
+    def _send(self, code: int, body: bytes, headers: Dict[str, str]) -> None:
+        with self.lock:
+            self.statuses[code] += 1
+        self.send_response(code)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database-url", help="Database to benchmark (default: temporary SQLite file)")
+    parser.add_argument("--links", type=int, default=200)
+    parser.add_argument("--latency-ms", type=float, default=50, help="Response time of the stub server")
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+
+    if args.database_url:
+        os.environ["MATBURK_DATABASE_URL"] = args.database_url
+        os.environ["MATBURK_DATABASE_TYPE"] = "sqlite" if args.database_url.startswith("sqlite") else "postgresql"
+    else:
+        os.environ["MATBURK_DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp(prefix='matburk-bench-')}/links.db"
+        os.environ["MATBURK_DATABASE_TYPE"] = "sqlite"
+    os.environ.setdefault("CLERK_PUBLIC_KEY_BASE64", "dW51c2Vk")
+    # The stub server is on localhost
+    os.environ["MATBURK_LINK_METADATA_ALLOW_PRIVATE"] = "1"
+
+    from sqlalchemy import delete, update
+
+    import link_metadata
+    import main as app_main  # noqa: F401 - creates the tables
+    import models
+    import synthetic
+    from database import SessionLocal, engine
+
+    StubHandler.latency = args.latency_ms / 1000
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    urls = [f"{base}/recept/{n}" for n in range(args.links)] + [f"{base}/gone/1"]
+
+    print(f"{'round':>22} {'links':>6} {'ms':>9} {'200':>5} {'304':>5} {'404':>5}")
+
+    def run(name: str, links: int, work: Callable[..., Awaitable]) -> object:
+        StubHandler.statuses.clear()
+        db = SessionLocal()
+        try:
+            started = time.perf_counter()
+            result = asyncio.run(work(db))
+            db.commit()
+            elapsed = (time.perf_counter() - started) * 1000
+        finally:
+            db.close()
+        counts = StubHandler.statuses
+        print(f"{name:>22} {links:>6} {elapsed:>9.1f} {counts[200]:>5} {counts[304]:>5} {counts[404]:>5}")
+        return result
+
+    def clear() -> None:
+        with engine.begin() as conn:
+            conn.execute(delete(models.LinkMetadata))
+
+    def expire() -> None:
+        with engine.begin() as conn:
+            conn.execute(update(models.LinkMetadata).values(expires_at=models.LinkMetadata.fetched_at))
+
+    clear()
+    run("cold, one at a time", len(urls), lambda db: link_metadata.lookup(db, urls, concurrency=1))
+    clear()
+    found = run(
+        f"cold, {args.concurrency} at a time", len(urls), lambda db: link_metadata.lookup(db, urls, args.concurrency)
+    )
+    run("cached", len(urls), lambda db: link_metadata.lookup(db, urls, args.concurrency))
+    expire()
+    revalidated = run("expired, revalidated", len(urls), lambda db: link_metadata.lookup(db, urls, args.concurrency))
+    if revalidated != found:
+        print("Revalidated metadata differs from the fetched metadata", file=sys.stderr)
+        return 1
+
+    # Recipes imported with a link but no image
+    dataset = synthetic.populate(engine, synthetic.SyntheticConfig(plans=1, recipes_per_plan=args.links, days=7))
+    recipes = models.RecipeDB.__table__
+    with engine.begin() as conn:
+        conn.execute(
+            update(recipes)
+            .where(recipes.c.meal_plan_id == dataset.plan_ids[0], recipes.c.link.isnot(None))
+            .values(link=base + "/recept/" + recipes.c.id.cast(models.String), image_url=None)
+        )
+    clear()
+    summary, _ = run(
+        "image backfill", args.links, lambda db: link_metadata.backfill_images(db, concurrency=args.concurrency)
+    )
+    print(json.dumps(summary))
+
+    server.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,108 @@
+"""Benchmark invite-heavy usage: creating invite links and joining plans.
+
+Generates share codes with the bulk generator and the former per-character
+`secrets.choice` loop, then runs the invite and join endpoints against a
+synthetic dataset with auth stubbed out: each round the plan owners create
+one-time invites and new users join with them. Prints the median and p90
+time per request and the queries each issued.
+
+Usage (from backend/):
+  python benchmarks/bench_shares.py
+  python benchmarks/bench_shares.py --invites 2000 --codes 100000
+"""
+
+import argparse
+import os
+import secrets
+import statistics
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+
+def timed(fn: Callable[[], None]) -> float:
+    started = time.perf_counter()
+    fn()
+    return (time.perf_counter() - started) * 1000
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database-url", help="Database to benchmark (default: temporary SQLite file)")
+    parser.add_argument("--plans", type=int, default=20)
+    parser.add_argument("--invites", type=int, default=500, help="Invites created and used")
+    parser.add_argument("--codes", type=int, default=20000, help="Codes generated in the generator comparison")
+    args = parser.parse_args()
+
+    if args.database_url:
+        os.environ["MATBURK_DATABASE_URL"] = args.database_url
+        os.environ["MATBURK_DATABASE_TYPE"] = "sqlite" if args.database_url.startswith("sqlite") else "postgresql"
+    else:
+        os.environ["MATBURK_DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp(prefix='matburk-bench-')}/shares.db"
+        os.environ["MATBURK_DATABASE_TYPE"] = "sqlite"
+    os.environ.setdefault("CLERK_PUBLIC_KEY_BASE64", "dW51c2Vk")
+
+    from fastapi import Request
+    from fastapi.testclient import TestClient
+    from sqlalchemy import event
+
+    import auth
+    import main as app_main
+    import shares
+    import synthetic
+    from database import engine
+
+    alphabet = shares.TOKEN_ALPHABET
+    per_char = timed(
+        lambda: ["".join(secrets.choice(alphabet) for _ in range(shares.TOKEN_LENGTH)) for _ in range(args.codes)]
+    )
+    bulk = timed(lambda: shares.random_codes(alphabet, shares.TOKEN_LENGTH, args.codes))
+    print(f"{args.codes} tokens: secrets.choice {per_char:.1f} ms, token_bytes {bulk:.1f} ms")
+
+    dataset = synthetic.populate(engine, synthetic.SyntheticConfig(plans=args.plans, recipes_per_plan=5, days=7))
+
+    def stub_verify_token(request: Request) -> Dict:
+        uid = request.headers["X-Bench-User"]
+        return {"uid": uid, "email": f"{uid}@example.com"}
+
+    app_main.app.dependency_overrides[auth.verify_token] = stub_verify_token
+    client = TestClient(app_main.app)
+
+    statements: List[str] = []
+    event.listen(engine, "before_cursor_execute", lambda conn, cursor, statement, *rest: statements.append(statement))
+
+    timings: Dict[str, List[float]] = {"invite": [], "join": []}
+    queries: Dict[str, List[int]] = {"invite": [], "join": []}
+
+    def request(name: str, method: str, url: str, headers: Dict, **kwargs) -> Dict:
+        statements.clear()
+        started = time.perf_counter()
+        response = getattr(client, method)(url, headers=headers, **kwargs)
+        timings[name].append((time.perf_counter() - started) * 1000)
+        queries[name].append(len(statements))
+        response.raise_for_status()
+        return response.json()
+
+    for i in range(args.invites):
+        plan_id = dataset.plan_ids[i % len(dataset.plan_ids)]
+        owner = {"X-Bench-User": dataset.owners[plan_id]}
+        token = request("invite", "post", f"/api/plans/{plan_id}/invite", owner, params={"permission": "edit"})
+        guest = {"X-Bench-User": f"bench-guest-{i}"}
+        client.post("/api/auth/register", headers=guest).raise_for_status()
+        request("join", "post", "/api/plans/join", guest, params={"share_code": token["invite_token"]})
+
+    print(f"{'request':>8} {'count':>6} {'median ms':>10} {'p90 ms':>8} {'queries':>8}")
+    for name, values in timings.items():
+        ordered = sorted(values)
+        p90 = ordered[min(int(round(0.9 * (len(ordered) - 1))), len(ordered) - 1)]
+        median_queries = statistics.median(queries[name])
+        print(f"{name:>8} {len(values):>6} {statistics.median(values):>10.2f} {p90:>8.2f} {median_queries:>8g}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,150 @@
+"""Check that the hot API queries use indexes.
+
+Runs the hot endpoints against a synthetic dataset with auth stubbed out,
+captures every SELECT they issue and runs EXPLAIN on it. A query that scans
+`recipes` or `plan_slots` instead of searching an index, or (on SQLite) has
+to sort its whole result instead of reading it in index order, fails.
+
+SQLite by default; with a Postgres `--database-url` sequential scans are
+disabled for the session so the planner's choice does not depend on the
+(small) table sizes, and any remaining Seq Scan on those tables fails.
+
+Usage (from backend/):
+  python benchmarks/explain_audit.py
+  python benchmarks/explain_audit.py --verbose
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+import tempfile
+from datetime import timedelta
+from typing import Dict, List, Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+HOT_TABLES = ("recipes", "plan_slots")
+
+
+def sqlite_violations(conn, statement: str, parameters) -> Tuple[List[str], List[str]]:
+    """EXPLAIN QUERY PLAN lines, and those that scan a hot table or sort all rows."""
+    plan = [row[3] for row in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)]
+    pattern = re.compile(r"^SCAN (%s)\b" % "|".join(HOT_TABLES))
+    return plan, [line for line in plan if pattern.match(line) or line == "USE TEMP B-TREE FOR ORDER BY"]
+
+
+def postgres_violations(conn, statement: str, parameters) -> Tuple[List[str], List[str]]:
+    """EXPLAIN node summaries, and the sequential scans of a hot table."""
+    conn.exec_driver_sql("SET enable_seqscan = off")
+    (document,) = conn.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {statement}", parameters).one()
+    if isinstance(document, str):
+        document = json.loads(document)
+
+    plan, violations = [], []
+
+    def walk(node: Dict) -> None:
+        line = f"{node['Node Type']} {node.get('Relation Name', '')} {node.get('Index Name', '')}".strip()
+        plan.append(line)
+        if node["Node Type"] == "Seq Scan" and node.get("Relation Name") in HOT_TABLES:
+            violations.append(line)
+        for child in node.get("Plans", []):
+            walk(child)
+
+    walk(document[0]["Plan"])
+    return plan, violations
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database-url", help="Database to audit (default: temporary SQLite file)")
+    parser.add_argument("--verbose", action="store_true", help="Print the plan of every query")
+    args = parser.parse_args()
+
+    if args.database_url:
+        os.environ["MATBURK_DATABASE_URL"] = args.database_url
+        os.environ["MATBURK_DATABASE_TYPE"] = "sqlite" if args.database_url.startswith("sqlite") else "postgresql"
+    else:
+        os.environ["MATBURK_DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp(prefix='matburk-audit-')}/audit.db"
+        os.environ["MATBURK_DATABASE_TYPE"] = "sqlite"
+    os.environ.setdefault("CLERK_PUBLIC_KEY_BASE64", "dW51c2Vk")
+
+    from fastapi import Request
+    from fastapi.testclient import TestClient
+    from sqlalchemy import event
+
+    import auth
+    import main as app_main
+    import synthetic
+    from database import engine
+
+    dataset = synthetic.populate(engine, synthetic.SyntheticConfig(plans=2, recipes_per_plan=300, days=120))
+    plan_id = dataset.plan_ids[0]
+    recipe_id = dataset.recipe_ids[plan_id][0]
+    headers = {"X-Bench-User": dataset.owners[plan_id]}
+    week_start = dataset.first_day + timedelta(days=28 - dataset.first_day.weekday())
+    week = {"start_date": week_start.isoformat(), "end_date": (week_start + timedelta(days=6)).isoformat()}
+
+    def stub_verify_token(request: Request) -> Dict:
+        uid = request.headers["X-Bench-User"]
+        return {"uid": uid, "email": f"{uid}@example.com"}
+
+    app_main.app.dependency_overrides[auth.verify_token] = stub_verify_token
+    client = TestClient(app_main.app)
+
+    captured: List[Tuple[str, str, object]] = []
+    current = {"name": ""}
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT") and not executemany:
+            captured.append((current["name"], statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", capture)
+    calls = [
+        ("get_recipes by votes", "get", f"/api/plans/{plan_id}/recipes", {"params": {"sort_by": "vote"}}),
+        ("get_recipes by name", "get", f"/api/plans/{plan_id}/recipes", {"params": {"sort_by": "name"}}),
+        ("get_plan", "get", f"/api/plans/{plan_id}/plan", {"params": week}),
+        (
+            "update_plan_slot",
+            "post",
+            f"/api/plans/{plan_id}/plan",
+            {"json": {"plan_date": week["start_date"], "meal_type_id": 1, "person": "A", "recipe_id": recipe_id}},
+        ),
+        ("batches", "get", f"/api/plans/{plan_id}/batches", {"params": week}),
+        ("bootstrap", "get", f"/api/plans/{plan_id}/bootstrap", {"params": {"week_start": week["start_date"]}}),
+    ]
+    for name, method, url, kwargs in calls:
+        current["name"] = name
+        response = getattr(client, method)(url, headers=headers, **kwargs)
+        if response.status_code >= 400:
+            print(f"{name}: HTTP {response.status_code} {response.text}", file=sys.stderr)
+            return 2
+    event.remove(engine, "before_cursor_execute", capture)
+
+    explain = postgres_violations if engine.dialect.name == "postgresql" else sqlite_violations
+    failures = 0
+    seen = set()
+    with engine.connect() as conn:
+        for name, statement, parameters in captured:
+            if statement in seen:
+                continue
+            seen.add(statement)
+            plan, violations = explain(conn, statement, parameters)
+            if violations:
+                failures += 1
+                print(f"FAIL {name}: {' '.join(statement.split())[:160]}")
+                for line in violations:
+                    print(f"    {line}")
+            elif args.verbose:
+                print(f"ok   {name}: {' '.join(statement.split())[:160]}")
+            if args.verbose or violations:
+                for line in plan:
+                    print(f"       | {line}")
+
+    print(f"{len(seen)} distinct queries, {failures} not served by an index on {' or '.join(HOT_TABLES)}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,101 @@
+"""Check that the plan endpoints issue a constant number of queries.
+
+Gives one user access to a growing number of plans, calls the plan listing
+and plan endpoints with auth stubbed out and counts the statements each
+request sends to the database. A count that grows with the number of plans
+is an N+1 (e.g. a lazy relationship loaded in a loop) and fails.
+
+Usage (from backend/):
+  python benchmarks/query_count_audit.py
+  python benchmarks/query_count_audit.py --plans 1 10 100
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+from typing import Dict, List
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database-url", help="Database to audit (default: temporary SQLite file)")
+    parser.add_argument("--plans", type=int, nargs="+", default=[1, 5, 25], help="Plans of the user, per round")
+    args = parser.parse_args()
+
+    if args.database_url:
+        os.environ["MATBURK_DATABASE_URL"] = args.database_url
+        os.environ["MATBURK_DATABASE_TYPE"] = "sqlite" if args.database_url.startswith("sqlite") else "postgresql"
+    else:
+        os.environ["MATBURK_DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp(prefix='matburk-audit-')}/audit.db"
+        os.environ["MATBURK_DATABASE_TYPE"] = "sqlite"
+    os.environ.setdefault("CLERK_PUBLIC_KEY_BASE64", "dW51c2Vk")
+
+    from fastapi import Request
+    from fastapi.testclient import TestClient
+    from sqlalchemy import event, insert
+
+    import auth
+    import main as app_main
+    import models
+    import synthetic
+    from database import engine
+
+    # Plans of many different creators, joined by a new user
+    dataset = synthetic.populate(
+        engine, synthetic.SyntheticConfig(users=max(args.plans), plans=max(args.plans), recipes_per_plan=5, days=7)
+    )
+    headers = {"X-Bench-User": "query-count-audit"}
+
+    def stub_verify_token(request: Request) -> Dict:
+        uid = request.headers["X-Bench-User"]
+        return {"uid": uid, "email": f"{uid}@example.com"}
+
+    app_main.app.dependency_overrides[auth.verify_token] = stub_verify_token
+    client = TestClient(app_main.app)
+    user_id = client.post("/api/auth/register", headers=headers).json()["id"]
+
+    statements: List[str] = []
+    event.listen(engine, "before_cursor_execute", lambda conn, cursor, statement, *rest: statements.append(statement))
+
+    counts: Dict[str, List[int]] = {}
+    joined = 0
+    for plans in sorted(args.plans):
+        with engine.begin() as conn:
+            conn.execute(
+                insert(models.UserMealPlanAccess),
+                [
+                    {"user_id": user_id, "meal_plan_id": plan_id, "permission": models.Permission.VIEW}
+                    for plan_id in dataset.plan_ids[joined:plans]
+                ],
+            )
+        joined = plans
+
+        calls = [
+            ("list plans", "/api/plans"),
+            ("get plan", f"/api/plans/{dataset.plan_ids[plans - 1]}"),
+        ]
+        for name, url in calls:
+            client.get(url, headers=headers)  # warm up the user and permission caches
+            statements.clear()
+            response = client.get(url, headers=headers)
+            if response.status_code >= 400:
+                print(f"{name}: HTTP {response.status_code} {response.text}", file=sys.stderr)
+                return 2
+            counts.setdefault(name, []).append(len(statements))
+
+    failures = 0
+    for name, per_round in counts.items():
+        constant = len(set(per_round)) == 1
+        failures += not constant
+        rounds = ", ".join(f"{plans} plans: {count}" for plans, count in zip(sorted(args.plans), per_round))
+        print(f"{'ok  ' if constant else 'FAIL'} {name}: {rounds}")
+
+    print(f"{len(counts)} endpoints, {failures} with a query count that grows with the plans")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
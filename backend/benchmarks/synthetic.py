@@ -0,0 +1,415 @@
+"""Synthetic datasets for benchmarks and scale tests.
+
+Writes users, meal plans (with members through shared access), recipes,
+tags, ingredients and years of slot history with bulk Core inserts. Ids are
+assigned up front from the current maximum of each table, so rows can
+reference each other without reading anything back.
+
+Sizes are configurable and drawn from skewed distributions like real
+households have them: library sizes vary per plan (log-normal), a few tags
+and recipes are far more popular than the rest (Zipf), votes follow a
+Pareto distribution and most plans have one or two members.
+
+Usage (from backend/):
+  python benchmarks/synthetic.py --plans 100 --recipes 500 --days 1095
+  python benchmarks/synthetic.py --database-url postgresql://localhost/matburk_scale --plans 1000 --members 2
+"""
+
+import argparse
+import itertools
+import math
+import os
+import random
+import sys
+import time
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from typing import Dict, List
+
+from sqlalchemy import func, insert, select
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+CHUNK_SIZE = 5000
+
+WORDS = [
+    "kyckling",
+    "lax",
+    "torsk",
+    "linser",
+    "halloumi",
+    "pasta",
+    "ris",
+    "curry",
+    "gryta",
+    "soppa",
+    "wok",
+    "paj",
+    "gratäng",
+    "bowl",
+    "tacos",
+    "köttbullar",
+    "chili",
+    "risotto",
+    "lasagne",
+    "sallad",
+]
+
+INGREDIENTS = [
+    ("gul lök", "st"),
+    ("vitlök", "st"),
+    ("krossade tomater", "g"),
+    ("grädde", "dl"),
+    ("mjölk", "dl"),
+    ("smör", "msk"),
+    ("olivolja", "msk"),
+    ("ris", "dl"),
+    ("pasta", "g"),
+    ("kycklingfilé", "g"),
+    ("laxfilé", "g"),
+    ("potatis", "kg"),
+    ("morot", "st"),
+    ("salt", "tsk"),
+    ("svartpeppar", "krm"),
+]
+
+
+@dataclass
+class SyntheticConfig:
+    """Sizes and distribution parameters of a synthetic dataset."""
+
+    users: int = 10
+    plans: int = 2
+    # Median recipes per plan; `recipe_spread` is the sigma of the log-normal
+    # spread around it (0 gives every plan exactly this many)
+    recipes_per_plan: int = 2000
+    recipe_spread: float = 0.0
+    tags: int = 200
+    tags_per_recipe: float = 2.5
+    max_tags_per_recipe: int = 5
+    ingredients_per_recipe: float = 0.0
+    # Days of lunch/dinner history per plan and the share of slots filled
+    days: int = 730
+    fill_rate: float = 0.9
+    # Mean number of members per plan besides the owner (shared access)
+    members_per_plan: float = 0.0
+    # Zipf exponent of how often recipes get cooked and tags get used
+    popularity_skew: float = 1.0
+    # Pareto shape of vote counts (lower is more skewed)
+    vote_skew: float = 1.5
+    deleted_rate: float = 0.02
+    placeholders: bool = True
+    seed: int = 1
+
+
+@dataclass
+class Dataset:
+    """What `populate` created."""
+
+    user_uids: List[str] = field(default_factory=list)
+    plan_ids: List[int] = field(default_factory=list)
+    # plan id -> clerk uid of the owner
+    owners: Dict[int, str] = field(default_factory=dict)
+    # plan id -> regular (non-placeholder) recipe ids
+    recipe_ids: Dict[int, List[int]] = field(default_factory=dict)
+    meal_type_ids: List[int] = field(default_factory=list)
+    first_day: date = date.today()
+    days: int = 0
+    rows: Dict[str, int] = field(default_factory=dict)
+
+
+def _next_id(conn, table) -> int:
+    return (conn.execute(select(func.max(table.c.id))).scalar() or 0) + 1
+
+
+def _insert(conn, table, rows: List[dict], dataset: Dataset) -> None:
+    for i in range(0, len(rows), CHUNK_SIZE):
+        conn.execute(insert(table), rows[i : i + CHUNK_SIZE])
+    dataset.rows[table.name] = dataset.rows.get(table.name, 0) + len(rows)
+
+
+def _zipf_cum_weights(count: int, skew: float) -> List[float]:
+    return list(itertools.accumulate(1.0 / (rank + 1) ** skew for rank in range(count)))
+
+
+def _poisson(rng: random.Random, mean: float) -> int:
+    """Knuth's method, fine for the small means used here."""
+    if mean <= 0:
+        return 0
+    limit, count, product = math.exp(-mean), 0, rng.random()
+    while product > limit:
+        count += 1
+        product *= rng.random()
+    return count
+
+
+def populate(engine, config: SyntheticConfig) -> Dataset:
+    """Fill the database with a synthetic dataset.
+
+    Each plan is owned by one of the users, shared with about
+    `members_per_plan` others and gets its recipe library plus `days` days
+    of lunch and dinner history for both persons, cooked in batches of the
+    recipes' default portions, with their rollups. Standard meal types must
+    exist.
+    """
+    import models
+    import rollups
+    from routes_recipes import PLACEHOLDER_RECIPES
+
+    rng = random.Random(config.seed)
+    now = datetime.utcnow()
+    today = date.today()
+    dataset = Dataset(first_day=today - timedelta(days=config.days), days=config.days)
+
+    with engine.begin() as conn:
+        meal_types = models.MealTypeModel.__table__
+        dataset.meal_type_ids = list(
+            conn.execute(select(meal_types.c.id).where(meal_types.c.is_standard).order_by(meal_types.c.id)).scalars()
+        )
+        if not dataset.meal_type_ids:
+            raise RuntimeError("No standard meal types, start the app once to create them")
+
+        users_table = models.User.__table__
+        user_id = _next_id(conn, users_table)
+        user_rows = []
+        for i in range(config.users):
+            uid = f"synthetic_{user_id + i}"
+            user_rows.append(
+                {
+                    "id": user_id + i,
+                    "clerk_uid": uid,
+                    "email": f"{uid}@example.com",
+                    "created_at": now,
+                    "updated_at": now,
+                }
+            )
+            dataset.user_uids.append(uid)
+        _insert(conn, users_table, user_rows, dataset)
+
+        tags_table = models.Tag.__table__
+        existing_tags = dict(conn.execute(select(tags_table.c.name, tags_table.c.id)).all())
+        tag_id = _next_id(conn, tags_table)
+        tag_rows = []
+        for i in range(config.tags):
+            name = f"{rng.choice(WORDS)}-{i}"
+            if name not in existing_tags:
+                existing_tags[name] = tag_id
+                tag_rows.append({"id": tag_id, "name": name})
+                tag_id += 1
+        placeholder_tag = PLACEHOLDER_RECIPES[0]["tags"].lower()
+        if config.placeholders and placeholder_tag not in existing_tags:
+            existing_tags[placeholder_tag] = tag_id
+            tag_rows.append({"id": tag_id, "name": placeholder_tag})
+        _insert(conn, tags_table, tag_rows, dataset)
+        tag_ids = [tid for name, tid in existing_tags.items() if name != placeholder_tag]
+        tag_cum_weights = _zipf_cum_weights(len(tag_ids), config.popularity_skew)
+
+        plans_table = models.MealPlan.__table__
+        plan_id = _next_id(conn, plans_table)
+        plan_rows = []
+        access_rows = []
+        for plan in range(plan_id, plan_id + config.plans):
+            owner = rng.randrange(config.users)
+            plan_rows.append(
+                {
+                    "id": plan,
+                    "name": f"Synthetic plan {plan}",
+                    "created_by_user_id": user_id + owner,
+                    "created_at": now,
+                    "updated_at": now,
+                }
+            )
+            members = min(_poisson(rng, config.members_per_plan), config.users - 1)
+            others = rng.sample([u for u in range(config.users) if u != owner], members)
+            for member, permission in [(owner, models.Permission.OWNER)] + [
+                (u, models.Permission.EDIT if rng.random() < 0.7 else models.Permission.VIEW) for u in others
+            ]:
+                access_rows.append(
+                    {"user_id": user_id + member, "meal_plan_id": plan, "permission": permission, "joined_at": now}
+                )
+            dataset.plan_ids.append(plan)
+            dataset.owners[plan] = dataset.user_uids[owner]
+        _insert(conn, plans_table, plan_rows, dataset)
+        _insert(conn, models.UserMealPlanAccess.__table__, access_rows, dataset)
+
+        recipes_table = models.RecipeDB.__table__
+        recipe_id = _next_id(conn, recipes_table)
+        ingredients_table = models.RecipeIngredient.__table__
+        recipe_rows = []
+        recipe_tag_rows = []
+        ingredient_rows = []
+        slot_rows = []
+        history = [
+            (today - timedelta(days=config.days - offset), meal_type_id, person)
+            for offset in range(config.days)
+            for meal_type_id in dataset.meal_type_ids
+            for person in models.Person
+        ]
+        for plan in dataset.plan_ids:
+            size = config.recipes_per_plan
+            if config.recipe_spread > 0:
+                size = int(rng.lognormvariate(math.log(size), config.recipe_spread))
+            ids = list(range(recipe_id, recipe_id + max(size, 1)))
+            recipe_id += len(ids)
+            dataset.recipe_ids[plan] = ids
+            portions = {rid: rng.choice([2, 4, 4, 4, 6, 8]) for rid in ids}
+            # Popular recipes get cooked far more often than the long tail
+            cum_weights = _zipf_cum_weights(len(ids), config.popularity_skew)
+
+            last_cooked: Dict[int, date] = {}
+            position = 0
+            while position < len(history):
+                if rng.random() > config.fill_rate:
+                    position += 1
+                    continue
+                rid = rng.choices(ids, cum_weights=cum_weights)[0]
+                for plan_date, meal_type_id, person in history[position : position + portions[rid]]:
+                    slot_rows.append(
+                        {
+                            "meal_plan_id": plan,
+                            "plan_date": plan_date,
+                            "meal_type_id": meal_type_id,
+                            "extra_id": None,
+                            "person": person,
+                            "recipe_id": rid,
+                            "created_at": now,
+                            "updated_at": now,
+                        }
+                    )
+                    last_cooked[rid] = plan_date
+                position += portions[rid]
+
+            for rid in ids:
+                recipe_rows.append(
+                    {
+                        "id": rid,
+                        "meal_plan_id": plan,
+                        "name": f"{rng.choice(WORDS).capitalize()} med {rng.choice(WORDS)} {rid}",
+                        "link": f"https://example.com/recept/{rid}",
+                        "is_placeholder": False,
+                        "default_portions": portions[rid],
+                        "is_test_recipe": False,
+                        "is_deleted": rng.random() < config.deleted_rate,
+                        "last_cooked_date": last_cooked.get(rid),
+                        "vote_count": int(rng.paretovariate(config.vote_skew)) - 1,
+                        "created_at": now,
+                        "updated_at": now,
+                    }
+                )
+                tag_count = min(_poisson(rng, config.tags_per_recipe), config.max_tags_per_recipe, len(tag_ids))
+                for tid in {rng.choices(tag_ids, cum_weights=tag_cum_weights)[0] for _ in range(tag_count)}:
+                    recipe_tag_rows.append({"recipe_id": rid, "tag_id": tid})
+                for line in range(_poisson(rng, config.ingredients_per_recipe)):
+                    name, unit = rng.choice(INGREDIENTS)
+                    ingredient_rows.append(
+                        {
+                            "recipe_id": rid,
+                            "position": line,
+                            "name": name,
+                            "quantity": rng.choice([0.5, 1, 2, 3, 4, 250, 400, 500]),
+                            "unit": unit,
+                        }
+                    )
+
+            if config.placeholders:
+                for placeholder in PLACEHOLDER_RECIPES:
+                    recipe_rows.append(
+                        {
+                            "id": recipe_id,
+                            "meal_plan_id": plan,
+                            "name": placeholder["name"],
+                            "link": None,
+                            "is_placeholder": True,
+                            "default_portions": 1,
+                            "is_test_recipe": False,
+                            "is_deleted": False,
+                            "last_cooked_date": None,
+                            "vote_count": 0,
+                            "created_at": now,
+                            "updated_at": now,
+                        }
+                    )
+                    recipe_tag_rows.append({"recipe_id": recipe_id, "tag_id": existing_tags[placeholder_tag]})
+                    recipe_id += 1
+
+        _insert(conn, recipes_table, recipe_rows, dataset)
+        _insert(conn, models.recipe_tags, recipe_tag_rows, dataset)
+        _insert(conn, ingredients_table, ingredient_rows, dataset)
+        _insert(conn, models.PlanSlotDB.__table__, slot_rows, dataset)
+        for i in range(0, len(dataset.plan_ids), 50):
+            rollups.rebuild(conn, dataset.plan_ids[i : i + 50])
+
+    return dataset
+
+
+def main() -> int:
+    defaults = SyntheticConfig()
+    parser = argparse.ArgumentParser(description="Generate a synthetic Matplanerare dataset with bulk inserts.")
+    parser.add_argument("--database-url", help="Target database (default: MATBURK_DATABASE_URL or the app default)")
+    parser.add_argument("--users", type=int, default=defaults.users)
+    parser.add_argument("--plans", type=int, default=defaults.plans)
+    parser.add_argument("--recipes", type=int, default=defaults.recipes_per_plan, help="Median recipes per plan")
+    parser.add_argument("--recipe-spread", type=float, default=defaults.recipe_spread)
+    parser.add_argument("--tags", type=int, default=defaults.tags)
+    parser.add_argument("--tags-per-recipe", type=float, default=defaults.tags_per_recipe)
+    parser.add_argument("--max-tags-per-recipe", type=int, default=defaults.max_tags_per_recipe)
+    parser.add_argument("--ingredients-per-recipe", type=float, default=defaults.ingredients_per_recipe)
+    parser.add_argument("--days", type=int, default=defaults.days, help="Days of slot history per plan")
+    parser.add_argument("--fill-rate", type=float, default=defaults.fill_rate)
+    parser.add_argument("--members", type=float, default=defaults.members_per_plan, help="Mean extra members per plan")
+    parser.add_argument("--popularity-skew", type=float, default=defaults.popularity_skew)
+    parser.add_argument("--vote-skew", type=float, default=defaults.vote_skew)
+    parser.add_argument("--deleted-rate", type=float, default=defaults.deleted_rate)
+    parser.add_argument("--no-placeholders", action="store_true")
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+    args = parser.parse_args()
+
+    # The app modules read their configuration at import time; no tokens are
+    # verified here, so any Clerk key will do
+    if args.database_url:
+        os.environ["MATBURK_DATABASE_URL"] = args.database_url
+        os.environ["MATBURK_DATABASE_TYPE"] = "sqlite" if args.database_url.startswith("sqlite") else "postgresql"
+    os.environ.setdefault("CLERK_PUBLIC_KEY_BASE64", "dW51c2Vk")
+
+    import models
+    from database import SessionLocal, engine
+    from routes_recipes import _initialize_meal_types_for_plan
+
+    models.Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        _initialize_meal_types_for_plan(db)
+    finally:
+        db.close()
+
+    config = SyntheticConfig(
+        users=args.users,
+        plans=args.plans,
+        recipes_per_plan=args.recipes,
+        recipe_spread=args.recipe_spread,
+        tags=args.tags,
+        tags_per_recipe=args.tags_per_recipe,
+        max_tags_per_recipe=args.max_tags_per_recipe,
+        ingredients_per_recipe=args.ingredients_per_recipe,
+        days=args.days,
+        fill_rate=args.fill_rate,
+        members_per_plan=args.members,
+        popularity_skew=args.popularity_skew,
+        vote_skew=args.vote_skew,
+        deleted_rate=args.deleted_rate,
+        placeholders=not args.no_placeholders,
+        seed=args.seed,
+    )
+    started = time.perf_counter()
+    dataset = populate(engine, config)
+    elapsed = time.perf_counter() - started
+
+    print(f"Wrote to {engine.url.render_as_string(hide_password=True)} in {elapsed:.1f}s:")
+    for table, count in dataset.rows.items():
+        print(f"  {table:<24} {count:>10}")
+    print(f"Plans {dataset.plan_ids[0]}-{dataset.plan_ids[-1]}" if dataset.plan_ids else "No plans")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,187 @@
+"""In-process caches for derived meal plan data.
+
+Every meal plan has a version counter, `meal_plans.version`, that is bumped
+after each write to the plan (slots, recipes, settings, ...). Derived results
+such as shopping lists are cached under a key that includes the version, so a
+write makes the old entries unreachable and they simply age out of the LRU.
+The version lives in the database, so ETags built from it hold across
+workers and restarts. Each worker keeps the versions it has read and drops a
+plan's when the "plan" invalidation reaches it, so a cache hit costs no query
+and another worker sees a write after up to one poll interval of the bus.
+
+Slot ranges are cached per ISO week instead, under a version of their own
+that only slot writes bump (`bump_plan_weeks`), so voting or editing recipes
+keeps the cached weeks. Week versions are per process and reach the other
+workers through the invalidation bus, so their cached weeks can lag a write
+by up to one poll interval of the bus.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, timedelta
+from typing import Any, Callable, Dict, Hashable, Iterable, Optional, Tuple
+
+from sqlalchemy import select, update
+
+import database
+import invalidation
+import models
+
+_plans = models.MealPlan.__table__
+
+_lock = threading.Lock()
+# plan id -> version last read from meal_plans
+_plan_versions: Dict[int, int] = {}
+# Counts dropped versions, so a read that raced a drop is not kept
+_plan_drops = 0
+# (plan id, Monday) -> version of the week's slots; (plan id, None) covers all weeks
+_week_versions: Dict[Tuple[int, Optional[date]], int] = {}
+_caches: Dict[str, "LRUCache"] = {}
+
+
+def plan_version(meal_plan_id: int) -> int:
+    """Get the current version of a meal plan (0 if it does not exist)."""
+    with _lock:
+        version = _plan_versions.get(meal_plan_id)
+        drops = _plan_drops
+    if version is not None:
+        return version
+    with database.engine.connect() as conn:
+        version = conn.execute(select(_plans.c.version).where(_plans.c.id == meal_plan_id)).scalar() or 0
+    with _lock:
+        if _plan_drops == drops:
+            _plan_versions[meal_plan_id] = version
+    return version
+
+
+def bump_plan_version(meal_plan_id: int) -> int:
+    """Mark a meal plan as changed and return its new version.
+
+    Call after the write has been committed, so no worker caches the old rows
+    under the new version.
+    """
+    with database.engine.begin() as conn:
+        version = conn.execute(
+            update(_plans)
+            .where(_plans.c.id == meal_plan_id)
+            .values(version=_plans.c.version + 1)
+            .returning(_plans.c.version)
+        ).scalar()
+    invalidation.publish("plan", meal_plan_id)
+    return version or 0
+
+
+def _drop_local(key: str) -> None:
+    global _plan_drops
+    with _lock:
+        _plan_drops += 1
+        _plan_versions.pop(int(key), None)
+
+
+def week_of(day: date) -> date:
+    """Monday of the ISO week containing `day`."""
+    return day - timedelta(days=day.weekday())
+
+
+def week_version(meal_plan_id: int, monday: date) -> Tuple[int, int]:
+    """Get the current version of the slots of one week of a meal plan."""
+    return _week_versions.get((meal_plan_id, None), 0), _week_versions.get((meal_plan_id, monday), 0)
+
+
+def bump_plan_weeks(meal_plan_id: int, days: Optional[Iterable[date]] = None) -> None:
+    """Mark the slots of the weeks containing `days` as changed (in all workers).
+
+    Without `days` every week of the plan is marked.
+    """
+    if days is None:
+        invalidation.publish("plan_weeks", meal_plan_id)
+        return
+    for monday in sorted({week_of(day) for day in days}):
+        invalidation.publish("plan_weeks", f"{meal_plan_id}:{monday.isoformat()}")
+
+
+def _bump_week_local(key: str) -> None:
+    plan_id, _, monday = key.partition(":")
+    version_key = (int(plan_id), date.fromisoformat(monday) if monday else None)
+    with _lock:
+        _week_versions[version_key] = _week_versions.get(version_key, 0) + 1
+
+
+class LRUCache:
+    """Small thread-safe LRU cache with hit/miss counters.
+
+    Entries optionally expire after `ttl` seconds.
+    """
+
+    def __init__(self, name: str, maxsize: int = 256, ttl: Optional[float] = None):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Hashable, Tuple[Any, Optional[float]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Return the cached value for `key`, or None on a miss."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and (entry[1] is None or entry[1] > time.monotonic()):
+                self._data.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                del self._data[key]
+            self.misses += 1
+            return None
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        """Store a value, evicting the least recently used entry when full."""
+        ttl = ttl if ttl is not None else self.ttl
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ttl if ttl is not None else None)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def discard(self, predicate: Callable[[Hashable], bool]) -> None:
+        """Drop the entries whose key matches `predicate`."""
+        with self._lock:
+            for key in [key for key in self._data if predicate(key)]:
+                del self._data[key]
+
+    def clear(self) -> None:
+        """Drop all entries."""
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+def get_cache(name: str, maxsize: int = 256, ttl: Optional[float] = None) -> LRUCache:
+    """Get or create the named cache."""
+    with _lock:
+        if name not in _caches:
+            _caches[name] = LRUCache(name, maxsize, ttl)
+        return _caches[name]
+
+
+def all_caches() -> Dict[str, LRUCache]:
+    """Get all named caches, e.g. for reporting hit ratios."""
+    return dict(_caches)
+
+
+def _reset() -> None:
+    global _plan_drops
+    with _lock:
+        _plan_drops += 1
+        _plan_versions.clear()
+    for lru in all_caches().values():
+        lru.clear()
+
+
+invalidation.subscribe("plan", _drop_local)
+invalidation.subscribe("plan_weeks", _bump_week_local)
+invalidation.on_reset(_reset)
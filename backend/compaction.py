@@ -0,0 +1,289 @@
+"""Compaction of dead and old rows.
+
+Deleting a recipe only flags it and clearing a slot leaves an empty row, so
+both tables keep growing. The compaction job, in batches of short
+transactions:
+
+- purges recipes deleted more than `MATBURK_COMPACTION_PURGE_AFTER_DAYS`
+  ago that no live or archived slot refers to, with their tags, ingredients,
+  batches and pending votes
+- deletes slots that have been empty for a day
+- moves slots dated more than `MATBURK_COMPACTION_ARCHIVE_AFTER_DAYS` ago to
+  `plan_slots_archive`; meal counts come from the rollups (rollups.py), date
+  ranges that old are read from the archive, and setting such a slot again
+  moves it back
+- deletes the stored responses of expired idempotency keys
+- runs VACUUM and ANALYZE
+
+With `MATBURK_COMPACTION_WINDOW=HH:MM-HH:MM` (server local time) every worker
+checks once a minute and the first one to claim the night's
+`compaction_runs` row runs the job.
+
+Usage (from backend/), runs right away:
+  python compaction.py [--no-vacuum]
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import delete, exists, insert, literal, select, text, update
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.types import DateTime
+
+import cache
+import models
+
+PURGE_AFTER_DAYS = int(os.getenv("MATBURK_COMPACTION_PURGE_AFTER_DAYS", "30"))
+ARCHIVE_AFTER_DAYS = int(os.getenv("MATBURK_COMPACTION_ARCHIVE_AFTER_DAYS", "730"))
+WINDOW = os.getenv("MATBURK_COMPACTION_WINDOW", "")
+BATCH_SIZE = int(os.getenv("MATBURK_COMPACTION_BATCH_SIZE", "500"))
+# Pause between batches so requests get the write lock in between
+PAUSE_SECONDS = 0.05
+# Cleared slots are kept this long, in case the client is still editing them
+EMPTY_SLOT_GRACE = timedelta(days=1)
+
+logger = logging.getLogger(__name__)
+
+_recipes = models.RecipeDB.__table__
+_slots = models.PlanSlotDB.__table__
+_archive = models.PlanSlotArchive.__table__
+_runs = models.CompactionRun.__table__
+_idempotency_keys = models.IdempotencyKey.__table__
+
+
+def archive_cutoff() -> date:
+    """Slots dated before this are moved to the archive."""
+    return date.today() - timedelta(days=ARCHIVE_AFTER_DAYS)
+
+
+def purge_deleted_recipes(engine: Engine, batch_size: int = BATCH_SIZE) -> Tuple[int, Set[int]]:
+    """Hard-delete unreferenced soft-deleted recipes; returns count and plan ids."""
+    cutoff = datetime.utcnow() - timedelta(days=PURGE_AFTER_DAYS)
+    referenced_by_slot = exists().where(
+        _slots.c.meal_plan_id == _recipes.c.meal_plan_id, _slots.c.recipe_id == _recipes.c.id
+    )
+    referenced_by_archive = exists().where(_archive.c.recipe_id == _recipes.c.id)
+    query = (
+        select(_recipes.c.id, _recipes.c.meal_plan_id)
+        .where(
+            _recipes.c.is_deleted,
+            _recipes.c.updated_at < cutoff,
+            ~referenced_by_slot,
+            ~referenced_by_archive,
+        )
+        .limit(batch_size)
+    )
+
+    total, plan_ids = 0, set()
+    while True:
+        with engine.begin() as conn:
+            rows = conn.execute(query).all()
+            if not rows:
+                return total, plan_ids
+            ids = [recipe_id for recipe_id, _ in rows]
+            # Foreign key cascades are not enforced on SQLite
+            conn.execute(delete(models.recipe_tags).where(models.recipe_tags.c.recipe_id.in_(ids)))
+            conn.execute(delete(models.RecipeIngredient).where(models.RecipeIngredient.recipe_id.in_(ids)))
+            conn.execute(delete(models.PlanBatch).where(models.PlanBatch.recipe_id.in_(ids)))
+            conn.execute(delete(models.RecipeMonthStats).where(models.RecipeMonthStats.recipe_id.in_(ids)))
+            conn.execute(delete(models.RecipeVote).where(models.RecipeVote.recipe_id.in_(ids)))
+            conn.execute(delete(_recipes).where(_recipes.c.id.in_(ids)))
+        total += len(ids)
+        plan_ids.update(plan_id for _, plan_id in rows)
+        time.sleep(PAUSE_SECONDS)
+
+
+def delete_empty_slots(engine: Engine, batch_size: int = BATCH_SIZE) -> Tuple[int, Set[int]]:
+    """Delete slots cleared more than a day ago; returns count and plan ids."""
+    query = (
+        select(_slots.c.id, _slots.c.meal_plan_id)
+        .where(_slots.c.recipe_id.is_(None), _slots.c.updated_at < datetime.utcnow() - EMPTY_SLOT_GRACE)
+        .limit(batch_size)
+    )
+
+    total, plan_ids = 0, set()
+    while True:
+        with engine.begin() as conn:
+            rows = conn.execute(query).all()
+            if not rows:
+                return total, plan_ids
+            # Re-check emptiness in case a slot was filled since the select
+            conn.execute(
+                delete(_slots).where(_slots.c.id.in_([slot_id for slot_id, _ in rows]), _slots.c.recipe_id.is_(None))
+            )
+        total += len(rows)
+        plan_ids.update(plan_id for _, plan_id in rows)
+        time.sleep(PAUSE_SECONDS)
+
+
+def archive_old_slots(engine: Engine, batch_size: int = BATCH_SIZE) -> Tuple[int, Set[int]]:
+    """Move slots older than the horizon to the archive; returns count and plan ids."""
+    # Slot ids get reused on SQLite, the archive numbers its rows itself
+    columns = [
+        "meal_plan_id",
+        "plan_date",
+        "meal_type_id",
+        "extra_id",
+        "person",
+        "recipe_id",
+        "version",
+        "created_at",
+        "updated_at",
+    ]
+    query = select(_slots.c.id, _slots.c.meal_plan_id).where(_slots.c.plan_date < archive_cutoff()).limit(batch_size)
+
+    total, plan_ids = 0, set()
+    while True:
+        with engine.begin() as conn:
+            rows = conn.execute(query).all()
+            if not rows:
+                return total, plan_ids
+            ids = [slot_id for slot_id, _ in rows]
+            conn.execute(
+                insert(_archive).from_select(
+                    columns + ["archived_at"],
+                    select(*[_slots.c[name] for name in columns], literal(datetime.utcnow(), DateTime)).where(
+                        _slots.c.id.in_(ids), _slots.c.recipe_id.isnot(None)
+                    ),
+                )
+            )
+            conn.execute(delete(_slots).where(_slots.c.id.in_(ids)))
+        total += len(ids)
+        plan_ids.update(plan_id for _, plan_id in rows)
+        time.sleep(PAUSE_SECONDS)
+
+
+def delete_expired_idempotency_keys(engine: Engine, batch_size: int = BATCH_SIZE) -> Tuple[int, Set[int]]:
+    """Delete stored responses of expired idempotency keys; returns count and no plan ids."""
+    query = select(_idempotency_keys.c.id).where(_idempotency_keys.c.expires_at <= datetime.utcnow()).limit(batch_size)
+
+    total = 0
+    while True:
+        with engine.begin() as conn:
+            ids = conn.execute(query).scalars().all()
+            if not ids:
+                return total, set()
+            conn.execute(delete(_idempotency_keys).where(_idempotency_keys.c.id.in_(ids)))
+        total += len(ids)
+        time.sleep(PAUSE_SECONDS)
+
+
+def vacuum(engine: Engine) -> None:
+    """Reclaim space and refresh planner statistics."""
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        if engine.dialect.name == "postgresql":
+            for table in ("recipes", "recipe_tags", "recipe_ingredients", "plan_slots", "plan_slots_archive"):
+                conn.execute(text(f"VACUUM (ANALYZE) {table}"))
+        else:
+            conn.execute(text("VACUUM"))
+            conn.execute(text("ANALYZE"))
+
+
+def run(engine: Engine, vacuum_tables: bool = True) -> Dict[str, int]:
+    """Run every compaction step once; returns the row counts."""
+    summary = {}
+    plan_ids: Set[int] = set()
+    for name, step in [
+        ("purged_recipes", purge_deleted_recipes),
+        ("deleted_empty_slots", delete_empty_slots),
+        ("archived_slots", archive_old_slots),
+        ("expired_idempotency_keys", delete_expired_idempotency_keys),
+    ]:
+        summary[name], touched = step(engine)
+        plan_ids |= touched
+        logger.info("Compaction: %s %d", name, summary[name])
+
+    # Responses stay equivalent, but cached copies still hold the old rows
+    for plan_id in plan_ids:
+        cache.bump_plan_version(plan_id)
+        cache.bump_plan_weeks(plan_id)
+
+    if vacuum_tables:
+        vacuum(engine)
+    return summary
+
+
+def _parse_window(window: str) -> Tuple[int, int]:
+    """Start and end of `HH:MM-HH:MM` as minutes after midnight."""
+    start, end = window.split("-")
+    return tuple(int(part[:2]) * 60 + int(part[3:5]) for part in (start.strip(), end.strip()))
+
+
+def _window_date(now: datetime, window: Tuple[int, int]) -> Optional[date]:
+    """The date the window containing `now` started on, or None outside it."""
+    start, end = window
+    minute = now.hour * 60 + now.minute
+    if start <= end:
+        return now.date() if start <= minute < end else None
+    if minute >= start:
+        return now.date()
+    if minute < end:
+        return now.date() - timedelta(days=1)
+    return None
+
+
+def _claim(engine: Engine, run_date: date) -> Optional[int]:
+    """Record the run for `run_date`, unless another worker already did."""
+    try:
+        with engine.begin() as conn:
+            result = conn.execute(insert(_runs).values(run_date=run_date, started_at=datetime.utcnow()))
+    except IntegrityError:
+        return None
+    return result.inserted_primary_key[0]
+
+
+def _schedule(engine: Engine, window: Tuple[int, int]) -> None:
+    claimed: List[date] = []
+    while True:
+        time.sleep(60)
+        run_date = _window_date(datetime.now(), window)
+        if run_date is None or run_date in claimed:
+            continue
+        claimed[:] = [run_date]
+        run_id = _claim(engine, run_date)
+        if run_id is None:
+            continue
+        try:
+            summary = run(engine)
+        except Exception:  # noqa: BLE001 - try again in the next window
+            logger.exception("Compaction failed")
+            continue
+        with engine.begin() as conn:
+            conn.execute(
+                update(_runs)
+                .where(_runs.c.id == run_id)
+                .values(finished_at=datetime.utcnow(), summary=json.dumps(summary))
+            )
+
+
+def start(engine: Engine) -> None:
+    """Run the job in the configured window, if any."""
+    if not WINDOW:
+        return
+    window = _parse_window(WINDOW)
+    threading.Thread(target=_schedule, args=(engine, window), name="compaction", daemon=True).start()
+    logger.info("Compaction window: %s", WINDOW)
+
+
+def main() -> int:
+    import argparse
+
+    from database import engine
+
+    parser = argparse.ArgumentParser(description="Purge deleted recipes, drop empty slots and archive old ones")
+    parser.add_argument("--no-vacuum", action="store_true", help="Skip VACUUM/ANALYZE")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+
+    print(json.dumps(run(engine, vacuum_tables=not args.no_vacuum)))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
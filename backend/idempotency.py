@@ -0,0 +1,134 @@
+"""Idempotency keys and version preconditions for plan writes.
+
+A write sent with an `Idempotency-Key` header stores its response under the
+key in the write's own transaction. A retry with the same key (after a
+timeout, say) gets the stored response back without writing again, for
+`MATBURK_IDEMPOTENCY_TTL_HOURS` (default 24); compaction deletes expired
+keys. Two requests racing with one key both write, but only one commits:
+the other fails the unique key, rolls back and replays the first (`commit`).
+
+Recipes and slots carry a version that every change bumps. With an
+`If-Match` header the write only happens if the row still has that version,
+otherwise 412; without it the last write wins as before.
+"""
+
+import json
+import os
+from datetime import datetime, timedelta
+from typing import Any, Optional
+
+from fastapi import HTTPException, Request, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+import models
+
+TTL = timedelta(hours=float(os.getenv("MATBURK_IDEMPOTENCY_TTL_HOURS", "24")))
+MAX_KEY_LENGTH = 255
+
+_keys = models.IdempotencyKey.__table__
+
+
+def _describe(request: Request) -> str:
+    return f"{request.method} {request.url.path}"
+
+
+def replay(db: Session, user_id: int, key: Optional[str], request: Request) -> Optional[JSONResponse]:
+    """The stored response of an earlier request with this key, if any."""
+    if key is None:
+        return None
+    if not 0 < len(key) <= MAX_KEY_LENGTH:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Idempotency-Key must be 1 to {MAX_KEY_LENGTH} characters",
+        )
+    stored = db.execute(
+        select(_keys.c.request, _keys.c.status_code, _keys.c.response).where(
+            _keys.c.user_id == user_id, _keys.c.key == key, _keys.c.expires_at > datetime.utcnow()
+        )
+    ).first()
+    if stored is None:
+        return None
+    if stored.request != _describe(request):
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Idempotency-Key was already used for another request",
+        )
+    return JSONResponse(
+        json.loads(stored.response), status_code=stored.status_code, headers={"Idempotent-Replayed": "true"}
+    )
+
+
+def save(db: Session, user_id: int, key: Optional[str], request: Request, response: Any) -> None:
+    """Store the response of a write in its transaction; the caller commits."""
+    if key is None:
+        return
+    now = datetime.utcnow()
+    # An expired key not yet deleted by compaction is free again
+    db.execute(delete(_keys).where(_keys.c.user_id == user_id, _keys.c.key == key, _keys.c.expires_at <= now))
+    db.execute(
+        insert(_keys).values(
+            user_id=user_id,
+            key=key,
+            request=_describe(request),
+            status_code=status.HTTP_200_OK,
+            response=json.dumps(jsonable_encoder(response)),
+            created_at=now,
+            expires_at=now + TTL,
+        )
+    )
+
+
+def commit(db: Session, user_id: int, key: Optional[str], request: Request) -> Optional[JSONResponse]:
+    """Commit the write; if a concurrent retry with the key won, its response."""
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        replayed = replay(db, user_id, key, request)
+        if replayed is None:
+            raise
+        return replayed
+    return None
+
+
+def parse_if_match(if_match: Optional[str]) -> Optional[int]:
+    """The version of an If-Match header (`3`, `"3"` or `W/"3"`); None without one or for `*`."""
+    if if_match is None or if_match.strip() == "*":
+        return None
+    value = if_match.strip().removeprefix("W/").strip('"')
+    if not value.isdigit():
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="If-Match must be a version number",
+        )
+    return int(value)
+
+
+def _changed() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_412_PRECONDITION_FAILED,
+        detail="Changed by someone else since it was loaded",
+    )
+
+
+def check_version(current: int, expected: Optional[int]) -> None:
+    """Raise 412 if an If-Match version was given and is not `current`."""
+    if expected is not None and expected != current:
+        raise _changed()
+
+
+def bump_version(db: Session, model, row_id: int, expected: Optional[int]) -> None:
+    """Increment a row's version, or raise 412 if it is no longer `expected`.
+
+    The check and the increment are one statement, so of two writers with
+    the same version only one gets through. Updates the loaded row too.
+    """
+    query = update(model).where(model.id == row_id)
+    if expected is not None:
+        query = query.where(model.version == expected)
+    if db.execute(query.values(version=model.version + 1)).rowcount == 0:
+        raise _changed()
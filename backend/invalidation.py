@@ -0,0 +1,206 @@
+"""Cache invalidation bus for running several uvicorn workers.
+
+Every worker process keeps its own caches (decoded tokens, permissions, meal
+types, settings, plan and week versions and the responses keyed by them).
+Writes publish a `(topic, key)` event here: handlers subscribed to the topic
+run right away in the writing process and, through the bus, in every other
+worker. Other workers therefore see a write only once the event reaches
+them: right away with `notify`, after up to one poll interval with `table`.
+Plan versions live in the database; the event only makes workers read them
+again.
+
+Backends, chosen with `MATBURK_INVALIDATION_BUS`:
+
+- `local`: no broadcast; the default when `MATBURK_WORKERS` is 1
+- `table`: events are rows in `cache_invalidations`, polled by each worker
+  every `MATBURK_INVALIDATION_POLL_MS`; works on SQLite
+- `notify`: Postgres LISTEN/NOTIFY on a dedicated connection per worker
+- `auto` (default): `local` for one worker, otherwise `notify` on Postgres
+  and `table` on other databases
+
+If a worker loses the bus for longer than events are kept, it resets all
+its caches instead of risking stale entries.
+"""
+
+import json
+import logging
+import os
+import secrets
+import select
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import delete, func, insert, select as sql_select, text
+
+WORKERS = os.getenv("MATBURK_WORKERS", "1")
+BUS = os.getenv("MATBURK_INVALIDATION_BUS", "auto")
+POLL_SECONDS = float(os.getenv("MATBURK_INVALIDATION_POLL_MS", "250")) / 1000
+# How long events stay in the table backend
+RETENTION = timedelta(minutes=10)
+CHANNEL = "matburk_invalidation"
+
+# Identifies this process so it skips its own events
+ORIGIN = f"{os.getpid()}-{secrets.token_hex(4)}"
+
+logger = logging.getLogger(__name__)
+
+# topic -> [(handler, remote_only)]
+_handlers: Dict[str, List[Tuple[Callable[[str], None], bool]]] = {}
+_reset_handlers: List[Callable[[], None]] = []
+_backend: Optional["_Backend"] = None
+
+
+def subscribe(topic: str, handler: Callable[[str], None], remote_only: bool = False) -> None:
+    """Call `handler(key)` whenever an event for `topic` is published.
+
+    With `remote_only` the handler only runs for events from other workers,
+    for state the writing worker already updated itself.
+    """
+    _handlers.setdefault(topic, []).append((handler, remote_only))
+
+
+def on_reset(handler: Callable[[], None]) -> None:
+    """Call `handler()` when events may have been missed and caches must go."""
+    _reset_handlers.append(handler)
+
+
+def publish(topic: str, key) -> None:
+    """Apply an invalidation locally and broadcast it to the other workers.
+
+    Call after the write has been committed.
+    """
+    _dispatch(topic, str(key), remote=False)
+    if _backend is not None:
+        try:
+            _backend.publish(topic, str(key))
+        except Exception:  # noqa: BLE001 - the write itself already succeeded
+            logger.exception("Failed to publish invalidation %s:%s", topic, key)
+
+
+def _dispatch(topic: str, key: str, remote: bool = True) -> None:
+    for handler, remote_only in _handlers.get(topic, []):
+        if remote or not remote_only:
+            try:
+                handler(key)
+            except Exception:  # noqa: BLE001 - one broken handler must not stop the others
+                logger.exception("Invalidation handler for %s:%s failed", topic, key)
+
+
+def _reset() -> None:
+    logger.warning("Invalidation events may have been missed, resetting caches")
+    for handler in _reset_handlers:
+        handler()
+
+
+class _Backend:
+    def __init__(self, engine):
+        self.engine = engine
+
+    def publish(self, topic: str, key: str) -> None:
+        raise NotImplementedError
+
+    def run(self) -> None:
+        raise NotImplementedError
+
+
+class _TableBackend(_Backend):
+    """Events as rows in `cache_invalidations`, polled by every worker."""
+
+    def __init__(self, engine):
+        super().__init__(engine)
+        import models
+
+        self.table = models.CacheInvalidation.__table__
+        with engine.connect() as conn:
+            self.last_id = conn.execute(sql_select(func.max(self.table.c.id))).scalar() or 0
+
+    def publish(self, topic: str, key: str) -> None:
+        with self.engine.begin() as conn:
+            conn.execute(insert(self.table).values(topic=topic, key=key, origin=ORIGIN, created_at=datetime.utcnow()))
+
+    def run(self) -> None:
+        last_ok = time.monotonic()
+        last_prune = 0.0
+        while True:
+            time.sleep(POLL_SECONDS)
+            try:
+                with self.engine.connect() as conn:
+                    rows = conn.execute(
+                        sql_select(self.table.c.id, self.table.c.topic, self.table.c.key, self.table.c.origin)
+                        .where(self.table.c.id > self.last_id)
+                        .order_by(self.table.c.id)
+                    ).all()
+                    if time.monotonic() - last_prune > 60:
+                        conn.execute(delete(self.table).where(self.table.c.created_at < datetime.utcnow() - RETENTION))
+                        conn.commit()
+                        last_prune = time.monotonic()
+            except Exception:  # noqa: BLE001 - keep polling through outages
+                logger.exception("Polling cache invalidations failed")
+                if time.monotonic() - last_ok > RETENTION.total_seconds():
+                    _reset()
+                    last_ok = time.monotonic()
+                continue
+
+            last_ok = time.monotonic()
+            for event_id, topic, key, origin in rows:
+                self.last_id = event_id
+                if origin != ORIGIN:
+                    _dispatch(topic, key)
+
+
+class _NotifyBackend(_Backend):
+    """Postgres LISTEN/NOTIFY on a dedicated connection."""
+
+    def publish(self, topic: str, key: str) -> None:
+        payload = json.dumps({"origin": ORIGIN, "topic": topic, "key": key})
+        with self.engine.begin() as conn:
+            conn.execute(text("SELECT pg_notify(:channel, :payload)"), {"channel": CHANNEL, "payload": payload})
+
+    def run(self) -> None:
+        while True:
+            try:
+                self._listen()
+            except Exception:  # noqa: BLE001 - reconnect after connection loss
+                logger.exception("Listening for cache invalidations failed")
+            # Notifications sent while disconnected are lost
+            _reset()
+            time.sleep(1)
+
+    def _listen(self) -> None:
+        raw = self.engine.raw_connection()
+        try:
+            connection = raw.driver_connection
+            connection.autocommit = True
+            with connection.cursor() as cursor:
+                cursor.execute(f"LISTEN {CHANNEL}")
+            while True:
+                if select.select([connection], [], [], 5) == ([], [], []):
+                    continue
+                connection.poll()
+                while connection.notifies:
+                    event = json.loads(connection.notifies.pop(0).payload)
+                    if event["origin"] != ORIGIN:
+                        _dispatch(event["topic"], event["key"])
+        finally:
+            raw.invalidate()
+
+
+def start(engine) -> None:
+    """Start broadcasting and receiving events, if more than one worker runs."""
+    global _backend
+    if _backend is not None:
+        return
+
+    bus = BUS
+    if bus == "auto":
+        if WORKERS == "1":
+            return
+        bus = "notify" if engine.dialect.name == "postgresql" else "table"
+    if bus == "local":
+        return
+
+    _backend = _NotifyBackend(engine) if bus == "notify" else _TableBackend(engine)
+    threading.Thread(target=_backend.run, name="cache-invalidation", daemon=True).start()
+    logger.info("Cache invalidation bus: %s", bus)
@@ -0,0 +1,452 @@
+"""Title, image and servings of recipe links.
+
+Recipe sites describe their pages with schema.org `Recipe` JSON-LD and
+OpenGraph tags. `parse` reads both, preferring JSON-LD, so a pasted link can
+fill in the recipe's name, image and portions, and recipes imported with
+only a link can get an image (`backfill_images`).
+
+Results are kept in `link_metadata` per URL for
+`MATBURK_LINK_METADATA_TTL_HOURS` (default 168). A stale entry is
+revalidated with the page's ETag and Last-Modified, so an unchanged page
+costs a 304 instead of a download and a parse. Failed fetches are cached for
+`ERROR_TTL` and keep the last good result, so a dead link is not requested
+on every lookup.
+
+`lookup` fetches the missing and stale URLs of a batch concurrently with
+asyncio, at most `MATBURK_LINK_METADATA_CONCURRENCY` (default 8) at a time,
+each blocking urllib request in a thread of its own pool. Only http(s) links
+to public addresses are fetched, after redirects too, and connections go to
+the addresses that were checked; `MATBURK_LINK_METADATA_ALLOW_PRIVATE=1`
+lifts the address check, e.g. for a local stub server.
+
+Usage (from backend/), gives recipes with a link but no image the link's
+image:
+  python link_metadata.py [--plan PLAN_ID] [--concurrency N]
+"""
+
+import asyncio
+import html
+import http.client
+import ipaddress
+import json
+import logging
+import os
+import re
+import socket
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from html.parser import HTMLParser
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+from urllib.parse import urljoin, urlsplit
+
+from sqlalchemy import bindparam, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+import models
+
+TTL = timedelta(hours=float(os.getenv("MATBURK_LINK_METADATA_TTL_HOURS", "168")))
+ERROR_TTL = timedelta(hours=1)
+CONCURRENCY = int(os.getenv("MATBURK_LINK_METADATA_CONCURRENCY", "8"))
+ALLOW_PRIVATE = os.getenv("MATBURK_LINK_METADATA_ALLOW_PRIVATE", "0") == "1"
+TIMEOUT_SECONDS = 10
+# Enough for the head and the JSON-LD of large recipe pages
+MAX_BYTES = 2 * 1024 * 1024
+MAX_URL_LENGTH = 2048
+MAX_TITLE_LENGTH = 200
+MAX_SERVINGS = 100
+# Rows per upsert, below SQLite's limit of bound parameters
+STORE_BATCH_SIZE = 500
+USER_AGENT = "Matplanerare/1.0 (recipe link preview)"
+
+logger = logging.getLogger(__name__)
+
+_cache = models.LinkMetadata.__table__
+_recipes = models.RecipeDB.__table__
+
+
+@dataclass
+class Metadata:
+    """What a recipe page says about itself; `error` if it could not be read."""
+
+    title: Optional[str] = None
+    image_url: Optional[str] = None
+    servings: Optional[int] = None
+    error: Optional[str] = None
+
+
+class _PageParser(HTMLParser):
+    """Collects the meta tags, the title and the JSON-LD scripts of a page."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.meta: Dict[str, str] = {}
+        self.title = ""
+        self.json_ld: List[str] = []
+        self._in_title = False
+        self._script: Optional[List[str]] = None
+
+    def handle_starttag(self, tag: str, attrs: List[Tuple[str, Optional[str]]]) -> None:
+        attributes = dict(attrs)
+        if tag == "meta":
+            key = (attributes.get("property") or attributes.get("name") or "").lower()
+            content = attributes.get("content")
+            if key and content and key not in self.meta:
+                self.meta[key] = content
+        elif tag == "title":
+            self._in_title = not self.title
+        elif tag == "script" and (attributes.get("type") or "").lower() == "application/ld+json":
+            self._script = []
+
+    def handle_endtag(self, tag: str) -> None:
+        if tag == "title":
+            self._in_title = False
+        elif tag == "script" and self._script is not None:
+            self.json_ld.append("".join(self._script))
+            self._script = None
+
+    def handle_data(self, data: str) -> None:
+        if self._script is not None:
+            self._script.append(data)
+        elif self._in_title:
+            self.title += data
+
+
+def _find_recipe(node: Any) -> Optional[Dict]:
+    """The first schema.org Recipe in a JSON-LD document."""
+    if isinstance(node, list):
+        for item in node:
+            found = _find_recipe(item)
+            if found is not None:
+                return found
+    elif isinstance(node, dict):
+        types = node.get("@type")
+        if types == "Recipe" or (isinstance(types, list) and "Recipe" in types):
+            return node
+        return _find_recipe([node.get("@graph"), node.get("mainEntity")])
+    return None
+
+
+def _first(value: Any) -> Any:
+    if isinstance(value, list):
+        return value[0] if value else None
+    return value
+
+
+def _text(value: Any) -> Optional[str]:
+    if not isinstance(value, str):
+        return None
+    text = " ".join(html.unescape(value).split())
+    return text[:MAX_TITLE_LENGTH] or None
+
+
+def _image(value: Any) -> Optional[str]:
+    value = _first(value)
+    if isinstance(value, dict):
+        value = value.get("url") or value.get("contentUrl")
+    return value.strip() if isinstance(value, str) and value.strip() else None
+
+
+def _servings(value: Any) -> Optional[int]:
+    """The number of a recipeYield such as `4`, `"4 portioner"` or `["4", "4 servings"]`."""
+    value = _first(value)
+    if isinstance(value, bool) or value is None:
+        return None
+    match = re.search(r"\d+", str(value))
+    servings = int(match.group()) if match else 0
+    return servings if 0 < servings <= MAX_SERVINGS else None
+
+
+def parse(page: str, base_url: str) -> Metadata:
+    """Read the title, image and servings of a recipe page."""
+    parser = _PageParser()
+    parser.feed(page)
+    parser.close()
+
+    recipe: Dict = {}
+    for script in parser.json_ld:
+        try:
+            found = _find_recipe(json.loads(script))
+        except ValueError:
+            continue
+        if found is not None:
+            recipe = found
+            break
+
+    title = _text(recipe.get("name")) or _text(parser.meta.get("og:title")) or _text(parser.title)
+    image = (
+        _image(recipe.get("image"))
+        or _image(parser.meta.get("og:image:secure_url"))
+        or _image(parser.meta.get("og:image"))
+        or _image(parser.meta.get("twitter:image"))
+    )
+    image_url = urljoin(base_url, image) if image else None
+    if image_url is not None and (
+        urlsplit(image_url).scheme not in ("http", "https") or len(image_url) > MAX_URL_LENGTH
+    ):
+        image_url = None
+    return Metadata(title=title, image_url=image_url, servings=_servings(recipe.get("recipeYield")))
+
+
+def _resolve(host: str, port: int) -> List[str]:
+    """Addresses of a host, raising ValueError if any of them is not public."""
+    try:
+        addresses = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    except socket.gaierror:
+        raise ValueError(f"Unknown host {host}") from None
+    resolved = list(dict.fromkeys(sockaddr[0] for *_, sockaddr in addresses))
+    if not ALLOW_PRIVATE:
+        for address in resolved:
+            if not ipaddress.ip_address(address.split("%")[0]).is_global:
+                raise ValueError("Links to private addresses are not read")
+    return resolved
+
+
+def check_url(url: str) -> None:
+    """Raise ValueError unless `url` is an http(s) link to a public address."""
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname or len(url) > MAX_URL_LENGTH:
+        raise ValueError("Only http and https links can be read")
+    if ALLOW_PRIVATE:
+        return
+    _resolve(parts.hostname, parts.port or (443 if parts.scheme == "https" else 80))
+
+
+class _PublicHTTPConnection(http.client.HTTPConnection):
+    """Connects to the addresses it checked itself.
+
+    Checking the URL and then letting the connection resolve the host again
+    would let a DNS answer change in between (DNS rebinding).
+    """
+
+    def connect(self) -> None:
+        error: Optional[OSError] = None
+        for address in _resolve(self.host, self.port):
+            try:
+                self.sock = socket.create_connection((address, self.port), self.timeout, self.source_address)
+                return
+            except OSError as exc:
+                error = exc
+        raise error or OSError(f"No address for {self.host}")
+
+
+class _PublicHTTPSConnection(http.client.HTTPSConnection, _PublicHTTPConnection):
+    """TLS over `_PublicHTTPConnection`; SNI and the certificate check use the host name."""
+
+
+class _PublicHTTPHandler(urllib.request.HTTPHandler):
+    def http_open(self, req):
+        return self.do_open(_PublicHTTPConnection, req)
+
+
+class _PublicHTTPSHandler(urllib.request.HTTPSHandler):
+    def https_open(self, req):
+        return self.do_open(_PublicHTTPSConnection, req, context=self._context)
+
+
+class _CheckedRedirects(urllib.request.HTTPRedirectHandler):
+    max_redirections = 5
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        check_url(newurl)
+        return super().redirect_request(req, fp, code, msg, headers, newurl)
+
+
+# No proxies: the address checks only hold for direct connections
+_opener = urllib.request.build_opener(
+    urllib.request.ProxyHandler({}), _PublicHTTPHandler, _PublicHTTPSHandler, _CheckedRedirects
+)
+
+
+def _decode(body: bytes, charset: Optional[str]) -> str:
+    try:
+        return body.decode(charset or "utf-8", errors="replace")
+    except LookupError:
+        return body.decode("utf-8", errors="replace")
+
+
+def fetch(
+    url: str, etag: Optional[str] = None, last_modified: Optional[str] = None
+) -> Tuple[Optional[Metadata], Optional[str], Optional[str]]:
+    """Request and parse a page, conditionally if validators are given; blocking.
+
+    Returns the metadata (None if the page is unchanged) and the page's ETag
+    and Last-Modified. Raises OSError, ValueError or HTTPException if it
+    cannot be read.
+    """
+    check_url(url)
+    request = urllib.request.Request(url, headers={"User-Agent": USER_AGENT, "Accept": "text/html,*/*;q=0.5"})
+    if etag:
+        request.add_header("If-None-Match", etag)
+    if last_modified:
+        request.add_header("If-Modified-Since", last_modified)
+    try:
+        with _opener.open(request, timeout=TIMEOUT_SECONDS) as response:
+            content_type = response.headers.get_content_type()
+            if content_type not in ("text/html", "application/xhtml+xml"):
+                raise ValueError(f"Not a web page ({content_type})")
+            page = _decode(response.read(MAX_BYTES), response.headers.get_content_charset())
+            metadata = parse(page, response.url)
+            return metadata, response.headers.get("ETag"), response.headers.get("Last-Modified")
+    except urllib.error.HTTPError as error:
+        if error.code != 304:
+            raise
+        return None, error.headers.get("ETag") or etag, error.headers.get("Last-Modified") or last_modified
+
+
+def _error_message(error: Exception) -> str:
+    if isinstance(error, urllib.error.HTTPError):
+        return f"HTTP {error.code}"
+    if isinstance(error, urllib.error.URLError):
+        return str(error.reason)
+    return str(error) or type(error).__name__
+
+
+async def _refresh(url: str, cached: Optional[Dict], executor: ThreadPoolExecutor) -> Dict:
+    """The new cache row of a missing or stale URL."""
+    row = dict(cached) if cached is not None else {"url": url, "title": None, "image_url": None, "servings": None}
+    loop = asyncio.get_running_loop()
+    try:
+        metadata, etag, last_modified = await loop.run_in_executor(
+            executor, fetch, url, row.get("etag"), row.get("last_modified")
+        )
+    except (OSError, ValueError, http.client.HTTPException) as error:
+        message = _error_message(error)[:MAX_TITLE_LENGTH]
+        logger.info("Could not read %s: %s", url, message)
+        now = datetime.utcnow()
+        row.update(error=message, fetched_at=now, expires_at=now + ERROR_TTL)
+        row.setdefault("etag", None)
+        row.setdefault("last_modified", None)
+        return row
+    now = datetime.utcnow()
+    if metadata is not None:
+        row.update(title=metadata.title, image_url=metadata.image_url, servings=metadata.servings)
+    row.update(etag=etag, last_modified=last_modified, error=None, fetched_at=now, expires_at=now + TTL)
+    return row
+
+
+def _store(db: Session, rows: List[Dict]) -> None:
+    dialect_insert = postgresql.insert if db.get_bind().dialect.name == "postgresql" else sqlite.insert
+    for start in range(0, len(rows), STORE_BATCH_SIZE):
+        statement = dialect_insert(_cache).values(rows[start : start + STORE_BATCH_SIZE])
+        db.execute(
+            statement.on_conflict_do_update(
+                index_elements=[_cache.c.url],
+                set_={name: statement.excluded[name] for name in rows[0] if name != "url"},
+            )
+        )
+
+
+async def lookup(db: Session, urls: Iterable[str], concurrency: int = CONCURRENCY) -> Dict[str, Metadata]:
+    """Metadata of each URL, from the cache or fetched concurrently.
+
+    Fetched entries are written in the caller's transaction; the caller
+    commits.
+    """
+    urls = list(dict.fromkeys(urls))
+    if not urls:
+        return {}
+    columns = [column for column in _cache.c if column.name != "id"]
+    entries = {
+        row["url"]: dict(row)
+        for start in range(0, len(urls), STORE_BATCH_SIZE)
+        for row in db.execute(select(*columns).where(_cache.c.url.in_(urls[start : start + STORE_BATCH_SIZE])))
+        .mappings()
+        .all()
+    }
+
+    now = datetime.utcnow()
+    stale = [url for url in urls if url not in entries or entries[url]["expires_at"] <= now]
+    if stale:
+        # Its own threads: the default executor has as few as five
+        with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(stale))), thread_name_prefix="links") as pool:
+            rows = await asyncio.gather(*(_refresh(url, entries.get(url), pool) for url in stale))
+        _store(db, rows)
+        entries.update((row["url"], row) for row in rows)
+
+    return {
+        url: Metadata(
+            title=entry["title"], image_url=entry["image_url"], servings=entry["servings"], error=entry["error"]
+        )
+        for url, entry in entries.items()
+    }
+
+
+async def backfill_images(
+    db: Session, meal_plan_id: Optional[int] = None, concurrency: int = CONCURRENCY
+) -> Tuple[Dict[str, int], Set[int]]:
+    """Give recipes with a link but no image the image of their link.
+
+    Returns the numbers of recipes checked, updated and whose link could not
+    be read, and the plans changed. The caller commits and bumps the plans.
+    """
+    query = select(_recipes.c.id, _recipes.c.meal_plan_id, _recipes.c.link).where(
+        _recipes.c.is_deleted.is_(False),
+        _recipes.c.link.isnot(None),
+        _recipes.c.link != "",
+        _recipes.c.image_url.is_(None),
+        _recipes.c.image_filename.is_(None),
+    )
+    if meal_plan_id is not None:
+        query = query.where(_recipes.c.meal_plan_id == meal_plan_id)
+    recipes = db.execute(query).all()
+
+    found = await lookup(db, (recipe.link.strip() for recipe in recipes), concurrency)
+    changes = [
+        {"recipe_id": recipe.id, "new_image_url": found[recipe.link.strip()].image_url}
+        for recipe in recipes
+        if found[recipe.link.strip()].image_url
+    ]
+    if changes:
+        # Skips recipes that got an image in the meantime
+        db.execute(
+            update(_recipes)
+            .where(
+                _recipes.c.id == bindparam("recipe_id"),
+                _recipes.c.image_url.is_(None),
+                _recipes.c.image_filename.is_(None),
+            )
+            .values(image_url=bindparam("new_image_url"), version=_recipes.c.version + 1),
+            changes,
+        )
+    updated = {change["recipe_id"] for change in changes}
+    summary = {
+        "checked": len(recipes),
+        "updated": len(changes),
+        "failed": sum(1 for recipe in recipes if found[recipe.link.strip()].error is not None),
+    }
+    return summary, {recipe.meal_plan_id for recipe in recipes if recipe.id in updated}
+
+
+def main() -> int:
+    import argparse
+
+    import cache
+    import invalidation
+    from database import SessionLocal, engine
+
+    parser = argparse.ArgumentParser(description="Give recipes with a link but no image the link's image")
+    parser.add_argument("--plan", type=int, help="Only this plan's recipes")
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY, help="Links fetched at a time")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+
+    # Let the app's workers drop their cached recipes
+    invalidation.start(engine)
+    db = SessionLocal()
+    try:
+        summary, plan_ids = asyncio.run(backfill_images(db, args.plan, args.concurrency))
+        db.commit()
+    finally:
+        db.close()
+    for plan_id in plan_ids:
+        cache.bump_plan_version(plan_id)
+    print(json.dumps(summary))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -4,17 +4,31 @@ import os
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
-import models
+import compaction
+import invalidation
+import metrics
+import migrations
+import profiling
+import votes
 from database import engine, SessionLocal
 from routes_auth import router as auth_router
+from routes_autoplan import router as autoplan_router
+from routes_batches import router as batches_router
+from routes_export import router as export_router
+from routes_link_metadata import router as link_metadata_router
 from routes_plans import router as plans_router
+from routes_print import router as print_router
 from routes_recipes import router as recipes_router
+from routes_recommendations import router as recommendations_router
+from routes_shopping import router as shopping_router
+from routes_stats import router as stats_router
 
 # CORS configuration from environment
 ALLOWED_ORIGINS = os.getenv("ALLOWED_ORIGINS", "*").split(",")
 
-# Create database tables
-models.Base.metadata.create_all(bind=engine)
+# Create database tables and bring existing ones up to date (the Docker
+# image migrates before starting the app instead)
+migrations.run(engine)
 
 
 # Initialize standard meal types
@@ -31,6 +45,15 @@ def _initialize_meal_types():
 
 _initialize_meal_types()
 
+# Keep per-process caches coherent when running several workers
+invalidation.start(engine)
+
+# Nightly compaction, if a window is configured
+compaction.start(engine)
+
+# Add buffered votes to the recipes
+votes.start(engine)
+
 app = FastAPI(title="Matplanerare API", description="Recipe planner API")
 
 
@@ -45,6 +68,14 @@ def health_check():
 app.include_router(auth_router)
 app.include_router(plans_router)
 app.include_router(recipes_router)
+app.include_router(batches_router)
+app.include_router(shopping_router)
+app.include_router(print_router)
+app.include_router(recommendations_router)
+app.include_router(autoplan_router)
+app.include_router(stats_router)
+app.include_router(export_router)
+app.include_router(link_metadata_router)
 
 # CORS middleware configuration
 app.add_middleware(
@@ -53,3 +84,9 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+
+# Opt-in request profiling (MATBURK_PROFILING=1)
+profiling.install(app, engine)
+
+# Prometheus-style metrics at /metrics
+metrics.install(app, engine)
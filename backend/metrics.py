@@ -0,0 +1,280 @@
+"""Prometheus-style metrics for Matplanerare API.
+
+Request counts and latency histograms per route, DB pool usage, cache hit
+ratios and registered gauges (streams, background queues) are kept as plain
+in-process counters and rendered in the Prometheus text format at
+`GET /metrics`.
+
+With several uvicorn workers every process only sees its own requests. Set
+`MATBURK_METRICS_DIR` to a directory shared by the workers: each process then
+writes a snapshot of its counters there (every few seconds and on scrape),
+and whichever worker answers the scrape merges all snapshots.
+"""
+
+import bisect
+import glob
+import json
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+import cache
+
+METRICS_DIR = os.getenv("MATBURK_METRICS_DIR")
+SNAPSHOT_INTERVAL_SECONDS = float(os.getenv("MATBURK_METRICS_SNAPSHOT_INTERVAL", "5"))
+# Snapshots of workers that stopped writing are ignored after this long
+SNAPSHOT_MAX_AGE_SECONDS = float(os.getenv("MATBURK_METRICS_SNAPSHOT_MAX_AGE", "300"))
+
+# Help texts of the gauges every process reports
+_BUILTIN_GAUGES = {
+    "matburk_http_requests_in_progress": "HTTP requests being handled",
+    "matburk_active_streams": "Open streaming responses (SSE, NDJSON)",
+    "matburk_db_pool_size": "Configured DB connection pool size",
+    "matburk_db_pool_checked_out": "DB connections in use",
+    "matburk_db_pool_overflow": "DB connections beyond the pool size (negative while below it)",
+}
+
+LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+
+_lock = threading.Lock()
+# (route, method, status) -> count
+_requests: Dict[Tuple[str, str, str], int] = {}
+# route -> [bucket counts..., +Inf count, sum]
+_latency: Dict[str, List[float]] = {}
+_in_progress = 0
+_active_streams = 0
+_gauges: Dict[str, Tuple[str, Callable[[], float]]] = {}
+_engine = None
+_snapshot_thread: Optional[threading.Thread] = None
+
+
+def register_gauge(name: str, help_text: str, read: Callable[[], float]) -> None:
+    """Expose a gauge whose value is read at scrape time, e.g. a queue depth."""
+    _gauges[name] = (help_text, read)
+
+
+def stream_started() -> None:
+    """Count a long-lived streaming response (SSE, NDJSON export) as active."""
+    global _active_streams
+    with _lock:
+        _active_streams += 1
+
+
+def stream_finished() -> None:
+    """Mark a streaming response as finished."""
+    global _active_streams
+    with _lock:
+        _active_streams -= 1
+
+
+def _observe(route: str, method: str, status: int, seconds: float) -> None:
+    with _lock:
+        key = (route, method, str(status))
+        _requests[key] = _requests.get(key, 0) + 1
+        histogram = _latency.get(route)
+        if histogram is None:
+            histogram = _latency[route] = [0.0] * (len(LATENCY_BUCKETS) + 2)
+        histogram[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        histogram[-1] += seconds
+
+
+class MetricsMiddleware:
+    """ASGI middleware counting requests and their latency per route."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        global _in_progress
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        with _lock:
+            _in_progress += 1
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            with _lock:
+                _in_progress -= 1
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            _observe(route, scope["method"], status_code, time.perf_counter() - started)
+
+
+def _local_snapshot() -> dict:
+    """Counters and gauges of this process as a JSON-friendly dict."""
+    with _lock:
+        snapshot = {
+            "requests": [[*key, count] for key, count in _requests.items()],
+            "latency": {route: list(values) for route, values in _latency.items()},
+            "gauges": {
+                "matburk_http_requests_in_progress": _in_progress,
+                "matburk_active_streams": _active_streams,
+            },
+        }
+
+    caches = {}
+    for name, lru in cache.all_caches().items():
+        caches[name] = {"hits": lru.hits, "misses": lru.misses, "size": len(lru)}
+    snapshot["caches"] = caches
+
+    if _engine is not None:
+        pool = _engine.pool
+        for gauge, attribute in [
+            ("matburk_db_pool_size", "size"),
+            ("matburk_db_pool_checked_out", "checkedout"),
+            ("matburk_db_pool_overflow", "overflow"),
+        ]:
+            if hasattr(pool, attribute):
+                snapshot["gauges"][gauge] = getattr(pool, attribute)()
+
+    for name, (_, read) in list(_gauges.items()):
+        try:
+            snapshot["gauges"][name] = float(read())
+        except Exception:  # noqa: BLE001 - a broken gauge must not break scraping
+            continue
+    return snapshot
+
+
+def _write_snapshot() -> None:
+    path = os.path.join(METRICS_DIR, f"metrics-{os.getpid()}.json")
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(_local_snapshot(), f)
+    os.replace(tmp_path, path)
+
+
+def _snapshot_loop() -> None:
+    while True:
+        time.sleep(SNAPSHOT_INTERVAL_SECONDS)
+        try:
+            _write_snapshot()
+        except OSError:
+            continue
+
+
+def _collect() -> List[dict]:
+    """Snapshots of all workers (or just this process without a shared dir)."""
+    if not METRICS_DIR:
+        return [_local_snapshot()]
+
+    try:
+        _write_snapshot()
+    except OSError:
+        return [_local_snapshot()]
+    snapshots = []
+    now = time.time()
+    for path in glob.glob(os.path.join(METRICS_DIR, "metrics-*.json")):
+        try:
+            if now - os.path.getmtime(path) > SNAPSHOT_MAX_AGE_SECONDS:
+                continue
+            with open(path, encoding="utf-8") as f:
+                snapshots.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return snapshots
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def render() -> str:
+    """Render the merged metrics of all workers in Prometheus text format."""
+    requests: Dict[Tuple[str, str, str], float] = {}
+    latency: Dict[str, List[float]] = {}
+    caches: Dict[str, Dict[str, float]] = {}
+    gauges: Dict[str, float] = {}
+
+    for snapshot in _collect():
+        for route, method, status_code, count in snapshot["requests"]:
+            key = (route, method, status_code)
+            requests[key] = requests.get(key, 0) + count
+        for route, values in snapshot["latency"].items():
+            merged = latency.setdefault(route, [0.0] * len(values))
+            for i, value in enumerate(values):
+                merged[i] += value
+        for name, values in snapshot["caches"].items():
+            merged = caches.setdefault(name, {"hits": 0, "misses": 0, "size": 0})
+            for key, value in values.items():
+                merged[key] += value
+        for name, value in snapshot["gauges"].items():
+            gauges[name] = gauges.get(name, 0) + value
+
+    lines = [
+        "# HELP matburk_http_requests_total Handled HTTP requests.",
+        "# TYPE matburk_http_requests_total counter",
+    ]
+    for (route, method, status_code), count in sorted(requests.items()):
+        lines.append(
+            f'matburk_http_requests_total{{route="{_escape(route)}",method="{method}",status="{status_code}"}} {count:g}'
+        )
+
+    lines += [
+        "# HELP matburk_http_request_duration_seconds HTTP request latency.",
+        "# TYPE matburk_http_request_duration_seconds histogram",
+    ]
+    for route, values in sorted(latency.items()):
+        label = f'route="{_escape(route)}"'
+        cumulative = 0.0
+        for bound, count in zip(LATENCY_BUCKETS, values):
+            cumulative += count
+            lines.append(f'matburk_http_request_duration_seconds_bucket{{{label},le="{bound}"}} {cumulative:g}')
+        cumulative += values[len(LATENCY_BUCKETS)]
+        lines.append(f'matburk_http_request_duration_seconds_bucket{{{label},le="+Inf"}} {cumulative:g}')
+        lines.append(f"matburk_http_request_duration_seconds_sum{{{label}}} {values[-1]:.6f}")
+        lines.append(f"matburk_http_request_duration_seconds_count{{{label}}} {cumulative:g}")
+
+    lines += [
+        "# HELP matburk_cache_hits_total Cache lookups that found an entry.",
+        "# TYPE matburk_cache_hits_total counter",
+    ]
+    lines += [f'matburk_cache_hits_total{{cache="{name}"}} {v["hits"]:g}' for name, v in sorted(caches.items())]
+    lines += [
+        "# HELP matburk_cache_misses_total Cache lookups that found no entry.",
+        "# TYPE matburk_cache_misses_total counter",
+    ]
+    lines += [f'matburk_cache_misses_total{{cache="{name}"}} {v["misses"]:g}' for name, v in sorted(caches.items())]
+    lines += [
+        "# HELP matburk_cache_hit_ratio Share of cache lookups that were hits.",
+        "# TYPE matburk_cache_hit_ratio gauge",
+    ]
+    for name, values in sorted(caches.items()):
+        lookups = values["hits"] + values["misses"]
+        ratio = values["hits"] / lookups if lookups else 0.0
+        lines.append(f'matburk_cache_hit_ratio{{cache="{name}"}} {ratio:.4f}')
+
+    for name, value in sorted(gauges.items()):
+        help_text = _gauges[name][0] if name in _gauges else _BUILTIN_GAUGES.get(name, name)
+        lines += [f"# HELP {name} {help_text}.", f"# TYPE {name} gauge", f"{name} {value:g}"]
+
+    return "\n".join(lines) + "\n"
+
+
+def install(app, engine) -> None:
+    """Add the metrics middleware and the `/metrics` endpoint."""
+    global _engine, _snapshot_thread
+    from fastapi.responses import PlainTextResponse
+
+    _engine = engine
+    app.add_middleware(MetricsMiddleware)
+
+    @app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+    def get_metrics() -> str:
+        """Metrics in Prometheus text format (no auth required)."""
+        return render()
+
+    if METRICS_DIR and _snapshot_thread is None:
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        _snapshot_thread = threading.Thread(target=_snapshot_loop, name="metrics-snapshot", daemon=True)
+        _snapshot_thread.start()
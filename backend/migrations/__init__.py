@@ -0,0 +1,315 @@
+"""Schema migrations for Matplanerare.
+
+`create_all` creates missing tables (with their indexes) but never changes
+existing ones. Changes to existing tables are migrations: versioned scripts in
+`migrations/versions/`, named `NNNN_description.py`, that run once per
+database in order and are recorded in `schema_migrations`. A new database
+gets the current schema from `create_all` and is stamped with all versions.
+
+A script defines:
+
+- `upgrade(conn)`: the schema change, run in one transaction. Tables new in
+  the same release already exist through `create_all`, so check first
+  (create indexes with `IF NOT EXISTS`, use `add_column`); that also makes
+  it safe to re-run, since SQLite commits some DDL immediately.
+- optionally `backfill(conn, after, batch_size)`: fills in data for the new
+  schema one batch at a time. It gets the cursor returned by the previous
+  batch (None at first) and returns the next one, or None when done. Each
+  batch runs in its own short transaction together with saving the cursor,
+  so SQLite's write lock is only held briefly and an interrupted backfill
+  resumes where it stopped. `next_ids` covers the usual primary-key walk:
+
+      def backfill(conn, after, batch_size):
+          ids = migrations.next_ids(conn, models.RecipeDB.id, after, batch_size)
+          if not ids:
+              return None
+          conn.execute(update(...).where(models.RecipeDB.id.in_(ids)))
+          return str(ids[-1])
+
+A backfill that changes what cached responses are built from bumps the
+versions of the plans in the batch and publishes their invalidation from
+`after_commit(conn, callback)`, which runs once the batch has committed.
+
+Code must cope with a backfill that has not finished yet (`backfill_state`
+tells how far it got). A migration is only applied once the backfills of all
+earlier ones are complete, so a later script can rely on them (e.g. to add a
+NOT NULL constraint).
+
+Deploy time: `python -m migrations upgrade` (from backend/) applies the
+schema changes and runs the backfills; the Docker image does this before
+starting the workers, and `status` lists the versions. Unless
+`MATBURK_MIGRATE_ON_STARTUP=0`, the app also applies pending migrations,
+backfills included, when it starts, for local runs; the backfills are small
+and resume where an interrupted start left them.
+"""
+
+import importlib.util
+import logging
+import os
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import Column, DateTime, MetaData, String, Table, inspect, insert, select, text, update
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.schema import CreateColumn
+
+VERSIONS_DIR = Path(__file__).parent / "versions"
+MIGRATE_ON_STARTUP = os.getenv("MATBURK_MIGRATE_ON_STARTUP", "1") == "1"
+BATCH_SIZE = int(os.getenv("MATBURK_BACKFILL_BATCH_SIZE", "500"))
+# Pause between backfill batches so requests get the write lock in between
+PAUSE_SECONDS = float(os.getenv("MATBURK_BACKFILL_PAUSE_MS", "50")) / 1000
+# Arbitrary key for the Postgres advisory lock held while migrating
+LOCK_KEY = 0x6D617462
+# Connection info key of the callbacks registered with `after_commit`
+_AFTER_COMMIT = "migrations.after_commit"
+
+logger = logging.getLogger(__name__)
+
+_metadata = MetaData()
+schema_migrations = Table(
+    "schema_migrations",
+    _metadata,
+    Column("version", String, primary_key=True),
+    Column("applied_at", DateTime, nullable=False),
+    # Where the backfill stopped; NULL before its first batch
+    Column("backfill_cursor", String, nullable=True),
+    # NULL while the backfill is pending, set right away without a backfill
+    Column("backfilled_at", DateTime, nullable=True),
+)
+
+
+@dataclass
+class Migration:
+    version: str
+    description: str
+    upgrade: Callable[[Connection], None]
+    backfill: Optional[Callable[[Connection, Optional[str], int], Optional[str]]] = None
+
+
+def discover() -> List[Migration]:
+    """Load the scripts in `versions/`, ordered by version."""
+    found = []
+    for path in sorted(VERSIONS_DIR.glob("[0-9][0-9][0-9][0-9]_*.py")):
+        spec = importlib.util.spec_from_file_location(f"migrations.versions.{path.stem}", path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        found.append(
+            Migration(
+                version=path.stem,
+                description=(module.__doc__ or "").strip().split("\n")[0],
+                upgrade=module.upgrade,
+                backfill=getattr(module, "backfill", None),
+            )
+        )
+    return found
+
+
+def add_column(conn: Connection, table: Table, column: Column) -> None:
+    """`ALTER TABLE ... ADD COLUMN` unless the column is already there.
+
+    `column` is a new, unattached `Column`; give NOT NULL columns a
+    `server_default` so existing rows get a value.
+    """
+    existing = {c["name"] for c in inspect(conn).get_columns(table.name)}
+    if column.name not in existing:
+        table_name = conn.dialect.identifier_preparer.format_table(table)
+        conn.execute(text(f"ALTER TABLE {table_name} ADD COLUMN {CreateColumn(column).compile(dialect=conn.dialect)}"))
+
+
+def next_ids(conn: Connection, id_column, after: Optional[str], batch_size: int) -> List[int]:
+    """The next `batch_size` primary keys after the cursor `after`."""
+    query = select(id_column).order_by(id_column).limit(batch_size)
+    if after is not None:
+        query = query.where(id_column > int(after))
+    return list(conn.execute(query).scalars())
+
+
+def _ensure_table(engine: Engine) -> None:
+    _metadata.create_all(bind=engine)
+    # schema_migrations itself predates the backfill columns
+    with engine.begin() as conn:
+        add_column(conn, schema_migrations, Column("backfill_cursor", String, nullable=True))
+        add_column(conn, schema_migrations, Column("backfilled_at", DateTime, nullable=True))
+
+
+@contextmanager
+def _lock(engine: Engine) -> Iterator[None]:
+    """Keep concurrent deploys from migrating the same Postgres database.
+
+    SQLite needs no lock: recording a version fails with a primary key
+    conflict in the second runner, and upgrades are safe to re-run.
+    """
+    if engine.dialect.name != "postgresql":
+        yield
+        return
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": LOCK_KEY})
+        try:
+            yield
+        finally:
+            conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": LOCK_KEY})
+
+
+def _applied(engine: Engine) -> Dict[str, dict]:
+    with engine.connect() as conn:
+        return {row.version: row._asdict() for row in conn.execute(select(schema_migrations))}
+
+
+def backfill_state(conn: Connection, version: str) -> Tuple[bool, Optional[str]]:
+    """Whether a migration's backfill is done, and its cursor if not.
+
+    Not done (with no cursor) if the migration has not been applied.
+    """
+    row = conn.execute(
+        select(schema_migrations.c.backfilled_at, schema_migrations.c.backfill_cursor).where(
+            schema_migrations.c.version == version
+        )
+    ).first()
+    if row is None:
+        return False, None
+    return row.backfilled_at is not None, row.backfill_cursor
+
+
+def status(engine: Engine) -> List[dict]:
+    """Every known version with its state: pending, backfilling or done."""
+    _ensure_table(engine)
+    applied = _applied(engine)
+    result = []
+    for migration in discover():
+        row = applied.get(migration.version)
+        if row is None:
+            state = "pending"
+        elif migration.backfill and row["backfilled_at"] is None:
+            state = "backfilling"
+        else:
+            state = "done"
+        result.append(
+            {
+                "version": migration.version,
+                "description": migration.description,
+                "state": state,
+                "applied_at": row["applied_at"] if row else None,
+                "backfill_cursor": row["backfill_cursor"] if row else None,
+            }
+        )
+    return result
+
+
+def after_commit(conn: Connection, callback: Callable[[], None]) -> None:
+    """Run `callback` once the backfill batch running on `conn` has committed."""
+    conn.info.setdefault(_AFTER_COMMIT, []).append(callback)
+
+
+def _run_backfill(engine: Engine, migration: Migration, cursor: Optional[str], batch_size: int, pause: float) -> None:
+    logger.info("Backfilling %s from %s", migration.version, cursor or "the start")
+    batches = 0
+    while True:
+        with engine.begin() as conn:
+            conn.info.pop(_AFTER_COMMIT, None)
+            cursor = migration.backfill(conn, cursor, batch_size)
+            values = {"backfill_cursor": cursor}
+            if cursor is None:
+                values["backfilled_at"] = datetime.utcnow()
+            conn.execute(
+                update(schema_migrations).where(schema_migrations.c.version == migration.version).values(**values)
+            )
+            callbacks = conn.info.pop(_AFTER_COMMIT, [])
+        for callback in callbacks:
+            callback()
+        batches += 1
+        if cursor is None:
+            logger.info("Backfilled %s in %d batches", migration.version, batches)
+            return
+        time.sleep(pause)
+
+
+def _apply(engine: Engine, migration: Migration) -> dict:
+    logger.info("Applying migration %s", migration.version)
+    now = datetime.utcnow()
+    row = {
+        "version": migration.version,
+        "applied_at": now,
+        "backfill_cursor": None,
+        "backfilled_at": None if migration.backfill else now,
+    }
+    try:
+        with engine.begin() as conn:
+            migration.upgrade(conn)
+            conn.execute(insert(schema_migrations).values(**row))
+    except IntegrityError:
+        logger.info("Migration %s was applied concurrently", migration.version)
+        return _applied(engine)[migration.version]
+    return row
+
+
+def _stamp(engine: Engine) -> None:
+    """Record every version as applied and backfilled, without running them."""
+    now = datetime.utcnow()
+    with engine.begin() as conn:
+        applied = set(conn.execute(select(schema_migrations.c.version)).scalars())
+        rows = [
+            {"version": m.version, "applied_at": now, "backfill_cursor": None, "backfilled_at": now}
+            for m in discover()
+            if m.version not in applied
+        ]
+        if rows:
+            conn.execute(insert(schema_migrations), rows)
+
+
+def upgrade(engine: Engine, backfill: bool = True, batch_size: int = BATCH_SIZE, pause: float = PAUSE_SECONDS) -> bool:
+    """Apply pending migrations in order, running backfills if `backfill`.
+
+    Creates missing tables first; a new database gets the current schema
+    from `create_all` and is only stamped with all versions.
+
+    Returns True when everything is applied and backfilled. Without
+    `backfill`, stops before the first migration that would have to wait
+    for an earlier backfill.
+    """
+    import models
+
+    new_database = not inspect(engine).has_table(models.MealPlan.__tablename__)
+    models.Base.metadata.create_all(bind=engine)
+    _ensure_table(engine)
+    with _lock(engine):
+        if new_database:
+            _stamp(engine)
+        applied = _applied(engine)
+        for migration in discover():
+            row = applied.get(migration.version)
+            if row is None:
+                # Earlier backfills are complete at this point
+                row = _apply(engine, migration)
+
+            if migration.backfill and row["backfilled_at"] is None:
+                if not backfill:
+                    logger.warning("Backfill of %s pending, run `python -m migrations upgrade`", migration.version)
+                    return False
+                _run_backfill(engine, migration, row["backfill_cursor"], batch_size, pause)
+    return True
+
+
+def run(engine: Engine) -> None:
+    """Create tables and apply pending migrations on app startup.
+
+    With `MATBURK_MIGRATE_ON_STARTUP=0` only missing tables are created, and
+    the app refuses to start while a migration has not been applied: the
+    models would not match the database.
+    """
+    if MIGRATE_ON_STARTUP:
+        upgrade(engine)
+        return
+
+    import models
+
+    models.Base.metadata.create_all(bind=engine)
+    pending = [row["version"] for row in status(engine) if row["state"] == "pending"]
+    if pending:
+        raise RuntimeError(
+            f"Database schema is behind ({', '.join(pending)} not applied); run `python -m migrations upgrade`"
+        )
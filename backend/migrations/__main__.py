@@ -0,0 +1,53 @@
+"""Run schema migrations at deploy time.
+
+Usage (from backend/):
+  python -m migrations status
+  python -m migrations upgrade [--no-backfill] [--batch-size N] [--pause-ms MS]
+"""
+
+import argparse
+import logging
+import sys
+
+from sqlalchemy import inspect
+
+import invalidation
+import migrations
+import models
+from database import engine
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(prog="python -m migrations", description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("status", help="List migrations and their state")
+    upgrade = commands.add_parser("upgrade", help="Apply pending migrations and run their backfills")
+    upgrade.add_argument("--no-backfill", action="store_true", help="Stop before the first pending backfill")
+    upgrade.add_argument("--batch-size", type=int, default=migrations.BATCH_SIZE, help="Rows per backfill batch")
+    upgrade.add_argument(
+        "--pause-ms",
+        type=float,
+        default=migrations.PAUSE_SECONDS * 1000,
+        help="Pause between backfill batches",
+    )
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+
+    if args.command == "status":
+        for row in migrations.status(engine):
+            cursor = (
+                f" (at {row['backfill_cursor']})" if row["state"] == "backfilling" and row["backfill_cursor"] else ""
+            )
+            print(f"{row['version']:<40} {row['state']}{cursor}  {row['description']}")
+        return 0
+
+    # Let running workers drop what a backfill changes (a new database has
+    # neither workers nor the bus table yet)
+    if inspect(engine).has_table(models.CacheInvalidation.__tablename__):
+        invalidation.start(engine)
+    migrations.upgrade(engine, backfill=not args.no_backfill, batch_size=args.batch_size, pause=args.pause_ms / 1000)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
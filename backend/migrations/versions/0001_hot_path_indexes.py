@@ -0,0 +1,16 @@
+"""Composite and expression indexes for the library and slot queries."""
+
+from sqlalchemy.engine import Connection
+from sqlalchemy.schema import CreateIndex
+
+import models
+
+
+def upgrade(conn: Connection) -> None:
+    for table, name in [
+        (models.RecipeDB.__table__, "ix_recipes_plan_deleted_votes"),
+        (models.RecipeDB.__table__, "ix_recipes_plan_deleted_lower_name"),
+        (models.PlanSlotDB.__table__, "ix_plan_slots_plan_recipe_date"),
+    ]:
+        index = next(i for i in table.indexes if i.name == name)
+        conn.execute(CreateIndex(index, if_not_exists=True))
@@ -0,0 +1,13 @@
+"""Removed: meal count of archived slots on recipes (now in 0003's rollups).
+
+This version used to add `recipes.archived_meal_count` for slot compaction,
+which the monthly rollups of 0003 replaced before it was released. It stays
+a no-op so the version numbers keep matching the databases that recorded
+it; 0003 drops the column where it was added.
+"""
+
+from sqlalchemy.engine import Connection
+
+
+def upgrade(conn: Connection) -> None:
+    pass
@@ -0,0 +1,43 @@
+"""Per-recipe monthly rollups of plan slots."""
+
+import sqlite3
+from typing import List, Optional
+
+from sqlalchemy import inspect, text, update
+from sqlalchemy.engine import Connection
+
+import invalidation
+import migrations
+import models
+import rollups
+
+
+def upgrade(conn: Connection) -> None:
+    models.RecipeMonthStats.__table__.create(conn, checkfirst=True)
+    # Databases that applied 0002 before it became a no-op have its column.
+    # DROP COLUMN needs SQLite 3.35; the column has a default, so it can stay
+    columns = {c["name"] for c in inspect(conn).get_columns("recipes")}
+    if "archived_meal_count" in columns and (
+        conn.dialect.name != "sqlite" or sqlite3.sqlite_version_info >= (3, 35, 0)
+    ):
+        conn.execute(text("ALTER TABLE recipes DROP COLUMN archived_meal_count"))
+
+
+def backfill(conn: Connection, after: Optional[str], batch_size: int) -> Optional[str]:
+    # A plan has many slots, so take fewer plans per batch
+    plan_ids = migrations.next_ids(conn, models.MealPlan.id, after, max(1, batch_size // 100))
+    if not plan_ids:
+        return None
+    rollups.rebuild(conn, plan_ids)
+    # Statistics cached from the slots until now are keyed on the old version.
+    # Before 0005 adds the version no app runs, so nothing is cached yet.
+    if "version" in {c["name"] for c in inspect(conn).get_columns("meal_plans")}:
+        plans = models.MealPlan.__table__
+        conn.execute(update(plans).where(plans.c.id.in_(plan_ids)).values(version=plans.c.version + 1))
+        migrations.after_commit(conn, lambda: _invalidate(plan_ids))
+    return str(plan_ids[-1])
+
+
+def _invalidate(plan_ids: List[int]) -> None:
+    for plan_id in plan_ids:
+        invalidation.publish("plan", plan_id)
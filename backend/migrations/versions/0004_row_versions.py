@@ -0,0 +1,12 @@
+"""Version counters of recipes and slots, for If-Match on updates."""
+
+from sqlalchemy import Column, Integer
+from sqlalchemy.engine import Connection
+
+import migrations
+import models
+
+
+def upgrade(conn: Connection) -> None:
+    for table in (models.RecipeDB.__table__, models.PlanSlotDB.__table__, models.PlanSlotArchive.__table__):
+        migrations.add_column(conn, table, Column("version", Integer, nullable=False, server_default="1"))
@@ -0,0 +1,13 @@
+"""Version counter of meal plans, shared by all workers for cache keys and ETags."""
+
+from sqlalchemy import Column, Integer
+from sqlalchemy.engine import Connection
+
+import migrations
+import models
+
+
+def upgrade(conn: Connection) -> None:
+    migrations.add_column(
+        conn, models.MealPlan.__table__, Column("version", Integer, nullable=False, server_default="1")
+    )
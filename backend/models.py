@@ -6,14 +6,17 @@ from typing import List, Optional
 from sqlalchemy import (
     Column,
     Integer,
+    Float,
     String,
     Boolean,
     Date,
     DateTime,
     ForeignKey,
+    Index,
     Table,
     Enum as SQLEnum,
     UniqueConstraint,
+    func,
 )
 from sqlalchemy.orm import relationship, Mapped, mapped_column
 
@@ -108,6 +111,8 @@ class MealPlan(Base):
     id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
     name: Mapped[str] = mapped_column(String, nullable=False)
     created_by_user_id: Mapped[int] = mapped_column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    # Bumped after every write to the plan; cached results are keyed by it
+    version: Mapped[int] = mapped_column(Integer, nullable=False, default=1, server_default="1")
 
     # Audit columns
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
@@ -130,6 +135,9 @@ class MealPlan(Base):
     settings: Mapped[List["MealPlanSetting"]] = relationship(
         "MealPlanSetting", back_populates="meal_plan", cascade="all, delete-orphan"
     )
+    batches: Mapped[List["PlanBatch"]] = relationship(
+        "PlanBatch", back_populates="meal_plan", cascade="all, delete-orphan"
+    )
 
 
 class UserMealPlanAccess(Base):
@@ -212,6 +220,10 @@ class RecipeDB(Base):
     is_deleted: Mapped[bool] = mapped_column(Boolean, default=False)
     last_cooked_date: Mapped[Optional[date]] = mapped_column(Date, nullable=True)
     vote_count: Mapped[int] = mapped_column(Integer, default=0)
+    # Bumped by every change to the row, last cooked dates included but not
+    # vote_count (votes are merged into reads; editing never touches it);
+    # clients send it back in If-Match
+    version: Mapped[int] = mapped_column(Integer, nullable=False, default=1, server_default="1")
 
     # Audit columns
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
@@ -222,6 +234,35 @@ class RecipeDB(Base):
     # Relationships
     meal_plan: Mapped[MealPlan] = relationship("MealPlan", back_populates="recipes")
     tags: Mapped[List["Tag"]] = relationship("Tag", secondary=recipe_tags, back_populates="recipes")
+    ingredients: Mapped[List["RecipeIngredient"]] = relationship(
+        "RecipeIngredient",
+        back_populates="recipe",
+        cascade="all, delete-orphan",
+        order_by="RecipeIngredient.position",
+    )
+
+
+# Library listing: a plan's non-deleted recipes ordered by votes or name
+Index("ix_recipes_plan_deleted_votes", RecipeDB.meal_plan_id, RecipeDB.is_deleted, RecipeDB.vote_count)
+Index("ix_recipes_plan_deleted_lower_name", RecipeDB.meal_plan_id, RecipeDB.is_deleted, func.lower(RecipeDB.name))
+
+
+class RecipeIngredient(Base):
+    """Structured ingredient line of a recipe, for its default portions."""
+
+    __tablename__ = "recipe_ingredients"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
+    recipe_id: Mapped[int] = mapped_column(
+        Integer, ForeignKey("recipes.id", ondelete="CASCADE"), nullable=False, index=True
+    )
+    position: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    name: Mapped[str] = mapped_column(String, nullable=False)
+    quantity: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+    unit: Mapped[Optional[str]] = mapped_column(String, nullable=True)
+
+    # Relationships
+    recipe: Mapped["RecipeDB"] = relationship("RecipeDB", back_populates="ingredients")
 
 
 class PlanSlotDB(Base):
@@ -248,6 +289,8 @@ class PlanSlotDB(Base):
     recipe_id: Mapped[Optional[int]] = mapped_column(
         Integer, ForeignKey("recipes.id", ondelete="SET NULL"), nullable=True
     )
+    # Bumped whenever the slot gets another recipe; clients send it back in If-Match
+    version: Mapped[int] = mapped_column(Integer, nullable=False, default=1, server_default="1")
 
     # Audit columns
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
@@ -273,6 +316,137 @@ class PlanSlotDB(Base):
     recipe: Mapped[Optional["RecipeDB"]] = relationship("RecipeDB")
 
 
+# Last cooked date, meal counts and batches of a recipe within a plan. Date
+# ranges of a plan use the (meal_plan_id, plan_date, ...) unique index.
+Index("ix_plan_slots_plan_recipe_date", PlanSlotDB.meal_plan_id, PlanSlotDB.recipe_id, PlanSlotDB.plan_date)
+
+
+class PlanSlotArchive(Base):
+    """Plan slot older than the compaction horizon, moved out of plan_slots."""
+
+    __tablename__ = "plan_slots_archive"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    meal_plan_id: Mapped[int] = mapped_column(
+        Integer,
+        ForeignKey("meal_plans.id", ondelete="CASCADE"),
+        nullable=False,
+    )
+    plan_date: Mapped[date] = mapped_column(Date, nullable=False)
+    meal_type_id: Mapped[int] = mapped_column(Integer, ForeignKey("meal_types.id", ondelete="RESTRICT"), nullable=False)
+    extra_id: Mapped[Optional[str]] = mapped_column(String, nullable=True)
+    person: Mapped[Person] = mapped_column(SQLEnum(Person), nullable=False)
+    recipe_id: Mapped[Optional[int]] = mapped_column(
+        Integer, ForeignKey("recipes.id", ondelete="SET NULL"), nullable=True, index=True
+    )
+    version: Mapped[int] = mapped_column(Integer, nullable=False, default=1, server_default="1")
+
+    # Audit columns
+    created_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    archived_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
+
+    # Date ranges of a plan, like the live table
+    __table_args__ = (Index("ix_plan_slots_archive_plan_date", "meal_plan_id", "plan_date"),)
+
+    # Relationships
+    meal_type: Mapped["MealTypeModel"] = relationship("MealTypeModel")
+    recipe: Mapped[Optional["RecipeDB"]] = relationship("RecipeDB")
+
+
+class RecipeMonthStats(Base):
+    """Rollup of a recipe's slots in one month, live and archived (see rollups.py)."""
+
+    __tablename__ = "recipe_month_stats"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
+    meal_plan_id: Mapped[int] = mapped_column(
+        Integer,
+        ForeignKey("meal_plans.id", ondelete="CASCADE"),
+        nullable=False,
+    )
+    recipe_id: Mapped[int] = mapped_column(
+        Integer, ForeignKey("recipes.id", ondelete="CASCADE"), nullable=False, index=True
+    )
+    # First day of the month
+    month: Mapped[date] = mapped_column(Date, nullable=False)
+    # All slots with the recipe, and those of standard meal types
+    meals: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    standard_meals: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    last_date: Mapped[date] = mapped_column(Date, nullable=False)
+
+    # Also serves the per-plan aggregations
+    __table_args__ = (UniqueConstraint("meal_plan_id", "recipe_id", "month", name="uq_recipe_month_stats"),)
+
+
+class RecipeVote(Base):
+    """A vote not yet added to `recipes.vote_count` (see votes.py)."""
+
+    __tablename__ = "recipe_votes"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    meal_plan_id: Mapped[int] = mapped_column(
+        Integer,
+        ForeignKey("meal_plans.id", ondelete="CASCADE"),
+        nullable=False,
+        index=True,
+    )
+    recipe_id: Mapped[int] = mapped_column(Integer, ForeignKey("recipes.id", ondelete="CASCADE"), nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+class IdempotencyKey(Base):
+    """Response of a write sent with an Idempotency-Key header, replayed to retries."""
+
+    __tablename__ = "idempotency_keys"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    user_id: Mapped[int] = mapped_column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    key: Mapped[str] = mapped_column(String, nullable=False)
+    # Method and path the key was first used for
+    request: Mapped[str] = mapped_column(String, nullable=False)
+    status_code: Mapped[int] = mapped_column(Integer, nullable=False)
+    # JSON body
+    response: Mapped[str] = mapped_column(String, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
+    expires_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, index=True)
+
+    # A key is unique per user
+    __table_args__ = (UniqueConstraint("user_id", "key", name="uq_idempotency_key"),)
+
+
+class LinkMetadata(Base):
+    """Title, image and servings read from a recipe link, cached per URL."""
+
+    __tablename__ = "link_metadata"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    url: Mapped[str] = mapped_column(String, unique=True, nullable=False)
+    title: Mapped[Optional[str]] = mapped_column(String, nullable=True)
+    image_url: Mapped[Optional[str]] = mapped_column(String, nullable=True)
+    servings: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    # Validators of the page, sent back when revalidating
+    etag: Mapped[Optional[str]] = mapped_column(String, nullable=True)
+    last_modified: Mapped[Optional[str]] = mapped_column(String, nullable=True)
+    # Why the last fetch failed; the fields above are from the last success
+    error: Mapped[Optional[str]] = mapped_column(String, nullable=True)
+    fetched_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
+    expires_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+
+
+class CompactionRun(Base):
+    """One run of the compaction job; the unique date lets one worker claim it."""
+
+    __tablename__ = "compaction_runs"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
+    run_date: Mapped[date] = mapped_column(Date, unique=True, nullable=False)
+    started_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
+    finished_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+    # JSON counts of purged recipes, deleted and archived slots
+    summary: Mapped[Optional[str]] = mapped_column(String, nullable=True)
+
+
 class MealPlanSetting(Base):
     """Meal plan settings database model."""
 
@@ -293,3 +467,48 @@ class MealPlanSetting(Base):
 
     # Relationships
     meal_plan: Mapped[MealPlan] = relationship("MealPlan", back_populates="settings")
+
+
+class PlanBatch(Base):
+    """Target portions of a cooked batch (matlåda) of a recipe for one week."""
+
+    __tablename__ = "plan_batches"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
+    meal_plan_id: Mapped[int] = mapped_column(
+        Integer,
+        ForeignKey("meal_plans.id", ondelete="CASCADE"),
+        nullable=False,
+        index=True,
+    )
+    week_start: Mapped[date] = mapped_column(Date, nullable=False)
+    recipe_id: Mapped[int] = mapped_column(Integer, ForeignKey("recipes.id", ondelete="CASCADE"), nullable=False)
+    target_portions: Mapped[int] = mapped_column(Integer, nullable=False)
+
+    # Audit columns
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False
+    )
+
+    # One batch per recipe and week
+    __table_args__ = (UniqueConstraint("meal_plan_id", "week_start", "recipe_id", name="uq_plan_batch_per_week"),)
+
+    # Relationships
+    meal_plan: Mapped[MealPlan] = relationship("MealPlan", back_populates="batches")
+    recipe: Mapped["RecipeDB"] = relationship("RecipeDB")
+
+
+class CacheInvalidation(Base):
+    """Cache invalidation event broadcast to the other workers (table bus)."""
+
+    __tablename__ = "cache_invalidations"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    topic: Mapped[str] = mapped_column(String, nullable=False)
+    key: Mapped[str] = mapped_column(String, nullable=False)
+    origin: Mapped[str] = mapped_column(String, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False, index=True)
+
+    # Never reuse ids of pruned events, pollers track the last id they saw
+    __table_args__ = {"sqlite_autoincrement": True}
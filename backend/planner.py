@@ -0,0 +1,181 @@
+"""Automatic week planning for Matplanerare.
+
+Fills the empty standard-meal slots of one or more weeks with a greedy
+heuristic that mirrors how a household plans with batches (matlådor):
+a cooked recipe yields `default_portions` portions, which fill the next
+empty slots until the batch is used up or too old. New batches are picked
+by score (votes, time since last cooked, per-person tag preferences and
+variety against the batches already chosen), subject to:
+
+- no recipe is repeated within `no_repeat_days` of when it was last cooked
+- at most `placeholder_quota` slots per week get placeholder recipes, and
+  only when no regular recipe fits
+- recipes with one of a person's avoided tags are never given to them
+"""
+
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from typing import Dict, FrozenSet, Iterable, List, Optional, Sequence, Set, Tuple
+
+# How many of the best-ranked eligible recipes are rescored for each pick
+CANDIDATE_WINDOW = 50
+
+PREFERRED_TAG_BONUS = 0.5
+REPEATED_TAG_PENALTY = 0.25
+RECENCY_HORIZON_DAYS = 60
+
+
+@dataclass
+class Candidate:
+    """A recipe the planner can choose from."""
+
+    recipe_id: int
+    default_portions: int
+    last_cooked: Optional[date]
+    is_placeholder: bool
+    tags: FrozenSet[str]
+    votes: int = 0
+
+
+@dataclass
+class PersonPreferences:
+    """Tags a person prefers or never wants."""
+
+    prefer_tags: FrozenSet[str] = frozenset()
+    avoid_tags: FrozenSet[str] = frozenset()
+
+
+@dataclass
+class Constraints:
+    """Knobs of the planner."""
+
+    no_repeat_days: int = 14
+    placeholder_quota: int = 0
+    max_batch_days: int = 3
+    preferences: Dict[str, PersonPreferences] = field(default_factory=dict)
+
+
+# (plan_date, meal_type_id, person)
+SlotKey = Tuple[date, int, str]
+
+
+@dataclass
+class _Batch:
+    candidate: Candidate
+    cooked_on: date
+    remaining: int
+
+
+def empty_slots(
+    start: date,
+    days: int,
+    meal_type_ids: Sequence[int],
+    persons: Sequence[str],
+    occupied: Set[SlotKey],
+) -> List[SlotKey]:
+    """List the free slots of a date range in chronological order."""
+    slots = []
+    for offset in range(days):
+        day = start + timedelta(days=offset)
+        for meal_type_id in meal_type_ids:
+            for person in persons:
+                if (day, meal_type_id, person) not in occupied:
+                    slots.append((day, meal_type_id, person))
+    return slots
+
+
+def _base_score(candidate: Candidate, reference: date, max_votes: int) -> float:
+    vote_score = candidate.votes / max_votes if max_votes > 0 else 0.0
+    if candidate.last_cooked is None:
+        days = RECENCY_HORIZON_DAYS
+    else:
+        days = min(max((reference - candidate.last_cooked).days, 0), RECENCY_HORIZON_DAYS)
+    return vote_score + days / RECENCY_HORIZON_DAYS
+
+
+def plan(
+    slots: Iterable[SlotKey],
+    candidates: Sequence[Candidate],
+    constraints: Constraints,
+    week_start: date,
+) -> Dict[SlotKey, int]:
+    """Assign recipes to free slots.
+
+    Args:
+        slots: Free slots in the order they should be filled
+        candidates: Recipes to choose from
+        constraints: Planner constraints
+        week_start: First day of the planned horizon, weeks count from here
+
+    Returns:
+        Mapping of slot to recipe id; slots nothing fits stay unassigned
+    """
+    max_votes = max((c.votes for c in candidates), default=0)
+    base_scores = {c.recipe_id: _base_score(c, week_start, max_votes) for c in candidates if not c.is_placeholder}
+    regular = sorted(
+        (c for c in candidates if not c.is_placeholder),
+        key=lambda c: (-base_scores[c.recipe_id], c.recipe_id),
+    )
+    placeholders = sorted((c for c in candidates if c.is_placeholder), key=lambda c: c.recipe_id)
+
+    repeat_window = timedelta(days=constraints.no_repeat_days)
+    max_batch_age = timedelta(days=max(constraints.max_batch_days - 1, 0))
+    last_cooked: Dict[int, Optional[date]] = {c.recipe_id: c.last_cooked for c in candidates}
+    used_tags: Dict[str, int] = {}
+    placeholders_used: Dict[int, int] = {}
+    open_batches: List[_Batch] = []
+    assignment: Dict[SlotKey, int] = {}
+
+    def allowed(candidate: Candidate, person: str) -> bool:
+        preferences = constraints.preferences.get(person)
+        return not (preferences and candidate.tags & preferences.avoid_tags)
+
+    def fresh(candidate: Candidate, day: date) -> bool:
+        previous = last_cooked.get(candidate.recipe_id)
+        return previous is None or abs((day - previous).days) > repeat_window.days
+
+    for slot in slots:
+        day, _, person = slot
+        open_batches = [b for b in open_batches if b.remaining > 0 and day - b.cooked_on <= max_batch_age]
+
+        # Eat from an already cooked batch first
+        batch = next((b for b in open_batches if allowed(b.candidate, person)), None)
+
+        if batch is None:
+            preferences = constraints.preferences.get(person)
+            best, best_score, examined = None, float("-inf"), 0
+            for candidate in regular:
+                if not fresh(candidate, day) or not allowed(candidate, person):
+                    continue
+                score = base_scores[candidate.recipe_id]
+                score -= REPEATED_TAG_PENALTY * sum(used_tags.get(t, 0) for t in candidate.tags)
+                if preferences and candidate.tags & preferences.prefer_tags:
+                    score += PREFERRED_TAG_BONUS
+                if score > best_score:
+                    best, best_score = candidate, score
+                examined += 1
+                if examined >= CANDIDATE_WINDOW:
+                    break
+
+            if best is None:
+                week = (day - week_start).days // 7
+                if placeholders_used.get(week, 0) < constraints.placeholder_quota:
+                    best = next((p for p in placeholders if allowed(p, person)), None)
+                    if best is not None:
+                        placeholders_used[week] = placeholders_used.get(week, 0) + 1
+                        placeholders.append(placeholders.pop(placeholders.index(best)))
+
+            if best is None:
+                continue
+
+            batch = _Batch(best, day, max(best.default_portions, 1))
+            if not best.is_placeholder:
+                open_batches.append(batch)
+                last_cooked[best.recipe_id] = day
+                for tag in best.tags:
+                    used_tags[tag] = used_tags.get(tag, 0) + 1
+
+        batch.remaining -= 1
+        assignment[slot] = batch.candidate.recipe_id
+
+    return assignment
@@ -0,0 +1,152 @@
+"""Printable week rendering for Matplanerare.
+
+Renders a week of a meal plan as a self-contained HTML page (the layout of
+`frontend/print.html`) or, when the optional `fpdf2` package is installed,
+as a one-page PDF.
+"""
+
+import html
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Tuple
+
+try:
+    from fpdf import FPDF
+except ImportError:  # pragma: no cover - optional dependency
+    FPDF = None
+
+WEEKDAYS = ["mån", "tis", "ons", "tors", "fre", "lör", "sön"]
+PERSONS = ["A", "B"]
+
+
+@dataclass
+class PrintableWeek:
+    """Everything needed to render one week of a plan."""
+
+    plan_name: str
+    week_start: date
+    person_names: Dict[str, str]
+    meal_names: List[str]
+    # (plan_date, meal name, person) -> recipe name for standard meals
+    meals: Dict[Tuple[date, str, str], str] = field(default_factory=dict)
+    # plan_date -> [(meal name, person, recipe name)] for extra meals
+    extras: Dict[date, List[Tuple[str, str, str]]] = field(default_factory=dict)
+
+    @property
+    def days(self) -> List[date]:
+        return [self.week_start + timedelta(days=i) for i in range(7)]
+
+    @property
+    def title(self) -> str:
+        return f"Veckoplan — Vecka {self.week_start.isocalendar()[1]}"
+
+    @property
+    def week_range(self) -> str:
+        end = self.week_start + timedelta(days=6)
+        return f"{_format_day(self.week_start)} — {_format_day(end)}"
+
+
+def _format_day(day: date) -> str:
+    return f"{WEEKDAYS[day.weekday()]} {day.day}/{day.month}"
+
+
+PAGE_STYLE = """
+html, body { margin: 0; padding: 0; color: #111827;
+  font-family: Inter, system-ui, -apple-system, 'Segoe UI', Roboto, 'Helvetica Neue', Arial; }
+.page { padding: 8mm; box-sizing: border-box; }
+header { margin-bottom: 6mm; }
+h1 { font-size: 18px; margin: 0; }
+.small { font-size: 11px; color: #6b7280; }
+.days { display: grid; grid-template-columns: repeat(2, 1fr); gap: 6mm; }
+.day { border: 1px solid #e6eef6; border-radius: 6px; padding: 4px; }
+.day h2 { margin: 0 0 4px 0; font-size: 12px; }
+.meal-row { display: grid; grid-template-columns: 1fr 1fr; gap: 4px; margin-bottom: 4px; }
+.person-card { background: #f8fafc; border: 1px solid #e5e7eb; border-radius: 6px; padding: 4px; min-height: 30px; }
+.person-meta { font-size: 10px; color: #6b7280; margin-bottom: 3px; }
+.person-name { font-weight: 700; font-size: 12px; }
+.slot-empty { color: #9ca3af; font-style: italic; font-size: 11px; }
+.extra { font-size: 11px; margin-top: 2px; }
+"""
+
+
+def render_week_html(week: PrintableWeek) -> str:
+    """Render a week as a standalone printable HTML page."""
+    esc = html.escape
+    day_blocks = []
+    for day in week.days:
+        rows = []
+        for meal_name in week.meal_names:
+            cards = []
+            for person in PERSONS:
+                recipe_name = week.meals.get((day, meal_name, person))
+                if recipe_name:
+                    name_html = f'<div class="person-name">{esc(recipe_name)}</div>'
+                else:
+                    name_html = '<div class="slot-empty">—</div>'
+                cards.append(
+                    '<div class="person-card">'
+                    f'<div class="person-meta">{esc(meal_name)} • {esc(week.person_names[person])}</div>'
+                    f"{name_html}</div>"
+                )
+            rows.append(f'<div class="meal-row">{"".join(cards)}</div>')
+        for meal_name, person, recipe_name in week.extras.get(day, []):
+            rows.append(
+                f'<div class="extra">{esc(meal_name)} • {esc(week.person_names[person])}: {esc(recipe_name)}</div>'
+            )
+        day_blocks.append(f'<div class="day"><h2>{_format_day(day)} ({day.isoformat()})</h2>{"".join(rows)}</div>')
+
+    return (
+        '<!doctype html>\n<html lang="sv">\n<head>\n<meta charset="utf-8" />\n'
+        '<meta name="viewport" content="width=device-width,initial-scale=1" />\n'
+        f"<title>{esc(week.plan_name)} - {esc(week.title)}</title>\n<style>{PAGE_STYLE}</style>\n</head>\n<body>\n"
+        f'<div class="page"><header><h1>{esc(week.title)}</h1>'
+        f'<div class="small">{esc(week.plan_name)} · {esc(week.week_range)}</div></header>'
+        f'<div class="days">{"".join(day_blocks)}</div></div>\n</body>\n</html>\n'
+    )
+
+
+def _latin1(text: str) -> str:
+    """Drop characters the built-in PDF fonts cannot encode (e.g. emoji)."""
+    return text.encode("latin-1", "ignore").decode("latin-1").strip()
+
+
+def render_week_pdf(week: PrintableWeek) -> Optional[bytes]:
+    """Render a week as a one-page A4 PDF, or None if fpdf2 is not installed."""
+    if FPDF is None:
+        return None
+
+    pdf = FPDF(orientation="portrait", unit="mm", format="A4")
+    pdf.set_auto_page_break(auto=False)
+    pdf.add_page()
+    pdf.set_font("Helvetica", "B", 14)
+    pdf.cell(0, 7, _latin1(week.title.replace("—", "-")), new_x="LMARGIN", new_y="NEXT")
+    pdf.set_font("Helvetica", "", 9)
+    pdf.cell(0, 5, _latin1(f"{week.plan_name} - {week.week_range.replace('—', '-')}"), new_x="LMARGIN", new_y="NEXT")
+    pdf.ln(2)
+
+    column_width = (pdf.epw - 4) / 2
+    row_height = 4.5
+    for index, day in enumerate(week.days):
+        x = pdf.l_margin + (index % 2) * (column_width + 4)
+        if index % 2 == 0:
+            top = bottom = pdf.get_y()
+        pdf.set_xy(x, top)
+        pdf.set_font("Helvetica", "B", 10)
+        pdf.cell(column_width, 6, _latin1(f"{_format_day(day)} ({day.isoformat()})"), new_x="LEFT", new_y="NEXT")
+        for meal_name in week.meal_names:
+            for person in PERSONS:
+                recipe_name = week.meals.get((day, meal_name, person)) or "-"
+                pdf.set_x(x)
+                pdf.set_font("Helvetica", "", 8)
+                label = f"{meal_name} / {week.person_names[person]}: "
+                pdf.cell(column_width, row_height, _latin1(label + recipe_name), new_x="LEFT", new_y="NEXT")
+        for meal_name, person, recipe_name in week.extras.get(day, []):
+            pdf.set_x(x)
+            pdf.set_font("Helvetica", "I", 8)
+            label = f"{meal_name} / {week.person_names[person]}: "
+            pdf.cell(column_width, row_height, _latin1(label + recipe_name), new_x="LEFT", new_y="NEXT")
+        bottom = max(bottom, pdf.get_y())
+        if index % 2 == 1 or index == len(week.days) - 1:
+            pdf.set_y(bottom + 3)
+
+    return bytes(pdf.output())
@@ -0,0 +1,293 @@
+"""Opt-in request profiling for Matplanerare API.
+
+Enable with `MATBURK_PROFILING=1`. Every request then gets a `Server-Timing`
+header that splits its time into JWT verification, user lookup, permission
+checks, SQL (statement count and time, via SQLAlchemy engine events), the
+endpoint body and response serialization. Per-route aggregates are served
+at `GET /debug/timings`.
+
+A sampled share of requests (`MATBURK_PROFILING_SAMPLE_RATE`) also runs the
+endpoint under cProfile, or pyinstrument when `MATBURK_PROFILER=pyinstrument`
+and it is installed. Profiles of requests slower than
+`MATBURK_PROFILING_SLOW_MS` are written to `MATBURK_PROFILING_DIR`.
+"""
+
+import asyncio
+import cProfile
+import functools
+import logging
+import os
+import random
+import re
+import threading
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Optional
+
+ENABLED = os.getenv("MATBURK_PROFILING", "0").lower() in ("1", "true", "yes")
+SLOW_MS = float(os.getenv("MATBURK_PROFILING_SLOW_MS", "500"))
+SAMPLE_RATE = float(os.getenv("MATBURK_PROFILING_SAMPLE_RATE", "0"))
+PROFILE_DIR = os.getenv("MATBURK_PROFILING_DIR", "./data/profiles")
+PROFILER = os.getenv("MATBURK_PROFILER", "cprofile")
+
+logger = logging.getLogger(__name__)
+
+# Order of the phases in the Server-Timing header
+PHASES = ["jwt", "user", "perm", "sql", "endpoint", "serialize"]
+
+
+@dataclass
+class RequestStats:
+    """Timings collected while handling one request."""
+
+    started: float
+    phases: Dict[str, float] = field(default_factory=dict)
+    sql_count: int = 0
+    endpoint_finished: Optional[float] = None
+    profiler: Any = None
+
+    def add(self, phase: str, seconds: float) -> None:
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+
+_current: ContextVar[Optional[RequestStats]] = ContextVar("matburk_request_stats", default=None)
+
+_routes_lock = threading.Lock()
+_route_stats: Dict[str, Dict[str, float]] = {}
+
+
+def timed(phase: str) -> Callable:
+    """Decorator adding a function's duration to a phase of the current request.
+
+    Costs one context variable lookup when profiling is disabled.
+    """
+
+    def decorator(func: Callable) -> Callable:
+        if asyncio.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                stats = _current.get()
+                if stats is None:
+                    return await func(*args, **kwargs)
+                started = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    stats.add(phase, time.perf_counter() - started)
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            stats = _current.get()
+            if stats is None:
+                return func(*args, **kwargs)
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                stats.add(phase, time.perf_counter() - started)
+
+        return wrapper
+
+    return decorator
+
+
+class _Sampler:
+    """Thin wrapper over cProfile or pyinstrument with a common interface."""
+
+    def __init__(self):
+        self._pyinstrument = None
+        if PROFILER == "pyinstrument":
+            try:
+                from pyinstrument import Profiler
+
+                self._pyinstrument = Profiler(async_mode="disabled")
+            except ImportError:  # pragma: no cover - optional dependency
+                pass
+        self._cprofile = None if self._pyinstrument else cProfile.Profile()
+
+    def start(self) -> None:
+        if self._pyinstrument:
+            self._pyinstrument.start()
+        else:
+            self._cprofile.enable()
+
+    def stop(self) -> None:
+        if self._pyinstrument:
+            self._pyinstrument.stop()
+        else:
+            self._cprofile.disable()
+
+    def dump(self, path: str) -> str:
+        if self._pyinstrument:
+            path += ".html"
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(self._pyinstrument.output_html())
+        else:
+            path += ".prof"
+            self._cprofile.dump_stats(path)
+        return path
+
+
+def _wrap_endpoint(func: Callable) -> Callable:
+    """Time an endpoint function and run it under the request's sampler, if any."""
+    if asyncio.iscoroutinefunction(func):
+
+        @functools.wraps(func)
+        async def async_endpoint(*args, **kwargs):
+            stats = _current.get()
+            if stats is None:
+                return await func(*args, **kwargs)
+            started = time.perf_counter()
+            if stats.profiler:
+                stats.profiler.start()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                if stats.profiler:
+                    stats.profiler.stop()
+                stats.endpoint_finished = time.perf_counter()
+                stats.add("endpoint", stats.endpoint_finished - started)
+
+        return async_endpoint
+
+    @functools.wraps(func)
+    def endpoint(*args, **kwargs):
+        stats = _current.get()
+        if stats is None:
+            return func(*args, **kwargs)
+        started = time.perf_counter()
+        if stats.profiler:
+            stats.profiler.start()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            if stats.profiler:
+                stats.profiler.stop()
+            stats.endpoint_finished = time.perf_counter()
+            stats.add("endpoint", stats.endpoint_finished - started)
+
+    return endpoint
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("matburk_query_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info["matburk_query_started"].pop()
+    stats = _current.get()
+    if stats is not None:
+        stats.sql_count += 1
+        stats.add("sql", time.perf_counter() - started)
+
+
+def _handle_error(exception_context):
+    connection = exception_context.connection
+    if connection is not None and connection.info.get("matburk_query_started"):
+        connection.info["matburk_query_started"].pop()
+
+
+def _server_timing(stats: RequestStats, total: float) -> str:
+    entries = []
+    for phase in PHASES:
+        if phase in stats.phases:
+            entry = f"{phase};dur={stats.phases[phase] * 1000:.2f}"
+            if phase == "sql":
+                entry += f';desc="{stats.sql_count} queries"'
+            entries.append(entry)
+    entries.append(f"total;dur={total * 1000:.2f}")
+    return ", ".join(entries)
+
+
+def _record_route(route: str, stats: RequestStats, total: float) -> None:
+    with _routes_lock:
+        aggregate = _route_stats.setdefault(route, {"count": 0, "total_ms": 0.0, "max_ms": 0.0, "sql_count": 0})
+        aggregate["count"] += 1
+        aggregate["total_ms"] += total * 1000
+        aggregate["max_ms"] = max(aggregate["max_ms"], total * 1000)
+        aggregate["sql_count"] += stats.sql_count
+        for phase, seconds in stats.phases.items():
+            aggregate[f"{phase}_ms"] = aggregate.get(f"{phase}_ms", 0.0) + seconds * 1000
+
+
+def _dump_profile(route: str, method: str, stats: RequestStats, total: float) -> None:
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    name = re.sub(r"[^A-Za-z0-9]+", "_", route).strip("_") or "root"
+    path = stats.profiler.dump(
+        os.path.join(PROFILE_DIR, f"{int(time.time() * 1000)}-{method}-{name}-{total * 1000:.0f}ms")
+    )
+    logger.warning("Profiled slow request %s %s (%.0f ms): %s", method, route, total * 1000, path)
+
+
+class ProfilingMiddleware:
+    """ASGI middleware collecting per-request timings."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats(started=time.perf_counter())
+        if SAMPLE_RATE > 0 and random.random() < SAMPLE_RATE:
+            stats.profiler = _Sampler()
+        token = _current.set(stats)
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                now = time.perf_counter()
+                if stats.endpoint_finished is not None:
+                    stats.add("serialize", now - stats.endpoint_finished)
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", _server_timing(stats, now - stats.started).encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current.reset(token)
+            total = time.perf_counter() - stats.started
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            _record_route(route, stats, total)
+            if stats.profiler and total * 1000 >= SLOW_MS:
+                _dump_profile(route, scope["method"], stats, total)
+
+
+def route_stats() -> Dict[str, Dict[str, float]]:
+    """Snapshot of the per-route aggregates."""
+    with _routes_lock:
+        return {route: dict(values) for route, values in _route_stats.items()}
+
+
+def install(app, engine) -> None:
+    """Instrument the app and engine if profiling is enabled.
+
+    Call after all routers are included, since existing routes are wrapped.
+    """
+    if not ENABLED:
+        return
+
+    from fastapi.routing import APIRoute
+    from sqlalchemy import event
+
+    for route in app.routes:
+        if isinstance(route, APIRoute) and route.dependant.call is not None:
+            route.dependant.call = _wrap_endpoint(route.dependant.call)
+
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
+
+    @app.get("/debug/timings", include_in_schema=False)
+    def debug_timings() -> Dict[str, Dict[str, float]]:
+        """Per-route request timing aggregates since startup."""
+        return route_stats()
+
+    app.add_middleware(ProfilingMiddleware)
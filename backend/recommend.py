@@ -0,0 +1,238 @@
+"""Recipe recommendations ("what should we cook next?") for Matplanerare.
+
+Per plan, the recipe library is kept as NumPy feature arrays (votes, last
+cooked day, placeholder flag and a CSR-style recipe/tag incidence). Scoring
+all recipes is then a handful of vectorized operations. The arrays are built
+once per plan and updated in place when slots or votes change; any other
+recipe edit, any write to the plan in another worker, or a vote flush drops
+them so they are rebuilt on the next request.
+"""
+
+import threading
+from dataclasses import dataclass
+from datetime import date
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+import invalidation
+import models
+import votes
+
+# Never cooked recipes count as cooked this many days ago
+RECENCY_HORIZON_DAYS = 60
+
+VOTE_WEIGHT = 1.0
+RECENCY_WEIGHT = 1.0
+TAG_REPEAT_WEIGHT = 0.75
+
+NEVER_COOKED = np.iinfo(np.int64).min
+
+
+@dataclass
+class PlanFeatures:
+    """Feature arrays of the non-deleted recipes of one plan, aligned by position."""
+
+    recipe_ids: np.ndarray
+    names: List[str]
+    votes: np.ndarray
+    last_cooked: np.ndarray  # date ordinal, NEVER_COOKED if never planned
+    is_placeholder: np.ndarray
+    tag_rows: np.ndarray  # position of the recipe for every (recipe, tag) pair
+    tag_ids: np.ndarray  # tag id for every (recipe, tag) pair
+    tag_counts: np.ndarray  # number of tags per recipe
+    positions: Dict[int, int]
+
+
+_lock = threading.Lock()
+_features: Dict[int, PlanFeatures] = {}
+# Bumped by every change to a plan's features and by resets, so a build
+# that raced one is not published
+_generations: Dict[int, int] = {}
+_resets = 0
+
+
+def _build_features(meal_plan_id: int, db: Session) -> PlanFeatures:
+    """Load the feature arrays of a plan with two column-only queries."""
+    rows = (
+        db.query(
+            models.RecipeDB.id,
+            models.RecipeDB.name,
+            models.RecipeDB.vote_count,
+            models.RecipeDB.last_cooked_date,
+            models.RecipeDB.is_placeholder,
+        )
+        .filter(models.RecipeDB.meal_plan_id == meal_plan_id, ~models.RecipeDB.is_deleted)
+        .order_by(models.RecipeDB.id)
+        .all()
+    )
+    recipe_ids = np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+    positions = {int(recipe_id): i for i, recipe_id in enumerate(recipe_ids)}
+
+    tag_pairs = (
+        db.query(models.recipe_tags.c.recipe_id, models.recipe_tags.c.tag_id)
+        .join(models.RecipeDB, models.RecipeDB.id == models.recipe_tags.c.recipe_id)
+        .filter(models.RecipeDB.meal_plan_id == meal_plan_id, ~models.RecipeDB.is_deleted)
+        .all()
+    )
+    pending_votes = votes.pending(db, meal_plan_id)
+
+    tag_rows = np.fromiter((positions[r] for r, _ in tag_pairs), dtype=np.int64, count=len(tag_pairs))
+    tag_ids = np.fromiter((t for _, t in tag_pairs), dtype=np.int64, count=len(tag_pairs))
+
+    return PlanFeatures(
+        recipe_ids=recipe_ids,
+        names=[r[1] for r in rows],
+        votes=np.fromiter(((r[2] or 0) + pending_votes.get(r[0], 0) for r in rows), dtype=np.float64, count=len(rows)),
+        last_cooked=np.fromiter(
+            (r[3].toordinal() if r[3] else NEVER_COOKED for r in rows), dtype=np.int64, count=len(rows)
+        ),
+        is_placeholder=np.fromiter((bool(r[4]) for r in rows), dtype=bool, count=len(rows)),
+        tag_rows=tag_rows,
+        tag_ids=tag_ids,
+        tag_counts=np.bincount(tag_rows, minlength=len(rows)),
+        positions=positions,
+    )
+
+
+def get_features(meal_plan_id: int, db: Session) -> PlanFeatures:
+    """Get the feature arrays of a plan, building them on first use.
+
+    The arrays are built outside the lock; they are only kept if the plan was
+    not invalidated or updated meanwhile, as they may miss that change.
+    """
+    with _lock:
+        features = _features.get(meal_plan_id)
+        generation = (_resets, _generations.get(meal_plan_id, 0))
+    if features is None:
+        features = _build_features(meal_plan_id, db)
+        with _lock:
+            if (_resets, _generations.get(meal_plan_id, 0)) == generation:
+                features = _features.setdefault(meal_plan_id, features)
+    return features
+
+
+def invalidate(meal_plan_id: int) -> None:
+    """Drop the features of a plan, e.g. after recipes were added or edited."""
+    with _lock:
+        _generations[meal_plan_id] = _generations.get(meal_plan_id, 0) + 1
+        _features.pop(meal_plan_id, None)
+
+
+def _clear() -> None:
+    global _resets
+    with _lock:
+        _resets += 1
+        _features.clear()
+
+
+# Writes in other workers bump the plan version; drop the plan's features
+# there instead of patching them
+invalidation.subscribe("plan", lambda key: invalidate(int(key)), remote_only=True)
+# Votes cast in any worker reach the arrays with the next flush
+invalidation.subscribe("votes", lambda key: invalidate(int(key)))
+invalidation.on_reset(_clear)
+
+
+def update_recipe(
+    meal_plan_id: int,
+    recipe_id: int,
+    vote_count: Optional[int] = None,
+    last_cooked_date: Optional[date] = None,
+    clear_last_cooked: bool = False,
+) -> None:
+    """Update the features of one recipe in place, if the plan is loaded.
+
+    Call after the change has been committed (see `update_recipe_on_commit`).
+    """
+    with _lock:
+        _generations[meal_plan_id] = _generations.get(meal_plan_id, 0) + 1
+        features = _features.get(meal_plan_id)
+        if features is None:
+            return
+        position = features.positions.get(recipe_id)
+        if position is None:
+            return
+        if vote_count is not None:
+            features.votes[position] = vote_count
+        if last_cooked_date is not None:
+            features.last_cooked[position] = last_cooked_date.toordinal()
+        elif clear_last_cooked:
+            features.last_cooked[position] = NEVER_COOKED
+
+
+def update_recipe_on_commit(db: Session, meal_plan_id: int, recipe_id: int, **changes) -> None:
+    """Update the features of one recipe once the session's transaction commits.
+
+    Takes the arguments of `update_recipe`; nothing changes on a rollback.
+    """
+    db.info.setdefault("recommend_updates", []).append((meal_plan_id, recipe_id, changes))
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_committed_updates(session: Session) -> None:
+    for meal_plan_id, recipe_id, changes in session.info.pop("recommend_updates", []):
+        update_recipe(meal_plan_id, recipe_id, **changes)
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_rolled_back_updates(session: Session) -> None:
+    session.info.pop("recommend_updates", None)
+
+
+def score(
+    features: PlanFeatures,
+    reference_date: date,
+    week_recipe_ids: Iterable[int],
+    include_placeholders: bool = False,
+) -> np.ndarray:
+    """Score every recipe of a plan; excluded recipes get -inf.
+
+    The score adds normalized log votes and days since last cooked (capped
+    at the recency horizon) and subtracts the share of a recipe's tags that
+    are already used by recipes planned in the week. Recipes already in the
+    week are excluded.
+    """
+    n = len(features.recipe_ids)
+    if n == 0:
+        return np.empty(0, dtype=np.float64)
+
+    log_votes = np.log1p(np.maximum(features.votes, 0))
+    max_log_votes = log_votes.max()
+    vote_score = log_votes / max_log_votes if max_log_votes > 0 else np.zeros(n)
+
+    days_since = np.where(
+        features.last_cooked == NEVER_COOKED,
+        RECENCY_HORIZON_DAYS,
+        reference_date.toordinal() - features.last_cooked,
+    )
+    recency_score = np.clip(days_since, 0, RECENCY_HORIZON_DAYS) / RECENCY_HORIZON_DAYS
+
+    week_positions = np.array(
+        [features.positions[r] for r in set(week_recipe_ids) if r in features.positions], dtype=np.int64
+    )
+    tag_penalty = np.zeros(n)
+    if len(week_positions) and len(features.tag_ids):
+        in_week = np.zeros(n, dtype=bool)
+        in_week[week_positions] = True
+        week_tags = np.unique(features.tag_ids[in_week[features.tag_rows]])
+        shared = np.isin(features.tag_ids, week_tags)
+        shared_counts = np.bincount(features.tag_rows, weights=shared, minlength=n)
+        tag_penalty = shared_counts / np.maximum(features.tag_counts, 1)
+
+    scores = VOTE_WEIGHT * vote_score + RECENCY_WEIGHT * recency_score - TAG_REPEAT_WEIGHT * tag_penalty
+    if len(week_positions):
+        scores[week_positions] = -np.inf
+    if not include_placeholders:
+        scores[features.is_placeholder] = -np.inf
+    return scores
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Positions of the k best finite scores, best first."""
+    finite = np.flatnonzero(np.isfinite(scores))
+    if len(finite) > k:
+        finite = finite[np.argpartition(-scores[finite], k - 1)[:k]]
+    return finite[np.argsort(-scores[finite], kind="stable")]
@@ -0,0 +1,229 @@
+"""Per-recipe, per-month meal counts of a meal plan.
+
+`recipe_month_stats` holds, for every recipe and month it was planned in, the
+number of slots, the number of standard meals (lunch/dinner, what the library
+calls meal count) and the last date. Every write to `plan_slots` records its
+change here in the same transaction, so meal counts, last cooked dates and
+statistics never have to scan the slots, and archived slots keep counting.
+
+Migration 0003 fills the table plan by plan. Until its backfill has reached
+a plan (`covers`), the readers compute the same rows from the plan's slots
+(`month_stats`) and `record` leaves the plan to the backfill.
+"""
+
+from collections import defaultdict
+from datetime import date
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import Date, case, cast, delete, func, literal, select, type_coerce, union_all
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+import migrations
+import models
+
+BACKFILL_VERSION = "0003_recipe_month_stats"
+
+_stats = models.RecipeMonthStats.__table__
+# Set once the backfill is done, so covered databases skip the lookup
+_complete = False
+
+# (recipe_id, plan_date, is_standard_meal, +1 or -1)
+Change = Tuple[int, date, bool, int]
+
+
+def month_of(day: date) -> date:
+    return day.replace(day=1)
+
+
+def _upsert(dialect_name: str):
+    insert = postgresql.insert if dialect_name == "postgresql" else sqlite.insert
+    statement = insert(_stats)
+    excluded = statement.excluded
+    return statement.on_conflict_do_update(
+        index_elements=[_stats.c.meal_plan_id, _stats.c.recipe_id, _stats.c.month],
+        set_={
+            "meals": _stats.c.meals + excluded.meals,
+            "standard_meals": _stats.c.standard_meals + excluded.standard_meals,
+            "last_date": case((excluded.last_date > _stats.c.last_date, excluded.last_date), else_=_stats.c.last_date),
+        },
+    )
+
+
+def covers(db: Session, meal_plan_id: int) -> bool:
+    """Whether the plan's rollups are complete, i.e. the backfill has rebuilt it."""
+    global _complete
+    if _complete:
+        return True
+    done, cursor = migrations.backfill_state(db.connection(), BACKFILL_VERSION)
+    if done:
+        _complete = True
+        return True
+    return cursor is not None and meal_plan_id <= int(cursor)
+
+
+def _from_slots(meal_plan_id: int, dialect_name: str):
+    """The rows the rollups of a plan would have, computed from its slots."""
+    live, archived = models.PlanSlotDB.__table__, models.PlanSlotArchive.__table__
+    slots = union_all(
+        *[
+            select(table.c.recipe_id, table.c.plan_date, table.c.meal_type_id).where(
+                table.c.meal_plan_id == meal_plan_id, table.c.recipe_id.isnot(None)
+            )
+            for table in (live, archived)
+        ]
+    ).subquery()
+    if dialect_name == "postgresql":
+        month = cast(func.date_trunc("month", slots.c.plan_date), Date)
+    else:
+        month = type_coerce(func.date(slots.c.plan_date, "start of month"), Date)
+    types = models.MealTypeModel.__table__
+    return (
+        select(
+            literal(meal_plan_id).label("meal_plan_id"),
+            slots.c.recipe_id,
+            month.label("month"),
+            func.count().label("meals"),
+            func.sum(case((types.c.is_standard, 1), else_=0)).label("standard_meals"),
+            func.max(slots.c.plan_date).label("last_date"),
+        )
+        .select_from(slots.join(types, types.c.id == slots.c.meal_type_id))
+        .group_by(slots.c.recipe_id, month)
+        .subquery("slot_month_stats")
+    )
+
+
+def month_stats(db: Session, meal_plan_id: int):
+    """The plan's rollups: the table, or its rows computed from the slots until the backfill covers the plan.
+
+    Either has the columns of `recipe_month_stats`; filter on `meal_plan_id`.
+    """
+    if covers(db, meal_plan_id):
+        return _stats
+    return _from_slots(meal_plan_id, db.get_bind().dialect.name)
+
+
+def _slot_dates(meal_plan_id: int, recipe_id: int, start: date, end: date):
+    """Dates of a recipe's live and archived slots in [start, end)."""
+    live, archived = models.PlanSlotDB, models.PlanSlotArchive
+    return union_all(
+        *[
+            select(table.plan_date).where(
+                table.meal_plan_id == meal_plan_id,
+                table.recipe_id == recipe_id,
+                table.plan_date >= start,
+                table.plan_date < end,
+            )
+            for table in (live, archived)
+        ]
+    ).subquery()
+
+
+def record(db: Session, meal_plan_id: int, changes: Iterable[Change]) -> None:
+    """Apply slot changes of a plan to its rollups.
+
+    Call after the slot writes are flushed and before the commit. Plans the
+    backfill has not rebuilt yet are skipped; it reads their slots later.
+    """
+    totals: Dict[Tuple[int, date], List] = defaultdict(lambda: [0, 0, None])
+    shrunk: Set[Tuple[int, date]] = set()
+    for recipe_id, plan_date, standard, delta in changes:
+        if not recipe_id:
+            continue
+        key = (recipe_id, month_of(plan_date))
+        total = totals[key]
+        total[0] += delta
+        total[1] += delta if standard else 0
+        if delta > 0:
+            total[2] = max(total[2] or plan_date, plan_date)
+        else:
+            shrunk.add(key)
+    if not totals or not covers(db, meal_plan_id):
+        return
+
+    upsert = _upsert(db.get_bind().dialect.name)
+    for (recipe_id, month), (meals, standard_meals, last_date) in totals.items():
+        if meals == 0 and standard_meals == 0:
+            continue
+        db.execute(
+            upsert.values(
+                meal_plan_id=meal_plan_id,
+                recipe_id=recipe_id,
+                month=month,
+                meals=meals,
+                standard_meals=standard_meals,
+                last_date=last_date or month,
+            )
+        )
+
+    # A removed slot may have been the month's last one
+    for recipe_id, month in shrunk:
+        next_month = date(month.year + month.month // 12, month.month % 12 + 1, 1)
+        dates = _slot_dates(meal_plan_id, recipe_id, month, next_month)
+        last_date = db.execute(select(func.max(dates.c.plan_date))).scalar()
+        key = (_stats.c.meal_plan_id == meal_plan_id, _stats.c.recipe_id == recipe_id, _stats.c.month == month)
+        if last_date is None:
+            db.execute(delete(_stats).where(*key))
+        else:
+            db.execute(_stats.update().where(*key).values(last_date=last_date))
+
+
+def last_cooked(db: Session, meal_plan_id: int, recipe_id: int) -> Optional[date]:
+    """Date of the recipe's last slot in the plan, archived ones included."""
+    stats = month_stats(db, meal_plan_id)
+    return db.execute(
+        select(func.max(stats.c.last_date)).where(stats.c.meal_plan_id == meal_plan_id, stats.c.recipe_id == recipe_id)
+    ).scalar()
+
+
+def meal_counts(db: Session, meal_plan_id: int):
+    """Subquery of (recipe_id, meal_count) over a plan's standard meals."""
+    stats = month_stats(db, meal_plan_id)
+    return (
+        select(stats.c.recipe_id, func.sum(stats.c.standard_meals).label("meal_count"))
+        .where(stats.c.meal_plan_id == meal_plan_id)
+        .group_by(stats.c.recipe_id)
+        .subquery()
+    )
+
+
+def rebuild(conn: Connection, meal_plan_ids: List[int]) -> None:
+    """Recompute the rollups of some plans from their live and archived slots."""
+    if not meal_plan_ids:
+        return
+    standard = {
+        meal_type_id
+        for (meal_type_id,) in conn.execute(select(models.MealTypeModel.id).where(models.MealTypeModel.is_standard))
+    }
+    rows = []
+    for table in (models.PlanSlotDB.__table__, models.PlanSlotArchive.__table__):
+        rows += conn.execute(
+            select(table.c.meal_plan_id, table.c.recipe_id, table.c.plan_date, table.c.meal_type_id, func.count())
+            .where(table.c.meal_plan_id.in_(meal_plan_ids), table.c.recipe_id.isnot(None))
+            .group_by(table.c.meal_plan_id, table.c.recipe_id, table.c.plan_date, table.c.meal_type_id)
+        ).all()
+
+    totals: Dict[Tuple[int, int, date], List] = defaultdict(lambda: [0, 0, None])
+    for meal_plan_id, recipe_id, plan_date, meal_type_id, count in rows:
+        total = totals[(meal_plan_id, recipe_id, month_of(plan_date))]
+        total[0] += count
+        total[1] += count if meal_type_id in standard else 0
+        total[2] = max(total[2] or plan_date, plan_date)
+
+    conn.execute(delete(_stats).where(_stats.c.meal_plan_id.in_(meal_plan_ids)))
+    if totals:
+        conn.execute(
+            _stats.insert(),
+            [
+                {
+                    "meal_plan_id": meal_plan_id,
+                    "recipe_id": recipe_id,
+                    "month": month,
+                    "meals": meals,
+                    "standard_meals": standard_meals,
+                    "last_date": last_date,
+                }
+                for (meal_plan_id, recipe_id, month), (meals, standard_meals, last_date) in totals.items()
+            ],
+        )
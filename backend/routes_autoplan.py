@@ -0,0 +1,189 @@
+"""Automatic week planning endpoint for Matplanerare API."""
+
+from typing import Dict
+from datetime import timedelta
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy import insert, update
+from sqlalchemy.orm import Session
+
+import auth
+import cache
+import models
+import planner
+import rollups
+import schemas
+import utils
+import votes
+from database import get_db
+from routes_recipes import _update_recipe_last_cooked
+
+router = APIRouter(prefix="/api", tags=["autoplan"])
+
+MAX_WEEKS = 12
+
+
+def _load_candidates(plan_id: int, db: Session) -> list:
+    """Load the plan's recipes with their tag names as planner candidates."""
+    tag_rows = (
+        db.query(models.recipe_tags.c.recipe_id, models.Tag.name)
+        .join(models.Tag, models.Tag.id == models.recipe_tags.c.tag_id)
+        .join(models.RecipeDB, models.RecipeDB.id == models.recipe_tags.c.recipe_id)
+        .filter(models.RecipeDB.meal_plan_id == plan_id, ~models.RecipeDB.is_deleted)
+        .all()
+    )
+    tags: Dict[int, set] = {}
+    for recipe_id, tag_name in tag_rows:
+        tags.setdefault(recipe_id, set()).add(tag_name.lower())
+
+    rows = (
+        db.query(
+            models.RecipeDB.id,
+            models.RecipeDB.default_portions,
+            models.RecipeDB.last_cooked_date,
+            models.RecipeDB.is_placeholder,
+            models.RecipeDB.vote_count,
+        )
+        .filter(models.RecipeDB.meal_plan_id == plan_id, ~models.RecipeDB.is_deleted)
+        .all()
+    )
+    pending_votes = votes.pending(db, plan_id)
+    return [
+        planner.Candidate(
+            recipe_id=recipe_id,
+            default_portions=default_portions or 1,
+            last_cooked=last_cooked,
+            is_placeholder=bool(is_placeholder),
+            tags=frozenset(tags.get(recipe_id, ())),
+            votes=(vote_count or 0) + pending_votes.get(recipe_id, 0),
+        )
+        for recipe_id, default_portions, last_cooked, is_placeholder, vote_count in rows
+    ]
+
+
+@router.post("/plans/{plan_id}/autoplan", response_model=schemas.AutoPlanResult)
+def auto_plan(
+    plan_id: int,
+    request: schemas.AutoPlanRequest,
+    decoded_token: Dict = Depends(auth.verify_token),
+    db: Session = Depends(get_db),
+) -> schemas.AutoPlanResult:
+    """Fill the empty lunch and dinner slots of one or more weeks.
+
+    Existing slots are never changed. All filled slots are written in one
+    transaction; with `dry_run` nothing is written.
+
+    User must have edit permission on the plan.
+    """
+    user = auth.get_user(decoded_token, db)
+
+    if not utils.can_edit_plan(user.id, plan_id, db):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="You do not have permission to edit this meal plan",
+        )
+
+    if not 1 <= request.weeks <= MAX_WEEKS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Weeks must be between 1 and {MAX_WEEKS}",
+        )
+
+    start = request.week_start
+    end = start + timedelta(days=7 * request.weeks - 1)
+
+    meal_type_ids = [
+        meal_type_id
+        for (meal_type_id,) in db.query(models.MealTypeModel.id)
+        .filter(models.MealTypeModel.is_standard)
+        .order_by(models.MealTypeModel.id)
+    ]
+
+    existing = (
+        db.query(
+            models.PlanSlotDB.id,
+            models.PlanSlotDB.plan_date,
+            models.PlanSlotDB.meal_type_id,
+            models.PlanSlotDB.person,
+            models.PlanSlotDB.recipe_id,
+            models.PlanSlotDB.version,
+        )
+        .filter(
+            models.PlanSlotDB.meal_plan_id == plan_id,
+            models.PlanSlotDB.plan_date >= start,
+            models.PlanSlotDB.plan_date <= end,
+            models.PlanSlotDB.meal_type_id.in_(meal_type_ids),
+            models.PlanSlotDB.extra_id.is_(None),
+        )
+        .all()
+    )
+    occupied = {(d, m, p.value) for _, d, m, p, recipe_id, _ in existing if recipe_id is not None}
+    empty_rows = {
+        (d, m, p.value): (slot_id, version) for slot_id, d, m, p, recipe_id, version in existing if recipe_id is None
+    }
+
+    persons = [p.value for p in models.Person]
+    free_slots = planner.empty_slots(start, 7 * request.weeks, meal_type_ids, persons, occupied)
+
+    constraints = planner.Constraints(
+        no_repeat_days=request.no_repeat_days,
+        placeholder_quota=request.placeholder_quota,
+        max_batch_days=request.max_batch_days,
+        preferences={
+            person.value: planner.PersonPreferences(
+                prefer_tags=frozenset(t.strip().lower() for t in prefs.prefer_tags),
+                avoid_tags=frozenset(t.strip().lower() for t in prefs.avoid_tags),
+            )
+            for person, prefs in request.preferences.items()
+        },
+    )
+    assignment = planner.plan(free_slots, _load_candidates(plan_id, db), constraints, start)
+
+    if assignment and not request.dry_run:
+        updates = []
+        inserts = []
+        for (plan_date, meal_type_id, person), recipe_id in assignment.items():
+            empty_row = empty_rows.get((plan_date, meal_type_id, person))
+            if empty_row is not None:
+                slot_id, version = empty_row
+                updates.append({"id": slot_id, "recipe_id": recipe_id, "version": version + 1})
+            else:
+                inserts.append(
+                    {
+                        "meal_plan_id": plan_id,
+                        "plan_date": plan_date,
+                        "meal_type_id": meal_type_id,
+                        "extra_id": None,
+                        "person": models.Person(person),
+                        "recipe_id": recipe_id,
+                    }
+                )
+        if updates:
+            db.execute(update(models.PlanSlotDB), updates)
+        if inserts:
+            db.execute(insert(models.PlanSlotDB), inserts)
+        rollups.record(
+            db,
+            plan_id,
+            [(recipe_id, plan_date, True, 1) for (plan_date, _, _), recipe_id in assignment.items()],
+        )
+
+        for recipe_id in set(assignment.values()):
+            _update_recipe_last_cooked(recipe_id, plan_id, db)
+
+        db.commit()
+        cache.bump_plan_version(plan_id)
+        cache.bump_plan_weeks(plan_id, [plan_date for plan_date, _, _ in assignment])
+
+    return schemas.AutoPlanResult(
+        filled=len(assignment),
+        empty=len(free_slots) - len(assignment),
+        slots=[
+            schemas.PlanSlotUpdate(
+                plan_date=plan_date,
+                meal_type_id=meal_type_id,
+                person=person,
+                recipe_id=recipe_id,
+            )
+            for (plan_date, meal_type_id, person), recipe_id in sorted(assignment.items())
+        ],
+    )
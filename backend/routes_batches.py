@@ -0,0 +1,262 @@
+"""Meal batch (matlåda) endpoints for Matplanerare API.
+
+A batch is one cooked recipe whose portions are spread over the slots of a
+week. The server derives the active batches from the plan slots and keeps
+the target portions per week, so clients don't have to track them locally.
+"""
+
+from typing import Dict, List, Optional
+from datetime import date, timedelta
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy import and_, func, or_
+from sqlalchemy.orm import Session
+
+import auth
+import cache
+import models
+import rollups
+import schemas
+import utils
+from database import get_db
+from routes_recipes import _update_recipe_last_cooked
+
+router = APIRouter(prefix="/api", tags=["batches"])
+
+
+def _compute_batches(plan_id: int, start_date: date, end_date: date, db: Session) -> List[schemas.MealBatch]:
+    """Compute the batches of a week with one aggregated query.
+
+    A recipe is part of the week's batches if it is planned in a slot within
+    the range or has a stored target for the week starting at `start_date`.
+    Without a stored target the batch size falls back to the larger of the
+    recipe's default portions and its usage, as the planner grid did before.
+    """
+    usage_subquery = (
+        db.query(
+            models.PlanSlotDB.recipe_id.label("recipe_id"),
+            func.count(models.PlanSlotDB.id).label("used_portions"),
+        )
+        .filter(
+            models.PlanSlotDB.meal_plan_id == plan_id,
+            models.PlanSlotDB.plan_date >= start_date,
+            models.PlanSlotDB.plan_date <= end_date,
+            models.PlanSlotDB.recipe_id.isnot(None),
+        )
+        .group_by(models.PlanSlotDB.recipe_id)
+        .subquery()
+    )
+
+    rows = (
+        db.query(
+            models.RecipeDB.id,
+            models.RecipeDB.name,
+            models.RecipeDB.image_url,
+            models.RecipeDB.is_placeholder,
+            models.RecipeDB.default_portions,
+            func.coalesce(usage_subquery.c.used_portions, 0),
+            models.PlanBatch.target_portions,
+        )
+        .outerjoin(usage_subquery, usage_subquery.c.recipe_id == models.RecipeDB.id)
+        .outerjoin(
+            models.PlanBatch,
+            and_(
+                models.PlanBatch.recipe_id == models.RecipeDB.id,
+                models.PlanBatch.meal_plan_id == plan_id,
+                models.PlanBatch.week_start == start_date,
+            ),
+        )
+        .filter(
+            models.RecipeDB.meal_plan_id == plan_id,
+            ~models.RecipeDB.is_deleted,
+            or_(usage_subquery.c.recipe_id.isnot(None), models.PlanBatch.id.isnot(None)),
+        )
+        .order_by(models.RecipeDB.id)
+        .all()
+    )
+
+    batches = []
+    for recipe_id, name, image_url, is_placeholder, default_portions, used, target in rows:
+        default_portions = default_portions or 1
+        target_portions = target if target is not None else max(default_portions, used)
+        batches.append(
+            schemas.MealBatch(
+                recipe_id=recipe_id,
+                recipe_name=name,
+                image_url=image_url,
+                is_placeholder=bool(is_placeholder),
+                default_portions=default_portions,
+                target_portions=target_portions,
+                used_portions=used,
+                remaining_portions=target_portions - used,
+            )
+        )
+    return batches
+
+
+def _require_plan_recipe(plan_id: int, recipe_id: int, db: Session) -> models.RecipeDB:
+    """Get a non-deleted recipe of a plan or raise 404."""
+    recipe = (
+        db.query(models.RecipeDB)
+        .filter(
+            models.RecipeDB.id == recipe_id,
+            models.RecipeDB.meal_plan_id == plan_id,
+            ~models.RecipeDB.is_deleted,
+        )
+        .first()
+    )
+    if not recipe:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Recipe not found",
+        )
+    return recipe
+
+
+@router.get("/plans/{plan_id}/batches", response_model=List[schemas.MealBatch])
+def get_batches(
+    plan_id: int,
+    start_date: date,
+    end_date: Optional[date] = None,
+    decoded_token: Dict = Depends(auth.verify_token),
+    db: Session = Depends(get_db),
+) -> List[schemas.MealBatch]:
+    """Get the active batches of a week.
+
+    `start_date` is the first day of the week the batch targets belong to;
+    `end_date` defaults to six days later.
+
+    User must have access to the plan.
+    """
+    user = auth.get_user(decoded_token, db)
+
+    if not utils.can_view_plan(user.id, plan_id, db):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="You do not have access to this meal plan",
+        )
+
+    if end_date is None:
+        end_date = start_date + timedelta(days=6)
+
+    return _compute_batches(plan_id, start_date, end_date, db)
+
+
+@router.post("/plans/{plan_id}/batches", response_model=schemas.MealBatch)
+def update_batch(
+    plan_id: int,
+    batch: schemas.MealBatchUpdate,
+    decoded_token: Dict = Depends(auth.verify_token),
+    db: Session = Depends(get_db),
+) -> schemas.MealBatch:
+    """Add a recipe to a week's planning or change its target portions.
+
+    User must have edit permission on the plan.
+    """
+    user = auth.get_user(decoded_token, db)
+
+    if not utils.can_edit_plan(user.id, plan_id, db):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="You do not have permission to edit this meal plan",
+        )
+
+    if batch.target_portions < 1:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Target portions must be at least 1",
+        )
+
+    _require_plan_recipe(plan_id, batch.recipe_id, db)
+
+    db_batch = (
+        db.query(models.PlanBatch)
+        .filter(
+            models.PlanBatch.meal_plan_id == plan_id,
+            models.PlanBatch.week_start == batch.week_start,
+            models.PlanBatch.recipe_id == batch.recipe_id,
+        )
+        .first()
+    )
+    if not db_batch:
+        db_batch = models.PlanBatch(
+            meal_plan_id=plan_id,
+            week_start=batch.week_start,
+            recipe_id=batch.recipe_id,
+        )
+        db.add(db_batch)
+
+    db_batch.target_portions = batch.target_portions
+    db.commit()
+    cache.bump_plan_version(plan_id)
+
+    week_end = batch.week_start + timedelta(days=6)
+    for computed in _compute_batches(plan_id, batch.week_start, week_end, db):
+        if computed.recipe_id == batch.recipe_id:
+            return computed
+
+    raise HTTPException(
+        status_code=status.HTTP_404_NOT_FOUND,
+        detail="Recipe not found",
+    )
+
+
+@router.delete("/plans/{plan_id}/batches/{recipe_id}")
+def delete_batch(
+    plan_id: int,
+    recipe_id: int,
+    start_date: date,
+    end_date: Optional[date] = None,
+    decoded_token: Dict = Depends(auth.verify_token),
+    db: Session = Depends(get_db),
+) -> Dict[str, int]:
+    """Remove a batch from a week and clear every slot that uses it.
+
+    The stored target and the slots are removed in one transaction, so the
+    batch cannot reappear from a half-applied delete.
+
+    User must have edit permission on the plan.
+    """
+    user = auth.get_user(decoded_token, db)
+
+    if not utils.can_edit_plan(user.id, plan_id, db):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="You do not have permission to edit this meal plan",
+        )
+
+    if end_date is None:
+        end_date = start_date + timedelta(days=6)
+
+    slots = (
+        db.query(models.PlanSlotDB.id, models.PlanSlotDB.plan_date, models.MealTypeModel.is_standard)
+        .join(models.MealTypeModel, models.MealTypeModel.id == models.PlanSlotDB.meal_type_id)
+        .filter(
+            models.PlanSlotDB.meal_plan_id == plan_id,
+            models.PlanSlotDB.recipe_id == recipe_id,
+            models.PlanSlotDB.plan_date >= start_date,
+            models.PlanSlotDB.plan_date <= end_date,
+        )
+        .all()
+    )
+    cleared = (
+        db.query(models.PlanSlotDB)
+        .filter(models.PlanSlotDB.id.in_([slot_id for slot_id, _, _ in slots]))
+        .update(
+            {models.PlanSlotDB.recipe_id: None, models.PlanSlotDB.version: models.PlanSlotDB.version + 1},
+            synchronize_session=False,
+        )
+    )
+    rollups.record(db, plan_id, [(recipe_id, plan_date, standard, -1) for _, plan_date, standard in slots])
+
+    db.query(models.PlanBatch).filter(
+        models.PlanBatch.meal_plan_id == plan_id,
+        models.PlanBatch.week_start == start_date,
+        models.PlanBatch.recipe_id == recipe_id,
+    ).delete(synchronize_session=False)
+
+    _update_recipe_last_cooked(recipe_id, plan_id, db)
+    db.commit()
+    cache.bump_plan_version(plan_id)
+    cache.bump_plan_weeks(plan_id, [plan_date for _, plan_date, _ in slots])
+
+    return {"cleared_slots": cleared}
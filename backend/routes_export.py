@@ -0,0 +1,429 @@
+"""Plan export and import (NDJSON) endpoints for Matplanerare API.
+
+An export is one JSON object per line, each with a `type`, in an order where
+every record only refers to records before it:
+
+    plan, meal_type, tag, recipe, recipe_tag, ingredient, slot, batch, setting
+
+Ids in the file are the exporting database's; the import creates a new plan
+and maps them to new rows with in-memory dicts, inserting in batches.
+Meal types and tags are global and matched by name; unknown ones are created
+with only their name, so meal types from a file are never standard.
+"""
+
+import json
+from datetime import date, datetime
+from enum import Enum
+from typing import Any, Dict, Iterator, List, Optional, Set
+
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import func, insert, select, union_all
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+import auth
+import invalidation
+import metrics
+import models
+import rollups
+import schemas
+import utils
+import votes
+from database import engine, get_db
+from routes_plans import DEFAULT_PERSON_A, DEFAULT_PERSON_B
+
+router = APIRouter(prefix="/api", tags=["export"])
+
+FORMAT_VERSION = 1
+# Rows fetched per round trip when exporting, and inserted per statement when importing
+BATCH_SIZE = 1000
+
+_recipes = models.RecipeDB.__table__
+_slots = models.PlanSlotDB.__table__
+_archive = models.PlanSlotArchive.__table__
+_ingredients = models.RecipeIngredient.__table__
+_batches = models.PlanBatch.__table__
+_settings = models.MealPlanSetting.__table__
+
+RECIPE_COLUMNS = [
+    "id",
+    "name",
+    "link",
+    "image_filename",
+    "image_url",
+    "is_placeholder",
+    "default_portions",
+    "notes",
+    "is_test_recipe",
+    "is_deleted",
+    "last_cooked_date",
+    "vote_count",
+    "created_at",
+    "updated_at",
+]
+SLOT_COLUMNS = ["plan_date", "meal_type_id", "extra_id", "person", "recipe_id"]
+DATE_FIELDS = {"last_cooked_date", "plan_date", "week_start"}
+DATETIME_FIELDS = {"created_at", "updated_at"}
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    if isinstance(value, Enum):
+        return value.value
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+def _lines(record_type: str, rows) -> bytes:
+    return "".join(
+        json.dumps({"type": record_type, **row._asdict()}, default=_json_default, ensure_ascii=False) + "\n"
+        for row in rows
+    ).encode("utf-8")
+
+
+def _export_plan(plan_id: int) -> Iterator[bytes]:
+    """Yield the NDJSON export of a plan, a batch of rows at a time."""
+    metrics.stream_started()
+    try:
+        with engine.connect() as conn:
+            if conn.dialect.name == "postgresql":
+                # One snapshot for all the queries below
+                conn = conn.execution_options(isolation_level="REPEATABLE READ")
+            with conn.begin():
+                streaming = conn.execution_options(stream_results=True, yield_per=BATCH_SIZE)
+                yield from _export_rows(streaming, plan_id)
+    finally:
+        metrics.stream_finished()
+
+
+def _export_rows(conn, plan_id: int) -> Iterator[bytes]:
+    plan = conn.execute(select(models.MealPlan.name).where(models.MealPlan.id == plan_id)).one()
+    header = {
+        "type": "plan",
+        "format": FORMAT_VERSION,
+        "name": plan.name,
+        "exported_at": datetime.utcnow().isoformat(),
+    }
+    yield (json.dumps(header, ensure_ascii=False) + "\n").encode("utf-8")
+
+    meal_types = models.MealTypeModel.__table__
+    yield _lines("meal_type", conn.execute(select(meal_types.c.id, meal_types.c.name, meal_types.c.is_standard)))
+
+    plan_recipe_ids = select(_recipes.c.id).where(_recipes.c.meal_plan_id == plan_id)
+    tags = models.Tag.__table__
+    tag_ids = select(models.recipe_tags.c.tag_id).where(models.recipe_tags.c.recipe_id.in_(plan_recipe_ids))
+    for rows in conn.execute(select(tags.c.id, tags.c.name).where(tags.c.id.in_(tag_ids))).partitions():
+        yield _lines("tag", rows)
+
+    # Votes not flushed yet count as cast
+    pending_votes = votes.pending_counts(plan_id)
+    columns = [_recipes.c[name] for name in RECIPE_COLUMNS if name != "vote_count"]
+    vote_count = func.coalesce(_recipes.c.vote_count, 0) + func.coalesce(pending_votes.c.votes, 0)
+    recipes = (
+        select(*columns, vote_count.label("vote_count"))
+        .outerjoin(pending_votes, pending_votes.c.recipe_id == _recipes.c.id)
+        .where(_recipes.c.meal_plan_id == plan_id)
+    )
+    for rows in conn.execute(recipes).partitions():
+        yield _lines("recipe", rows)
+
+    recipe_tags = select(models.recipe_tags.c.recipe_id, models.recipe_tags.c.tag_id).where(
+        models.recipe_tags.c.recipe_id.in_(plan_recipe_ids)
+    )
+    for rows in conn.execute(recipe_tags).partitions():
+        yield _lines("recipe_tag", rows)
+
+    ingredients = select(
+        _ingredients.c.recipe_id,
+        _ingredients.c.position,
+        _ingredients.c.name,
+        _ingredients.c.quantity,
+        _ingredients.c.unit,
+    ).where(_ingredients.c.recipe_id.in_(plan_recipe_ids))
+    for rows in conn.execute(ingredients).partitions():
+        yield _lines("ingredient", rows)
+
+    # Archived slots are exported as plain slots
+    slots = union_all(
+        *[
+            select(*[table.c[name] for name in SLOT_COLUMNS]).where(
+                table.c.meal_plan_id == plan_id, table.c.recipe_id.isnot(None)
+            )
+            for table in (_slots, _archive)
+        ]
+    )
+    for rows in conn.execute(slots).partitions():
+        yield _lines("slot", rows)
+
+    batches = select(_batches.c.week_start, _batches.c.recipe_id, _batches.c.target_portions).where(
+        _batches.c.meal_plan_id == plan_id
+    )
+    for rows in conn.execute(batches).partitions():
+        yield _lines("batch", rows)
+
+    yield _lines(
+        "setting", conn.execute(select(_settings.c.key, _settings.c.value).where(_settings.c.meal_plan_id == plan_id))
+    )
+
+
+@router.get("/plans/{plan_id}/export")
+def export_plan(
+    plan_id: int,
+    decoded_token: Dict = Depends(auth.verify_token),
+    db: Session = Depends(get_db),
+) -> StreamingResponse:
+    """Stream a plan's recipes, tags, slots, batches and settings as NDJSON.
+
+    Rows are fetched in batches with a server-side cursor, so memory use does
+    not grow with the plan.
+
+    User must have access to the plan.
+    """
+    user = auth.get_user(decoded_token, db)
+
+    if not utils.can_view_plan(user.id, plan_id, db):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="You do not have access to this meal plan",
+        )
+    if db.get(models.MealPlan, plan_id) is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Meal plan not found",
+        )
+
+    return StreamingResponse(
+        _export_plan(plan_id),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="plan-{plan_id}.ndjson"'},
+    )
+
+
+def _parse_record(line: bytes) -> dict:
+    """Decode one line of an export; raises ValueError unless it is a JSON object."""
+    record = json.loads(line)
+    if not isinstance(record, dict):
+        raise ValueError(f"expected a JSON object, got {type(record).__name__}")
+    return record
+
+
+def _name(record: dict) -> str:
+    """The name of a meal type or tag record; raises ValueError if it is not a non-empty string."""
+    name = record.get("name")
+    if not isinstance(name, str) or not name.strip():
+        raise ValueError("names must be non-empty strings")
+    return name.strip()
+
+
+class _Importer:
+    """Bulk-load export records into a new plan.
+
+    Records of one type are buffered and inserted together; the buffer is
+    written when it is full or the type changes, so the rows a record refers
+    to always have their new ids by then.
+    """
+
+    def __init__(self, db: Session, plan_id: int):
+        self.db = db
+        self.plan_id = plan_id
+        self.meal_type_ids: Dict[int, int] = {}
+        self.tag_ids: Dict[int, int] = {}
+        # Tables of the global rows the import created
+        self.created: Set[str] = set()
+        self.recipe_ids: Dict[int, int] = {}
+        self.settings: Dict[str, str] = {}
+        self.counts: Dict[str, int] = {}
+        self.pending_type: Optional[str] = None
+        self.pending: List[dict] = []
+
+    def add(self, record: dict) -> None:
+        record_type = record.pop("type", None)
+        if record_type == "plan":
+            if record.get("format") != FORMAT_VERSION:
+                raise ValueError(f"unsupported format {record.get('format')}")
+            return
+        if record_type not in self._writers:
+            raise ValueError(f"unknown record type {record_type!r}")
+        if record_type != self.pending_type or len(self.pending) >= BATCH_SIZE:
+            self.flush()
+            self.pending_type = record_type
+        self.pending.append(record)
+        self.counts[record_type] = self.counts.get(record_type, 0) + 1
+
+    def flush(self) -> None:
+        if self.pending:
+            self._writers[self.pending_type](self, self.pending)
+        self.pending = []
+
+    def _by_name(self, model, names: Dict[int, str], key=None) -> Dict[int, int]:
+        """Map file ids to the global rows of the same name, creating the missing ones.
+
+        New rows only get their name, so a file cannot change rows every plan
+        uses, e.g. add a standard meal type.
+        """
+        column = key(model.name) if key else model.name
+        existing = dict(self.db.execute(select(column, model.id).where(column.in_(set(names.values())))).all())
+        missing = set(names.values()) - existing.keys()
+        if missing:
+            self.db.execute(insert(model), [{"name": name} for name in sorted(missing)])
+            existing.update(self.db.execute(select(model.name, model.id).where(model.name.in_(missing))).all())
+            self.created.add(model.__tablename__)
+        return {file_id: existing[name] for file_id, name in names.items()}
+
+    def _meal_types(self, records: List[dict]) -> None:
+        names = {record["id"]: _name(record) for record in records}
+        self.meal_type_ids.update(self._by_name(models.MealTypeModel, names))
+
+    def _tags(self, records: List[dict]) -> None:
+        # Stored lower case and matched case-insensitively, as recipe edits do
+        names = {record["id"]: _name(record).lower() for record in records}
+        self.tag_ids.update(self._by_name(models.Tag, names, func.lower))
+
+    def _recipes(self, records: List[dict]) -> None:
+        rows = []
+        for record in records:
+            row = {name: record.get(name) for name in RECIPE_COLUMNS if name != "id" and name in record}
+            for name in DATE_FIELDS & row.keys():
+                row[name] = date.fromisoformat(row[name]) if row[name] else None
+            for name in DATETIME_FIELDS & row.keys():
+                row[name] = datetime.fromisoformat(row[name]) if row[name] else datetime.utcnow()
+            rows.append({**row, "meal_plan_id": self.plan_id})
+        new_ids = self.db.execute(
+            insert(models.RecipeDB).returning(models.RecipeDB.id, sort_by_parameter_order=True), rows
+        ).scalars()
+        self.recipe_ids.update(zip((record["id"] for record in records), new_ids))
+
+    def _recipe_tags(self, records: List[dict]) -> None:
+        self.db.execute(
+            insert(models.recipe_tags),
+            [{"recipe_id": self.recipe_ids[r["recipe_id"]], "tag_id": self.tag_ids[r["tag_id"]]} for r in records],
+        )
+
+    def _ingredients(self, records: List[dict]) -> None:
+        self.db.execute(
+            insert(models.RecipeIngredient),
+            [
+                {
+                    "recipe_id": self.recipe_ids[r["recipe_id"]],
+                    "position": r.get("position", 0),
+                    "name": r["name"],
+                    "quantity": r.get("quantity"),
+                    "unit": r.get("unit"),
+                }
+                for r in records
+            ],
+        )
+
+    def _slots(self, records: List[dict]) -> None:
+        self.db.execute(
+            insert(models.PlanSlotDB),
+            [
+                {
+                    "meal_plan_id": self.plan_id,
+                    "plan_date": date.fromisoformat(r["plan_date"]),
+                    "meal_type_id": self.meal_type_ids[r["meal_type_id"]],
+                    "extra_id": r.get("extra_id"),
+                    "person": models.Person(r["person"]),
+                    "recipe_id": self.recipe_ids[r["recipe_id"]] if r.get("recipe_id") else None,
+                }
+                for r in records
+            ],
+        )
+
+    def _batches(self, records: List[dict]) -> None:
+        self.db.execute(
+            insert(models.PlanBatch),
+            [
+                {
+                    "meal_plan_id": self.plan_id,
+                    "week_start": date.fromisoformat(r["week_start"]),
+                    "recipe_id": self.recipe_ids[r["recipe_id"]],
+                    "target_portions": r["target_portions"],
+                }
+                for r in records
+            ],
+        )
+
+    def _settings(self, records: List[dict]) -> None:
+        self.settings.update({r["key"]: r["value"] for r in records})
+
+    _writers = {
+        "meal_type": _meal_types,
+        "tag": _tags,
+        "recipe": _recipes,
+        "recipe_tag": _recipe_tags,
+        "ingredient": _ingredients,
+        "slot": _slots,
+        "batch": _batches,
+        "setting": _settings,
+    }
+
+
+@router.post("/plans/import", response_model=schemas.PlanImportResult)
+async def import_plan(
+    request: Request,
+    name: Optional[str] = None,
+    decoded_token: Dict = Depends(auth.verify_token),
+    db: Session = Depends(get_db),
+) -> schemas.PlanImportResult:
+    """Create a new plan from an NDJSON export sent as the request body.
+
+    The plan is named like the exported one unless `name` is given, and the
+    user becomes its owner. Everything is imported in one transaction.
+    """
+    user = auth.get_user(decoded_token, db)
+
+    meal_plan = models.MealPlan(name=name or "Imported plan", created_by_user_id=user.id)
+    db.add(meal_plan)
+    db.flush()
+    db.add(models.UserMealPlanAccess(user_id=user.id, meal_plan_id=meal_plan.id, permission=models.Permission.OWNER))
+
+    importer = _Importer(db, meal_plan.id)
+    line_number = 0
+    buffer = b""
+    try:
+        async for chunk in request.stream():
+            buffer += chunk
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                line_number += 1
+                if line.strip():
+                    record = _parse_record(line)
+                    if record.get("type") == "plan" and not name:
+                        meal_plan.name = record.get("name") or meal_plan.name
+                    importer.add(record)
+        if buffer.strip():
+            line_number += 1
+            importer.add(_parse_record(buffer))
+        importer.flush()
+    except KeyError as error:
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid export at line {line_number}: unknown or missing {error}",
+        )
+    except (ValueError, TypeError, IntegrityError) as error:
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid export at line {line_number}: {error}",
+        )
+
+    settings = {"name_A": DEFAULT_PERSON_A, "name_B": DEFAULT_PERSON_B, **importer.settings}
+    db.execute(
+        insert(models.MealPlanSetting),
+        [{"meal_plan_id": meal_plan.id, "key": k, "value": v} for k, v in settings.items()],
+    )
+    rollups.rebuild(db.connection(), [meal_plan.id])
+    db.commit()
+    db.refresh(meal_plan)
+    utils.invalidate_plan_permissions(meal_plan.id)
+    if models.MealTypeModel.__tablename__ in importer.created:
+        invalidation.publish("meal_types", meal_plan.id)
+
+    return schemas.PlanImportResult(
+        plan=meal_plan,
+        recipes=importer.counts.get("recipe", 0),
+        slots=importer.counts.get("slot", 0),
+    )
@@ -0,0 +1,67 @@
+"""Recipe link metadata endpoints for Matplanerare API."""
+
+from typing import Dict
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy.orm import Session
+
+import auth
+import cache
+import link_metadata
+import recommend
+import schemas
+import utils
+from database import get_db
+
+router = APIRouter(prefix="/api", tags=["link-metadata"])
+
+
+@router.get("/link-metadata", response_model=schemas.LinkMetadata)
+async def get_link_metadata(
+    url: str,
+    decoded_token: Dict = Depends(auth.verify_token),
+    db: Session = Depends(get_db),
+) -> schemas.LinkMetadata:
+    """Title, image and servings of a recipe link, to prefill a new recipe.
+
+    Answered from the link metadata cache when fresh; 422 if the link could
+    not be read.
+    """
+    auth.get_user(decoded_token, db)
+
+    url = url.strip()
+    metadata = (await link_metadata.lookup(db, [url]))[url]
+    db.commit()
+    if metadata.error is not None and not (metadata.title or metadata.image_url):
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"Could not read the link: {metadata.error}",
+        )
+    return schemas.LinkMetadata(url=url, title=metadata.title, image_url=metadata.image_url, servings=metadata.servings)
+
+
+@router.post("/plans/{plan_id}/recipes/bulk/images", response_model=schemas.LinkImageBackfill)
+async def backfill_recipe_images(
+    plan_id: int,
+    decoded_token: Dict = Depends(auth.verify_token),
+    db: Session = Depends(get_db),
+) -> schemas.LinkImageBackfill:
+    """Give the plan's recipes with a link but no image the link's image.
+
+    Meant to run after a bulk import; the links are fetched concurrently.
+
+    User must have edit permission on the plan.
+    """
+    user = auth.get_user(decoded_token, db)
+
+    if not utils.can_edit_plan(user.id, plan_id, db):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="You do not have permission to edit this meal plan",
+        )
+
+    summary, plan_ids = await link_metadata.backfill_images(db, plan_id)
+    db.commit()
+    if plan_ids:
+        cache.bump_plan_version(plan_id)
+        recommend.invalidate(plan_id)
+    return schemas.LinkImageBackfill(**summary)
@@ -1,14 +1,19 @@
 """User and meal plan management endpoints for Matplanerare API."""
 
 from typing import Dict, List
-from datetime import datetime
+from datetime import datetime, timedelta
 from fastapi import APIRouter, Depends, HTTPException, status
 from pydantic import BaseModel
+from sqlalchemy import Column, Date, DateTime, Integer, MetaData, Table, func, insert, literal, select, update
 from sqlalchemy.orm import Session
 
 import auth
+import cache
+import compaction
 import models
+import rollups
 import schemas
+import shares
 import utils
 from database import get_db
 
@@ -18,6 +23,19 @@ router = APIRouter(prefix="/api", tags=["plans"])
 DEFAULT_PERSON_A = "Person A"
 DEFAULT_PERSON_B = "Person B"
 
+_recipes = models.RecipeDB.__table__
+# What a cloned plan copies of a recipe; votes and history start over
+RECIPE_CONTENT_COLUMNS = [
+    "name",
+    "link",
+    "image_filename",
+    "image_url",
+    "is_placeholder",
+    "default_portions",
+    "notes",
+    "is_test_recipe",
+]
+
 
 class MealPlanNameUpdate(BaseModel):
     name: str
@@ -45,6 +63,7 @@ async def update_meal_plan_name(
         )
     meal_plan.name = name_update.name
     db.commit()
+    cache.bump_plan_version(plan_id)
     return {"ok": "true", "name": meal_plan.name}
 
 
@@ -97,6 +116,7 @@ async def create_meal_plan(
 
     db.commit()
     db.refresh(meal_plan)
+    utils.invalidate_plan_permissions(meal_plan.id)
 
     # Initialize meal types (global, not per-plan)
     from routes_recipes import _initialize_meal_types_for_plan
@@ -117,6 +137,232 @@ async def create_meal_plan(
     return meal_plan
 
 
+def _shift_date(column, days: int, dialect_name: str):
+    """SQL expression for a date column moved by `days` days."""
+    if not days:
+        return column
+    if dialect_name == "postgresql":
+        return column + days
+    return func.date(column, f"{days:+d} days")
+
+
+# Old and new recipe ids of a clone; temporary, so it lives in the clone's
+# connection only and is dropped before the commit
+_recipe_id_map = Table(
+    "recipe_id_map",
+    MetaData(),
+    Column("old_id", Integer, primary_key=True),
+    Column("new_id", Integer, nullable=False),
+    prefixes=["TEMPORARY"],
+)
+
+
+def _copy_recipes(source_plan_id: int, new_plan_id: int, now: datetime, db: Session) -> Table:
+    """Copy the non-deleted recipes of a plan; returns the filled `recipe_id_map`.
+
+    The copies are inserted with RETURNING in parameter order, so every new id
+    is paired with the recipe it was copied from, however the database hands
+    out ids to concurrent inserts.
+    """
+    sources = db.execute(
+        select(_recipes.c.id, *[_recipes.c[name] for name in RECIPE_CONTENT_COLUMNS])
+        .where(_recipes.c.meal_plan_id == source_plan_id, ~_recipes.c.is_deleted)
+        .order_by(_recipes.c.id)
+    ).all()
+    conn = db.connection()
+    _recipe_id_map.create(conn)
+    if not sources:
+        return _recipe_id_map
+    new_ids = db.execute(
+        insert(_recipes).returning(_recipes.c.id, sort_by_parameter_order=True),
+        [
+            {
+                **{name: row[i + 1] for i, name in enumerate(RECIPE_CONTENT_COLUMNS)},
+                "meal_plan_id": new_plan_id,
+                "vote_count": 0,
+                "created_at": now,
+                "updated_at": now,
+            }
+            for row in sources
+        ],
+    ).scalars()
+    conn.execute(
+        insert(_recipe_id_map),
+        [{"old_id": row[0], "new_id": new_id} for row, new_id in zip(sources, new_ids)],
+    )
+    return _recipe_id_map
+
+
+@router.post("/plans/{plan_id}/clone", response_model=schemas.MealPlan)
+def clone_meal_plan(
+    plan_id: int,
+    request: schemas.PlanCloneRequest,
+    decoded_token: Dict = Depends(auth.verify_token),
+    db: Session = Depends(get_db),
+) -> schemas.MealPlan:
+    """Create a new plan with the recipes, tags and settings of a plan.
+
+    Votes and cooking history start over. With `week_start`, the slots and
+    batches of that week are copied to `target_week_start`. Recipes are
+    inserted with RETURNING to pair old and new ids; every other table is
+    copied with one `INSERT ... SELECT` joined to those pairs, all in one
+    transaction.
+
+    User must have access to the plan and becomes the owner of the copy.
+    """
+    user = auth.get_user(decoded_token, db)
+
+    if not utils.can_view_plan(user.id, plan_id, db):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="You do not have access to this meal plan",
+        )
+    if db.get(models.MealPlan, plan_id) is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Meal plan not found",
+        )
+
+    meal_plan = models.MealPlan(name=request.name, created_by_user_id=user.id)
+    db.add(meal_plan)
+    db.flush()
+    db.add(models.UserMealPlanAccess(user_id=user.id, meal_plan_id=meal_plan.id, permission=models.Permission.OWNER))
+    db.flush()
+    new_id = meal_plan.id
+    created_at = datetime.utcnow()
+    now = literal(created_at, DateTime)
+
+    id_map = _copy_recipes(plan_id, new_id, created_at, db)
+
+    recipe_tags = models.recipe_tags
+    db.execute(
+        insert(recipe_tags).from_select(
+            ["recipe_id", "tag_id"],
+            select(id_map.c.new_id, recipe_tags.c.tag_id).join(id_map, id_map.c.old_id == recipe_tags.c.recipe_id),
+        )
+    )
+    ingredients = models.RecipeIngredient.__table__
+    db.execute(
+        insert(ingredients).from_select(
+            ["recipe_id", "position", "name", "quantity", "unit"],
+            select(
+                id_map.c.new_id, ingredients.c.position, ingredients.c.name, ingredients.c.quantity, ingredients.c.unit
+            ).join(id_map, id_map.c.old_id == ingredients.c.recipe_id),
+        )
+    )
+    settings = models.MealPlanSetting.__table__
+    db.execute(
+        insert(settings).from_select(
+            ["meal_plan_id", "key", "value"],
+            select(literal(new_id), settings.c.key, settings.c.value).where(settings.c.meal_plan_id == plan_id),
+        )
+    )
+
+    if request.week_start is not None:
+        week_start = cache.week_of(request.week_start)
+        target = cache.week_of(request.target_week_start or week_start)
+        days = (target - week_start).days
+        dialect_name = db.get_bind().dialect.name
+
+        slots = models.PlanSlotDB.__table__
+        sources = [slots]
+        if week_start < compaction.archive_cutoff():
+            sources.append(models.PlanSlotArchive.__table__)
+        for source in sources:
+            db.execute(
+                insert(slots).from_select(
+                    [
+                        "meal_plan_id",
+                        "plan_date",
+                        "meal_type_id",
+                        "extra_id",
+                        "person",
+                        "recipe_id",
+                        "created_at",
+                        "updated_at",
+                    ],
+                    select(
+                        literal(new_id),
+                        _shift_date(source.c.plan_date, days, dialect_name),
+                        source.c.meal_type_id,
+                        source.c.extra_id,
+                        source.c.person,
+                        id_map.c.new_id,
+                        now,
+                        now,
+                    )
+                    .join(id_map, id_map.c.old_id == source.c.recipe_id)
+                    .where(
+                        source.c.meal_plan_id == plan_id,
+                        source.c.plan_date >= week_start,
+                        source.c.plan_date <= week_start + timedelta(days=6),
+                    ),
+                )
+            )
+
+        batches = models.PlanBatch.__table__
+        db.execute(
+            insert(batches).from_select(
+                ["meal_plan_id", "week_start", "recipe_id", "target_portions", "created_at", "updated_at"],
+                select(literal(new_id), literal(target, Date), id_map.c.new_id, batches.c.target_portions, now, now)
+                .join(id_map, id_map.c.old_id == batches.c.recipe_id)
+                .where(batches.c.meal_plan_id == plan_id, batches.c.week_start == week_start),
+            )
+        )
+
+        # Meal counts and last cooked dates of the copied week
+        rollups.rebuild(db.connection(), [new_id])
+        stats = models.RecipeMonthStats.__table__
+        db.execute(
+            update(_recipes)
+            .where(_recipes.c.meal_plan_id == new_id)
+            .values(
+                last_cooked_date=select(func.max(stats.c.last_date))
+                .where(stats.c.meal_plan_id == new_id, stats.c.recipe_id == _recipes.c.id)
+                .scalar_subquery()
+            )
+        )
+
+    id_map.drop(db.connection())
+    db.commit()
+    db.refresh(meal_plan)
+    utils.invalidate_plan_permissions(new_id)
+    return meal_plan
+
+
+def _plans_with_access(user_id: int, db: Session, *criteria) -> List[schemas.MealPlanWithAccess]:
+    """The user's plans with their creator and the user's permission, in one query."""
+    plans = models.MealPlan.__table__
+    users = models.User.__table__
+    access = models.UserMealPlanAccess.__table__
+    rows = db.execute(
+        select(
+            plans.c.id,
+            plans.c.name,
+            plans.c.created_at,
+            plans.c.updated_at,
+            access.c.permission,
+            users.c.id.label("creator_id"),
+            users.c.email.label("creator_email"),
+            users.c.created_at.label("creator_created_at"),
+        )
+        .join(access, access.c.meal_plan_id == plans.c.id)
+        .join(users, users.c.id == plans.c.created_by_user_id)
+        .where(access.c.user_id == user_id, *criteria)
+    ).all()
+    return [
+        schemas.MealPlanWithAccess(
+            id=row.id,
+            name=row.name,
+            created_by_user=schemas.User(id=row.creator_id, email=row.creator_email, created_at=row.creator_created_at),
+            created_at=row.created_at,
+            updated_at=row.updated_at,
+            permission=row.permission,
+        )
+        for row in rows
+    ]
+
+
 @router.get("/plans", response_model=List[schemas.MealPlanWithAccess])
 async def list_user_meal_plans(
     decoded_token: Dict = Depends(auth.verify_token),
@@ -124,31 +370,7 @@ async def list_user_meal_plans(
 ) -> List[schemas.MealPlanWithAccess]:
     """List all meal plans the user has access to."""
     user = auth.get_user(decoded_token, db)
-
-    accesses = (
-        db.query(models.UserMealPlanAccess, models.MealPlan)
-        .join(models.MealPlan)
-        .filter(models.UserMealPlanAccess.user_id == user.id)
-        .all()
-    )
-
-    result = []
-    for access, meal_plan in accesses:
-        plan_dict = {
-            "id": meal_plan.id,
-            "name": meal_plan.name,
-            "created_by_user": {
-                "id": meal_plan.created_by_user.id,
-                "email": meal_plan.created_by_user.email,
-                "created_at": meal_plan.created_by_user.created_at,
-            },
-            "created_at": meal_plan.created_at,
-            "updated_at": meal_plan.updated_at,
-            "permission": access.permission,
-        }
-        result.append(schemas.MealPlanWithAccess(**plan_dict))
-
-    return result
+    return _plans_with_access(user.id, db)
 
 
 @router.get("/plans/{plan_id}", response_model=schemas.MealPlanWithAccess)
@@ -160,34 +382,13 @@ async def get_meal_plan(
     """Get a specific meal plan (must have access)."""
     user = auth.get_user(decoded_token, db)
 
-    # Check if user has access
-    permission = utils.get_user_permission_for_plan(user.id, plan_id, db)
-    if not permission:
+    plans = _plans_with_access(user.id, db, models.MealPlan.__table__.c.id == plan_id)
+    if not plans:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="You do not have access to this meal plan",
         )
-
-    meal_plan = db.query(models.MealPlan).filter(models.MealPlan.id == plan_id).first()
-    if not meal_plan:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Meal plan not found",
-        )
-
-    plan_dict = {
-        "id": meal_plan.id,
-        "name": meal_plan.name,
-        "created_by_user": {
-            "id": meal_plan.created_by_user.id,
-            "email": meal_plan.created_by_user.email,
-            "created_at": meal_plan.created_by_user.created_at,
-        },
-        "created_at": meal_plan.created_at,
-        "updated_at": meal_plan.updated_at,
-        "permission": permission,
-    }
-    return schemas.MealPlanWithAccess(**plan_dict)
+    return plans[0]
 
 
 @router.get("/plans/{plan_id}/users", response_model=List[schemas.UserInPlan])
@@ -240,7 +441,7 @@ async def join_meal_plan(
     """Join a meal plan using a share code or one-time invite token."""
     user = auth.get_user(decoded_token, db)
 
-    share = db.query(models.MealPlanShare).filter(models.MealPlanShare.share_code == share_code).first()
+    share = shares.resolve(db, share_code, user.id)
 
     if not share:
         raise HTTPException(
@@ -255,17 +456,7 @@ async def join_meal_plan(
             detail="This invite link has already been used",
         )
 
-    # Check if already has access
-    existing_access = (
-        db.query(models.UserMealPlanAccess)
-        .filter(
-            models.UserMealPlanAccess.user_id == user.id,
-            models.UserMealPlanAccess.meal_plan_id == share.meal_plan_id,
-        )
-        .first()
-    )
-
-    if existing_access:
+    if share.access_id is not None:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="You already have access to this meal plan",
@@ -279,15 +470,19 @@ async def join_meal_plan(
     )
     db.add(access)
 
-    # Mark one-time invite as consumed
-    if share.is_one_time:
-        share.consumed_at = datetime.utcnow()
-        db.add(share)
+    # Mark one-time invite as consumed, unless another user just did
+    if share.is_one_time and not shares.consume(db, share.id):
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="This invite link has already been used",
+        )
 
     db.commit()
+    utils.invalidate_plan_permissions(share.meal_plan_id)
 
     return {
-        "message": f"Successfully joined meal plan '{share.meal_plan.name}'",
+        "message": f"Successfully joined meal plan '{share.plan_name}'",
         "plan_id": str(share.meal_plan_id),
     }
 
@@ -310,9 +505,9 @@ async def list_share_codes(
             detail="Only plan owners or editors can view share codes",
         )
 
-    shares = db.query(models.MealPlanShare).filter(models.MealPlanShare.meal_plan_id == plan_id).all()
+    plan_shares = db.query(models.MealPlanShare).filter(models.MealPlanShare.meal_plan_id == plan_id).all()
 
-    return [schemas.MealPlanShare.model_validate(s) for s in shares]
+    return [schemas.MealPlanShare.model_validate(s) for s in plan_shares]
 
 
 @router.post("/plans/{plan_id}/invite", response_model=Dict[str, str])
@@ -358,22 +553,13 @@ async def create_one_time_invite(
         if existing_view:
             return {"invite_token": existing_view.share_code}
 
-    # Generate unique token
-    while True:
-        token = utils.generate_token(32)
-        exists = db.query(models.MealPlanShare).filter(models.MealPlanShare.share_code == token).first()
-        if not exists:
-            break
-
-    invite = models.MealPlanShare(
-        meal_plan_id=plan_id,
-        share_code=token,
-        permission=models.Permission(permission),
+    token = shares.create(
+        db,
+        plan_id,
+        models.Permission(permission),
         is_one_time=(permission == "edit"),  # View = reusable, Edit = one-time
         created_by_user_id=user.id,
     )
-    db.add(invite)
-    db.commit()
 
     return {"invite_token": token}
 
@@ -452,4 +638,5 @@ def leave_meal_plan(
 
     db.delete(access)
     db.commit()
+    utils.invalidate_plan_permissions(plan_id)
     return {"message": "Left meal plan", "plan_id": str(plan_id)}
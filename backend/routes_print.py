@@ -0,0 +1,129 @@
+"""Printable week endpoint for Matplanerare API."""
+
+from typing import Dict, Optional
+from datetime import date, timedelta
+from fastapi import APIRouter, Depends, Header, HTTPException, Response, status
+from sqlalchemy.orm import Session
+
+import auth
+import cache
+import models
+import printing
+import utils
+from database import get_db
+from routes_recipes import _read_settings
+
+router = APIRouter(prefix="/api", tags=["print"])
+
+_print_cache = cache.get_cache("print_week", maxsize=128)
+
+MEDIA_TYPES = {"html": "text/html; charset=utf-8", "pdf": "application/pdf"}
+
+
+def _load_printable_week(plan_id: int, week_start: date, db: Session) -> printing.PrintableWeek:
+    """Load the plan name, settings, meal types and the week's planned recipes."""
+    plan_name = db.query(models.MealPlan.name).filter(models.MealPlan.id == plan_id).scalar()
+    if plan_name is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Meal plan not found",
+        )
+
+    settings = _read_settings(plan_id, db)
+    meal_names = [
+        name
+        for (name,) in db.query(models.MealTypeModel.name)
+        .filter(models.MealTypeModel.is_standard)
+        .order_by(models.MealTypeModel.id)
+        .all()
+    ]
+
+    week = printing.PrintableWeek(
+        plan_name=plan_name,
+        week_start=week_start,
+        person_names={"A": settings.name_A, "B": settings.name_B},
+        meal_names=meal_names,
+    )
+
+    rows = (
+        db.query(
+            models.PlanSlotDB.plan_date,
+            models.PlanSlotDB.person,
+            models.MealTypeModel.name,
+            models.MealTypeModel.is_standard,
+            models.RecipeDB.name,
+        )
+        .join(models.MealTypeModel, models.PlanSlotDB.meal_type_id == models.MealTypeModel.id)
+        .join(models.RecipeDB, models.PlanSlotDB.recipe_id == models.RecipeDB.id)
+        .filter(
+            models.PlanSlotDB.meal_plan_id == plan_id,
+            models.PlanSlotDB.plan_date >= week_start,
+            models.PlanSlotDB.plan_date <= week_start + timedelta(days=6),
+        )
+        .order_by(models.PlanSlotDB.plan_date, models.MealTypeModel.id, models.PlanSlotDB.person)
+        .all()
+    )
+    for plan_date, person, meal_name, is_standard, recipe_name in rows:
+        if is_standard:
+            week.meals[(plan_date, meal_name, person.value)] = recipe_name
+        else:
+            week.extras.setdefault(plan_date, []).append((meal_name, person.value, recipe_name))
+
+    return week
+
+
+@router.get("/plans/{plan_id}/print")
+def print_week(
+    plan_id: int,
+    week_start: Optional[date] = None,
+    format: str = "html",
+    if_none_match: Optional[str] = Header(None),
+    decoded_token: Dict = Depends(auth.verify_token),
+    db: Session = Depends(get_db),
+) -> Response:
+    """Render a printable week as HTML or PDF.
+
+    `week_start` is moved back to its Monday (defaults to the current week).
+    Rendered pages are cached per plan version and tagged with an ETag, so
+    displays that refresh periodically get a 304 until the plan changes.
+
+    User must have access to the plan.
+    """
+    user = auth.get_user(decoded_token, db)
+
+    if not utils.can_view_plan(user.id, plan_id, db):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="You do not have access to this meal plan",
+        )
+
+    if format not in MEDIA_TYPES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Format must be 'html' or 'pdf'",
+        )
+    if format == "pdf" and printing.FPDF is None:
+        raise HTTPException(
+            status_code=status.HTTP_501_NOT_IMPLEMENTED,
+            detail="PDF output requires the fpdf2 package",
+        )
+
+    week_start = cache.week_of(week_start or date.today())
+
+    version = cache.plan_version(plan_id)
+    etag = f'"{plan_id}-{version}-{week_start.isoformat()}-{format}"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if if_none_match == etag:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    cache_key = (plan_id, week_start, format, version)
+    content = _print_cache.get(cache_key)
+    if content is None:
+        week = _load_printable_week(plan_id, week_start, db)
+        if format == "pdf":
+            content = printing.render_week_pdf(week)
+        else:
+            content = printing.render_week_html(week).encode("utf-8")
+        _print_cache.set(cache_key, content)
+
+    return Response(content=content, media_type=MEDIA_TYPES[format], headers=headers)
@@ -1,15 +1,23 @@
 """Recipe and meal plan slot endpoints for Matplanerare API."""
 
-from typing import Dict, List
-from datetime import date
-from fastapi import APIRouter, Depends, Form, HTTPException, status
-from sqlalchemy.orm import Session
-from sqlalchemy import func
+from typing import Dict, List, Optional, Union
+from datetime import date, timedelta
+from fastapi import APIRouter, Depends, Form, Header, HTTPException, Request, status
+from sqlalchemy.orm import Session, joinedload, selectinload
+from sqlalchemy import Row, func, select, union_all
+from sqlalchemy.dialects import postgresql, sqlite
 
 import auth
+import cache
+import compaction
+import idempotency
+import invalidation
 import models
+import recommend
+import rollups
 import schemas
 import utils
+import votes
 from database import get_db
 
 router = APIRouter(prefix="/api", tags=["recipes_and_plan"])
@@ -18,6 +26,8 @@ router = APIRouter(prefix="/api", tags=["recipes_and_plan"])
 DEFAULT_PORTIONS = 4
 DEFAULT_PERSON_A = "Person A"
 DEFAULT_PERSON_B = "Person B"
+# Values of the settings a plan has not stored
+SETTING_DEFAULTS = {"name_A": DEFAULT_PERSON_A, "name_B": DEFAULT_PERSON_B}
 
 # ============================================================================
 # MEAL TYPES CONFIGURATION
@@ -32,6 +42,34 @@ EXTRA_MEAL_TYPES = [
     {"id": "övrigt", "name": "Övrigt"},
 ]
 
+# Meal types are global and rarely added to
+_meal_types_cache = cache.get_cache("meal_types", maxsize=1)
+invalidation.subscribe("meal_types", lambda key: _meal_types_cache.clear())
+
+# Settings per plan id; settings writes publish the "settings" invalidation
+_settings_cache = cache.get_cache("plan_settings", maxsize=1024)
+invalidation.subscribe("settings", lambda key: _settings_cache.discard(lambda plan_id: plan_id == int(key)))
+_settings = models.MealPlanSetting.__table__
+
+# Slot rows of one week per (plan id, Monday, week version); slot writes bump
+# the version of the weeks they touch (cache.bump_plan_weeks)
+_week_cache = cache.get_cache("plan_weeks", maxsize=1024)
+# Longest range served from the week cache, and the limit of `weeks`
+MAX_PLAN_WEEKS = 12
+# The compact format only needs the first five
+SLOT_COLUMNS = [
+    "plan_date",
+    "meal_type_id",
+    "extra_id",
+    "person",
+    "recipe_id",
+    "id",
+    "version",
+    "created_at",
+    "updated_at",
+]
+COMPACT_SLOT_COLUMNS = SLOT_COLUMNS[:5]
+
 # Placeholder recipes configuration
 PLACEHOLDER_RECIPES = [
     {"name": "🥡 Takeaway", "tags": "Snabbval"},
@@ -55,12 +93,20 @@ TEST_RECIPES = [
 ]
 
 
-def _get_meal_types(meal_plan_id: int, db: Session):
+def _get_meal_types(meal_plan_id: int, db: Session) -> List[schemas.MealType]:
     """Get meal types (standard and extra) for a plan."""
-    meal_types = db.query(models.MealTypeModel).all()
+    meal_types = _meal_types_cache.get("all")
+    if meal_types is None:
+        meal_types = [schemas.MealType.model_validate(m) for m in db.query(models.MealTypeModel).all()]
+        _meal_types_cache.set("all", meal_types)
     return meal_types
 
 
+def _standard_meal_type_ids(db: Session) -> set:
+    """Ids of the standard meal types, the ones meal counts include."""
+    return {meal_type.id for meal_type in _get_meal_types(0, db) if meal_type.is_standard}
+
+
 def _get_or_create_meal_type(name: str, is_standard: bool, db: Session) -> models.MealTypeModel:
     """Get or create a meal type."""
     meal_type = db.query(models.MealTypeModel).filter(models.MealTypeModel.name == name).first()
@@ -69,6 +115,7 @@ def _get_or_create_meal_type(name: str, is_standard: bool, db: Session) -> model
         db.add(meal_type)
         db.commit()
         db.refresh(meal_type)
+        invalidation.publish("meal_types", meal_type.id)
     return meal_type
 
 
@@ -162,49 +209,17 @@ def _seed_recipes_for_plan(meal_plan_id: int, db: Session) -> None:
 # ============================================================================
 
 
-@router.get("/plans/{plan_id}/recipes", response_model=List[schemas.Recipe])
-def get_recipes(
-    plan_id: int,
-    sort_by: str = "vote",
-    sort_order: str = "desc",
-    decoded_token: Dict = Depends(auth.verify_token),
-    db: Session = Depends(get_db),
-) -> List[schemas.Recipe]:
-    """Get all recipes in a meal plan with optional sorting.
-
-    User must have access to the plan.
-    """
-    user = auth.get_user(decoded_token, db)
-
-    # Check access
-    if not utils.can_view_plan(user.id, plan_id, db):
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="You do not have access to this meal plan",
-        )
-
-    # Calculate meal count for recipes in this plan (count only standard meals, not extras)
-    standard_meal_types = db.query(models.MealTypeModel).filter(models.MealTypeModel.is_standard).all()
-    standard_meal_type_ids = [mt.id for mt in standard_meal_types]
-
-    meal_count_subquery = (
-        db.query(
-            models.PlanSlotDB.recipe_id,
-            func.count(models.PlanSlotDB.id).label("meal_count"),
-        )
-        .filter(
-            models.PlanSlotDB.meal_plan_id == plan_id,
-            models.PlanSlotDB.meal_type_id.in_(standard_meal_type_ids),
-        )
-        .group_by(models.PlanSlotDB.recipe_id)
-        .subquery()
-    )
-
+def _query_recipes(plan_id: int, sort_by: str, sort_order: str, db: Session) -> List[models.RecipeDB]:
+    """Load the non-deleted recipes of a plan with meal counts, sorted like the library view."""
+    # Meal count for recipes in this plan (count only standard meals, not extras)
+    meal_count_subquery = rollups.meal_counts(db, plan_id)
+    meal_count = func.coalesce(meal_count_subquery.c.meal_count, 0)
     query = (
         db.query(
             models.RecipeDB,
-            func.coalesce(meal_count_subquery.c.meal_count, 0).label("meal_count"),
+            meal_count.label("meal_count"),
         )
+        .options(selectinload(models.RecipeDB.tags))
         .outerjoin(meal_count_subquery, models.RecipeDB.id == meal_count_subquery.c.recipe_id)
         .filter(
             models.RecipeDB.meal_plan_id == plan_id,
@@ -218,7 +233,7 @@ def get_recipes(
     elif sort_by == "last_cooked":
         column = models.RecipeDB.last_cooked_date
     elif sort_by == "total_meals":
-        column = func.coalesce(meal_count_subquery.c.meal_count, 0)
+        column = meal_count
     elif sort_by == "created":
         column = models.RecipeDB.created_at
     else:
@@ -246,9 +261,41 @@ def get_recipes(
         recipe.meal_count = row[1]
         recipes.append(recipe)
 
+    # Votes not flushed yet; sorting by them again keeps the index-ordered query
+    pending_votes = votes.pending(db, plan_id)
+    if pending_votes:
+        votes.apply(recipes, pending_votes)
+        if sort_by not in ("name", "last_cooked", "total_meals", "created"):
+            recipes.sort(key=lambda recipe: recipe.name.lower())
+            recipes.sort(key=lambda recipe: recipe.vote_count or 0, reverse=sort_order != "asc")
+
     return recipes
 
 
+@router.get("/plans/{plan_id}/recipes", response_model=List[schemas.Recipe])
+def get_recipes(
+    plan_id: int,
+    sort_by: str = "vote",
+    sort_order: str = "desc",
+    decoded_token: Dict = Depends(auth.verify_token),
+    db: Session = Depends(get_db),
+) -> List[schemas.Recipe]:
+    """Get all recipes in a meal plan with optional sorting.
+
+    User must have access to the plan.
+    """
+    user = auth.get_user(decoded_token, db)
+
+    # Check access
+    if not utils.can_view_plan(user.id, plan_id, db):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="You do not have access to this meal plan",
+        )
+
+    return _query_recipes(plan_id, sort_by, sort_order, db)
+
+
 @router.post("/plans/{plan_id}/recipes", response_model=schemas.Recipe)
 async def create_recipe(
     plan_id: int,
@@ -309,6 +356,8 @@ async def create_recipe(
 
     db.add(db_recipe)
     db.commit()
+    cache.bump_plan_version(plan_id)
+    recommend.invalidate(plan_id)
     db.refresh(db_recipe)
     return db_recipe
 
@@ -423,6 +472,8 @@ async def bulk_import_recipes(
     # Commit all changes
     try:
         db.commit()
+        cache.bump_plan_version(plan_id)
+        recommend.invalidate(plan_id)
     except Exception as e:
         db.rollback()
         raise HTTPException(
@@ -442,6 +493,7 @@ async def bulk_import_recipes(
 async def update_recipe(
     plan_id: int,
     recipe_id: int,
+    request: Request,
     name: str = Form(...),
     link: str = Form(None),
     portions: int = Form(DEFAULT_PORTIONS),
@@ -449,11 +501,17 @@ async def update_recipe(
     notes: str = Form(None),
     image_url: str = Form(None),
     is_test: bool = Form(False),
+    if_match: Optional[str] = Header(None),
+    idempotency_key: Optional[str] = Header(None),
     decoded_token: Dict = Depends(auth.verify_token),
     db: Session = Depends(get_db),
 ) -> schemas.Recipe:
     """Update a recipe in a meal plan.
 
+    With `If-Match: <version>` the recipe is only changed if it still has
+    that version, otherwise 412. A retry with the same `Idempotency-Key`
+    gets the first response back.
+
     User must have edit permission on the plan.
     """
     user = auth.get_user(decoded_token, db)
@@ -465,6 +523,11 @@ async def update_recipe(
             detail="You do not have permission to edit this meal plan",
         )
 
+    replayed = idempotency.replay(db, user.id, idempotency_key, request)
+    if replayed is not None:
+        return replayed
+    expected_version = idempotency.parse_if_match(if_match)
+
     db_recipe = (
         db.query(models.RecipeDB)
         .filter(
@@ -479,6 +542,7 @@ async def update_recipe(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Recipe not found",
         )
+    idempotency.bump_version(db, models.RecipeDB, recipe_id, expected_version)
 
     # Update fields
     db_recipe.name = name
@@ -502,19 +566,31 @@ async def update_recipe(
                 tag_objects.append(tag)
 
     db_recipe.tags = tag_objects
-    db.commit()
-    db.refresh(db_recipe)
-    return db_recipe
+    db.flush()
+    votes.apply([db_recipe], votes.pending(db, plan_id, recipe_id))
+    response = schemas.Recipe.model_validate(db_recipe)
+    idempotency.save(db, user.id, idempotency_key, request, response)
+    replayed = idempotency.commit(db, user.id, idempotency_key, request)
+    if replayed is not None:
+        return replayed
+    cache.bump_plan_version(plan_id)
+    recommend.invalidate(plan_id)
+    return response
 
 
 @router.put("/plans/{plan_id}/recipes/{recipe_id}/vote")
 def vote_recipe(
     plan_id: int,
     recipe_id: int,
+    request: Request,
+    idempotency_key: Optional[str] = Header(None),
     decoded_token: Dict = Depends(auth.verify_token),
     db: Session = Depends(get_db),
 ) -> Dict[str, bool]:
-    """Vote for a recipe in a meal plan."""
+    """Vote for a recipe in a meal plan.
+
+    A retry with the same `Idempotency-Key` is not counted again.
+    """
     user = auth.get_user(decoded_token, db)
 
     if not utils.can_view_plan(user.id, plan_id, db):
@@ -523,8 +599,12 @@ def vote_recipe(
             detail="You do not have access to this meal plan",
         )
 
+    replayed = idempotency.replay(db, user.id, idempotency_key, request)
+    if replayed is not None:
+        return replayed
+
     recipe = (
-        db.query(models.RecipeDB)
+        db.query(models.RecipeDB.vote_count)
         .filter(
             models.RecipeDB.id == recipe_id,
             models.RecipeDB.meal_plan_id == plan_id,
@@ -537,9 +617,17 @@ def vote_recipe(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Recipe not found",
         )
-
-    recipe.vote_count += 1
-    db.commit()
+    vote_count = recipe.vote_count or 0
+
+    # Added to vote_count in the background, without locking the recipe row
+    votes.cast(db, plan_id, recipe_id)
+    vote_count = vote_count + votes.pending(db, plan_id, recipe_id).get(recipe_id, 0)
+    idempotency.save(db, user.id, idempotency_key, request, {"ok": True})
+    replayed = idempotency.commit(db, user.id, idempotency_key, request)
+    if replayed is not None:
+        return replayed
+    # No plan version bump: no plan-version-keyed cache holds vote counts
+    recommend.update_recipe(plan_id, recipe_id, vote_count=vote_count)
     return {"ok": True}
 
 
@@ -575,7 +663,10 @@ def delete_recipe(
         )
 
     recipe.is_deleted = True
+    recipe.version = models.RecipeDB.version + 1
     db.commit()
+    cache.bump_plan_version(plan_id)
+    recommend.invalidate(plan_id)
     return {"ok": True}
 
 
@@ -585,37 +676,131 @@ def delete_recipe(
 
 
 def _update_recipe_last_cooked(recipe_id: int, meal_plan_id: int, db: Session) -> None:
-    """Update a recipe's last_cooked_date based on plan slots."""
+    """Update a recipe's last_cooked_date based on plan slots.
+
+    Reads the rollups, so record the slot changes first.
+    """
     if not recipe_id:
         return
 
-    max_date = (
-        db.query(func.max(models.PlanSlotDB.plan_date))
-        .filter(
-            models.PlanSlotDB.recipe_id == recipe_id,
-            models.PlanSlotDB.meal_plan_id == meal_plan_id,
-        )
-        .scalar()
-    )
+    max_date = rollups.last_cooked(db, meal_plan_id, recipe_id)
+    reset_votes = max_date is not None and max_date >= date.today()
+    if reset_votes:
+        votes.discard(db, recipe_id)
 
     recipe = db.query(models.RecipeDB).filter(models.RecipeDB.id == recipe_id).first()
     if recipe:
+        if recipe.last_cooked_date != max_date:
+            recipe.version = models.RecipeDB.version + 1
         recipe.last_cooked_date = max_date
-        if max_date and max_date >= date.today():
+        if reset_votes:
             recipe.vote_count = 0
         db.add(recipe)
+        recommend.update_recipe_on_commit(
+            db,
+            meal_plan_id,
+            recipe_id,
+            vote_count=0 if reset_votes else None,
+            last_cooked_date=max_date,
+            clear_last_cooked=max_date is None,
+        )
+
+
+def _load_plan_slots(
+    plan_id: int, start_date: date, end_date: date, db: Session, columns: List[str] = SLOT_COLUMNS
+) -> List[Row]:
+    """Read the slots of a plan within an inclusive date range as plain rows.
+
+    Ranges reaching back past the compaction horizon include archived slots.
+    """
+    tables = [models.PlanSlotDB.__table__]
+    if start_date < compaction.archive_cutoff():
+        tables.append(models.PlanSlotArchive.__table__)
+    query = union_all(
+        *[
+            select(*[table.c[name] for name in columns]).where(
+                table.c.meal_plan_id == plan_id,
+                table.c.plan_date >= start_date,
+                table.c.plan_date <= end_date,
+            )
+            for table in tables
+        ]
+    )
+    return db.execute(query).all()
+
+
+def _query_plan_slots(
+    plan_id: int, start_date: date, end_date: date, db: Session, columns: List[str] = SLOT_COLUMNS
+) -> List[Row]:
+    """Load the plan slots of a plan within an inclusive date range.
+
+    Ranges of up to `MAX_PLAN_WEEKS` weeks go through the week cache; the
+    weeks missing from it are read with one query. Longer ranges are read
+    directly, with only `columns`.
+    """
+    mondays = []
+    monday = cache.week_of(start_date)
+    while monday <= end_date:
+        mondays.append(monday)
+        monday += timedelta(days=7)
+    if len(mondays) > MAX_PLAN_WEEKS:
+        return _load_plan_slots(plan_id, start_date, end_date, db, columns)
+
+    # Versions are taken before reading, so a write in between leaves the
+    # rows under an outdated key
+    weeks: Dict[date, List[Row]] = {}
+    missing = {}
+    for monday in mondays:
+        key = (plan_id, monday, cache.week_version(plan_id, monday))
+        rows = _week_cache.get(key)
+        if rows is None:
+            missing[monday] = key
+        else:
+            weeks[monday] = rows
+    if missing:
+        loaded = {monday: [] for monday in missing}
+        for row in _load_plan_slots(plan_id, min(missing), max(missing) + timedelta(days=6), db):
+            week = loaded.get(cache.week_of(row.plan_date))
+            if week is not None:
+                week.append(row)
+        for monday, rows in loaded.items():
+            _week_cache.set(missing[monday], rows)
+        weeks.update(loaded)
+
+    return [row for monday in mondays for row in weeks[monday] if start_date <= row.plan_date <= end_date]
+
+
+def _compact_plan_slots(start_date: date, rows: List[Row]) -> schemas.PlanSlotsCompact:
+    """Encode slot rows (`COMPACT_SLOT_COLUMNS` first) as parallel arrays."""
+    plan_dates, meal_type_ids, extra_ids, persons, recipe_ids = list(zip(*rows))[:5] if rows else ([],) * 5
+    start = start_date.toordinal()
+    return schemas.PlanSlotsCompact(
+        start_date=start_date,
+        days=[plan_date.toordinal() - start for plan_date in plan_dates],
+        meal_type_ids=meal_type_ids,
+        persons=[0 if person == models.Person.A else 1 for person in persons],
+        recipe_ids=recipe_ids,
+        extra_ids=extra_ids,
+    )
 
 
-@router.get("/plans/{plan_id}/plan", response_model=List[schemas.PlanSlot])
+@router.get("/plans/{plan_id}/plan", response_model=Union[List[schemas.PlanSlot], schemas.PlanSlotsCompact])
 def get_plan(
     plan_id: int,
     start_date: date,
-    end_date: date,
+    end_date: Optional[date] = None,
+    weeks: Optional[int] = None,
+    format: str = "full",
     decoded_token: Dict = Depends(auth.verify_token),
     db: Session = Depends(get_db),
-) -> List[schemas.PlanSlot]:
+) -> Union[List[schemas.PlanSlot], schemas.PlanSlotsCompact]:
     """Get meal plan slots for a date range.
 
+    Instead of `end_date`, `weeks` returns that many whole weeks from the
+    Monday of `start_date`, so the client can prefetch the weeks around the
+    one shown. `format=compact` returns the slots as parallel arrays instead
+    of one object each, which is much smaller for long ranges.
+
     User must have access to the plan.
     """
     user = auth.get_user(decoded_token, db)
@@ -626,26 +811,47 @@ def get_plan(
             detail="You do not have access to this meal plan",
         )
 
-    return (
-        db.query(models.PlanSlotDB)
-        .filter(
-            models.PlanSlotDB.meal_plan_id == plan_id,
-            models.PlanSlotDB.plan_date >= start_date,
-            models.PlanSlotDB.plan_date <= end_date,
+    if format not in ("full", "compact"):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Format must be 'full' or 'compact'",
+        )
+    if weeks is not None:
+        if not 1 <= weeks <= MAX_PLAN_WEEKS:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Weeks must be between 1 and {MAX_PLAN_WEEKS}",
+            )
+        start_date = cache.week_of(start_date)
+        end_date = start_date + timedelta(days=7 * weeks - 1)
+    elif end_date is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Either end_date or weeks is required",
         )
-        .all()
-    )  # type: ignore
+
+    if format == "compact":
+        rows = _query_plan_slots(plan_id, start_date, end_date, db, COMPACT_SLOT_COLUMNS)
+        return _compact_plan_slots(start_date, rows)
+    return _query_plan_slots(plan_id, start_date, end_date, db)  # type: ignore
 
 
 @router.post("/plans/{plan_id}/plan", response_model=schemas.PlanSlot)
 def update_plan_slot(
     plan_id: int,
     slot: schemas.PlanSlotUpdate,
+    request: Request,
+    if_match: Optional[str] = Header(None),
+    idempotency_key: Optional[str] = Header(None),
     decoded_token: Dict = Depends(auth.verify_token),
     db: Session = Depends(get_db),
 ) -> schemas.PlanSlot:
     """Update or create a meal plan slot.
 
+    With `If-Match: <version>` the slot is only changed if it still has that
+    version (0 for a slot that does not exist yet), otherwise 412. A retry
+    with the same `Idempotency-Key` gets the first response back.
+
     User must have edit permission on the plan.
     """
     user = auth.get_user(decoded_token, db)
@@ -656,6 +862,11 @@ def update_plan_slot(
             detail="You do not have permission to edit this meal plan",
         )
 
+    replayed = idempotency.replay(db, user.id, idempotency_key, request)
+    if replayed is not None:
+        return replayed
+    expected_version = idempotency.parse_if_match(if_match)
+
     db_slot = (
         db.query(models.PlanSlotDB)
         .filter(
@@ -668,7 +879,8 @@ def update_plan_slot(
         .first()
     )
 
-    if not db_slot:
+    created = db_slot is None
+    if created:
         db_slot = models.PlanSlotDB(
             meal_plan_id=plan_id,
             plan_date=slot.plan_date,
@@ -677,12 +889,49 @@ def update_plan_slot(
             person=slot.person,
         )
         db.add(db_slot)
+    else:
+        idempotency.bump_version(db, models.PlanSlotDB, db_slot.id, expected_version)
+    # A new slot continues the version of the archived one it replaces
+    current_version = 0
 
     old_recipe_id = db_slot.recipe_id
     new_recipe_id = slot.recipe_id
+    removed_recipe_ids = [old_recipe_id]
+
+    if slot.plan_date < compaction.archive_cutoff():
+        # The meal may have been archived; the new value replaces it
+        archived = (
+            db.query(models.PlanSlotArchive)
+            .filter(
+                models.PlanSlotArchive.meal_plan_id == plan_id,
+                models.PlanSlotArchive.plan_date == slot.plan_date,
+                models.PlanSlotArchive.meal_type_id == slot.meal_type_id,
+                models.PlanSlotArchive.extra_id == slot.extra_id,
+                models.PlanSlotArchive.person == slot.person,
+            )
+            .first()
+        )
+        if archived:
+            removed_recipe_ids.append(archived.recipe_id)
+            old_recipe_id = old_recipe_id or archived.recipe_id
+            current_version = archived.version
+            db.delete(archived)
+
+    if created:
+        idempotency.check_version(current_version, expected_version)
+        db_slot.version = current_version + 1
 
     db_slot.recipe_id = new_recipe_id
-    db.commit()
+    db.flush()
+    if removed_recipe_ids != [new_recipe_id]:
+        standard = slot.meal_type_id in _standard_meal_type_ids(db)
+        changes = [(recipe_id, slot.plan_date, standard, -1) for recipe_id in removed_recipe_ids]
+        rollups.record(db, plan_id, changes + [(new_recipe_id, slot.plan_date, standard, 1)])
+    response = schemas.PlanSlot.model_validate(db_slot)
+    idempotency.save(db, user.id, idempotency_key, request, response)
+    replayed = idempotency.commit(db, user.id, idempotency_key, request)
+    if replayed is not None:
+        return replayed
 
     if new_recipe_id:
         _update_recipe_last_cooked(new_recipe_id, plan_id, db)
@@ -691,7 +940,9 @@ def update_plan_slot(
         _update_recipe_last_cooked(old_recipe_id, plan_id, db)
 
     db.commit()
-    return db_slot
+    cache.bump_plan_version(plan_id)
+    cache.bump_plan_weeks(plan_id, [slot.plan_date])
+    return response
 
 
 # ============================================================================
@@ -699,36 +950,35 @@ def update_plan_slot(
 # ============================================================================
 
 
-def _get_setting(meal_plan_id: int, key: str, default: str, db: Session) -> str:
-    """Get a setting value with default fallback."""
-    setting = (
-        db.query(models.MealPlanSetting)
-        .filter(
-            models.MealPlanSetting.meal_plan_id == meal_plan_id,
-            models.MealPlanSetting.key == key,
-        )
-        .first()
-    )
-    return setting.value if setting else default
+def _read_settings(meal_plan_id: int, db: Session) -> schemas.MealPlanSettings:
+    """Read the settings of a plan, falling back to defaults for missing keys."""
+    settings = _settings_cache.get(meal_plan_id)
+    if settings is None:
+        stored = db.execute(
+            select(_settings.c.key, _settings.c.value).where(_settings.c.meal_plan_id == meal_plan_id)
+        ).all()
+        settings = schemas.MealPlanSettings(**{**SETTING_DEFAULTS, **dict(stored)})
+        _settings_cache.set(meal_plan_id, settings)
+    return settings
 
 
-def _update_setting(meal_plan_id: int, key: str, value: str, db: Session) -> None:
-    """Update or create a setting."""
-    setting = (
-        db.query(models.MealPlanSetting)
-        .filter(
-            models.MealPlanSetting.meal_plan_id == meal_plan_id,
-            models.MealPlanSetting.key == key,
+def _write_settings(meal_plan_id: int, settings: schemas.MealPlanSettings, db: Session) -> None:
+    """Create or update all settings of a plan with one upsert.
+
+    The caller commits, publishes the "settings" invalidation and bumps the
+    plan version.
+    """
+    dialect_insert = postgresql.insert if db.get_bind().dialect.name == "postgresql" else sqlite.insert
+    statement = dialect_insert(_settings).values(
+        [{"meal_plan_id": meal_plan_id, "key": key, "value": value} for key, value in settings.model_dump().items()]
+    )
+    db.execute(
+        statement.on_conflict_do_update(
+            index_elements=[_settings.c.meal_plan_id, _settings.c.key],
+            set_={"value": statement.excluded.value},
         )
-        .first()
     )
 
-    if not setting:
-        setting = models.MealPlanSetting(meal_plan_id=meal_plan_id, key=key)
-        db.add(setting)
-
-    setting.value = value
-
 
 @router.get("/plans/{plan_id}/meal-types", response_model=List[schemas.MealType])
 def get_meal_types(
@@ -783,11 +1033,7 @@ def get_settings(
             detail="You do not have access to this meal plan",
         )
 
-    # Safely parse optional user IDs, handling empty strings gracefully
-    return schemas.MealPlanSettings(
-        name_A=_get_setting(plan_id, "name_A", DEFAULT_PERSON_A, db),
-        name_B=_get_setting(plan_id, "name_B", DEFAULT_PERSON_B, db),
-    )
+    return _read_settings(plan_id, db)
 
 
 @router.post("/plans/{plan_id}/settings")
@@ -806,7 +1052,79 @@ def update_settings(
             detail="You do not have permission to edit this meal plan",
         )
 
-    _update_setting(plan_id, "name_A", settings.name_A, db)
-    _update_setting(plan_id, "name_B", settings.name_B, db)
+    _write_settings(plan_id, settings, db)
     db.commit()
+    invalidation.publish("settings", plan_id)
+    cache.bump_plan_version(plan_id)
     return {"ok": True}
+
+
+# ============================================================================
+# PLAN BOOTSTRAP ENDPOINT
+# ============================================================================
+
+
+@router.get("/plans/{plan_id}/bootstrap", response_model=schemas.PlanBootstrap)
+def get_plan_bootstrap(
+    plan_id: int,
+    week_start: Optional[date] = None,
+    sort_by: str = "vote",
+    sort_order: str = "desc",
+    decoded_token: Dict = Depends(auth.verify_token),
+    db: Session = Depends(get_db),
+) -> schemas.PlanBootstrap:
+    """Get everything the planner needs when a plan is opened in one request.
+
+    Returns plan metadata with the user's permission, settings, meal types,
+    the slots of the week starting at `week_start` (defaults to the current
+    Monday) and the recipe library sorted like `GET /recipes`.
+
+    User must have access to the plan.
+    """
+    user = auth.get_user(decoded_token, db)
+
+    permission = utils.get_user_permission_for_plan(user.id, plan_id, db)
+    if not permission:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="You do not have access to this meal plan",
+        )
+
+    meal_plan = (
+        db.query(models.MealPlan)
+        .options(joinedload(models.MealPlan.created_by_user))
+        .filter(models.MealPlan.id == plan_id)
+        .first()
+    )
+    if not meal_plan:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Meal plan not found",
+        )
+
+    if week_start is None:
+        week_start = cache.week_of(date.today())
+    week_end = week_start + timedelta(days=6)
+
+    plan_dict = {
+        "id": meal_plan.id,
+        "name": meal_plan.name,
+        "created_by_user": {
+            "id": meal_plan.created_by_user.id,
+            "email": meal_plan.created_by_user.email,
+            "created_at": meal_plan.created_by_user.created_at,
+        },
+        "created_at": meal_plan.created_at,
+        "updated_at": meal_plan.updated_at,
+        "permission": permission,
+    }
+
+    return schemas.PlanBootstrap(
+        plan=schemas.MealPlanWithAccess(**plan_dict),
+        settings=_read_settings(plan_id, db),
+        meal_types=_get_meal_types(plan_id, db),
+        week_start=week_start,
+        week_end=week_end,
+        slots=_query_plan_slots(plan_id, week_start, week_end, db),
+        recipes=_query_recipes(plan_id, sort_by, sort_order, db),
+    )
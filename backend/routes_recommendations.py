@@ -0,0 +1,80 @@
+"""Recipe recommendation endpoint for Matplanerare API."""
+
+from typing import Dict, List, Optional
+from datetime import date, timedelta
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy.orm import Session
+
+import auth
+import cache
+import models
+import recommend
+import schemas
+import utils
+from database import get_db
+
+router = APIRouter(prefix="/api", tags=["recommendations"])
+
+MAX_RECOMMENDATIONS = 100
+
+
+@router.get("/plans/{plan_id}/recommendations", response_model=List[schemas.RecipeRecommendation])
+def get_recommendations(
+    plan_id: int,
+    week_start: Optional[date] = None,
+    limit: int = 10,
+    include_placeholders: bool = False,
+    decoded_token: Dict = Depends(auth.verify_token),
+    db: Session = Depends(get_db),
+) -> List[schemas.RecipeRecommendation]:
+    """Recommend recipes to plan for a week.
+
+    Recipes score higher with more votes and the longer ago they were
+    cooked, and lower the more of their tags are already used by recipes
+    planned in the week (defaults to the current week). Recipes already
+    planned in the week and placeholders are left out.
+
+    User must have access to the plan.
+    """
+    user = auth.get_user(decoded_token, db)
+
+    if not utils.can_view_plan(user.id, plan_id, db):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="You do not have access to this meal plan",
+        )
+
+    if week_start is None:
+        week_start = cache.week_of(date.today())
+    limit = max(1, min(limit, MAX_RECOMMENDATIONS))
+
+    week_recipe_ids = [
+        recipe_id
+        for (recipe_id,) in db.query(models.PlanSlotDB.recipe_id)
+        .filter(
+            models.PlanSlotDB.meal_plan_id == plan_id,
+            models.PlanSlotDB.plan_date >= week_start,
+            models.PlanSlotDB.plan_date <= week_start + timedelta(days=6),
+            models.PlanSlotDB.recipe_id.isnot(None),
+        )
+        .distinct()
+    ]
+
+    features = recommend.get_features(plan_id, db)
+    scores = recommend.score(features, week_start, week_recipe_ids, include_placeholders)
+
+    recommendations = []
+    for position in recommend.top_k(scores, limit):
+        last_cooked = features.last_cooked[position]
+        recommendations.append(
+            schemas.RecipeRecommendation(
+                recipe_id=int(features.recipe_ids[position]),
+                name=features.names[position],
+                score=round(float(scores[position]), 4),
+                vote_count=int(features.votes[position]),
+                last_cooked_date=(
+                    date.fromordinal(int(last_cooked)) if last_cooked != recommend.NEVER_COOKED else None
+                ),
+            )
+        )
+    return recommendations
@@ -0,0 +1,132 @@
+"""Ingredient and shopping list endpoints for Matplanerare API."""
+
+from typing import Dict, List, Optional
+from datetime import date, timedelta
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy.orm import Session
+
+import auth
+import cache
+import models
+import schemas
+import shopping
+import utils
+from database import get_db
+from routes_batches import _compute_batches, _require_plan_recipe
+
+router = APIRouter(prefix="/api", tags=["shopping"])
+
+_shopping_list_cache = cache.get_cache("shopping_list")
+
+
+@router.get("/plans/{plan_id}/recipes/{recipe_id}/ingredients", response_model=List[schemas.Ingredient])
+def get_ingredients(
+    plan_id: int,
+    recipe_id: int,
+    decoded_token: Dict = Depends(auth.verify_token),
+    db: Session = Depends(get_db),
+) -> List[schemas.Ingredient]:
+    """Get the ingredients of a recipe, for its default portions."""
+    user = auth.get_user(decoded_token, db)
+
+    if not utils.can_view_plan(user.id, plan_id, db):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="You do not have access to this meal plan",
+        )
+
+    recipe = _require_plan_recipe(plan_id, recipe_id, db)
+    return recipe.ingredients  # type: ignore
+
+
+@router.put("/plans/{plan_id}/recipes/{recipe_id}/ingredients", response_model=List[schemas.Ingredient])
+def update_ingredients(
+    plan_id: int,
+    recipe_id: int,
+    ingredients: List[schemas.Ingredient],
+    decoded_token: Dict = Depends(auth.verify_token),
+    db: Session = Depends(get_db),
+) -> List[schemas.Ingredient]:
+    """Replace the ingredients of a recipe.
+
+    Quantities are for the recipe's default portions.
+    User must have edit permission on the plan.
+    """
+    user = auth.get_user(decoded_token, db)
+
+    if not utils.can_edit_plan(user.id, plan_id, db):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="You do not have permission to edit this meal plan",
+        )
+
+    recipe = _require_plan_recipe(plan_id, recipe_id, db)
+    recipe.ingredients = [
+        models.RecipeIngredient(
+            position=position,
+            name=ingredient.name.strip(),
+            quantity=ingredient.quantity,
+            unit=ingredient.unit.strip() if ingredient.unit else None,
+        )
+        for position, ingredient in enumerate(ingredients)
+        if ingredient.name.strip()
+    ]
+    db.commit()
+    db.refresh(recipe)
+    cache.bump_plan_version(plan_id)
+    return recipe.ingredients  # type: ignore
+
+
+@router.get("/plans/{plan_id}/shopping-list", response_model=schemas.ShoppingList)
+def get_shopping_list(
+    plan_id: int,
+    start_date: date,
+    end_date: Optional[date] = None,
+    decoded_token: Dict = Depends(auth.verify_token),
+    db: Session = Depends(get_db),
+) -> schemas.ShoppingList:
+    """Get the aggregated shopping list for the batches of a week.
+
+    Each recipe's ingredients are scaled by its batch's target portions
+    relative to the recipe's default portions, normalized to common units
+    and merged. Results are cached per plan version.
+
+    User must have access to the plan.
+    """
+    user = auth.get_user(decoded_token, db)
+
+    if not utils.can_view_plan(user.id, plan_id, db):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="You do not have access to this meal plan",
+        )
+
+    if end_date is None:
+        end_date = start_date + timedelta(days=6)
+
+    cache_key = (plan_id, start_date, end_date, cache.plan_version(plan_id))
+    cached = _shopping_list_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    batches = [b for b in _compute_batches(plan_id, start_date, end_date, db) if not b.is_placeholder]
+    factors = {b.recipe_id: b.target_portions / b.default_portions for b in batches}
+
+    ingredients = (
+        db.query(models.RecipeIngredient)
+        .filter(models.RecipeIngredient.recipe_id.in_(factors.keys()))
+        .order_by(models.RecipeIngredient.recipe_id, models.RecipeIngredient.position)
+        .all()
+        if factors
+        else []
+    )
+
+    shopping_list = schemas.ShoppingList(
+        start_date=start_date,
+        end_date=end_date,
+        items=shopping.aggregate_ingredients(
+            (i.recipe_id, factors[i.recipe_id], schemas.Ingredient.model_validate(i)) for i in ingredients
+        ),
+    )
+    _shopping_list_cache.set(cache_key, shopping_list)
+    return shopping_list
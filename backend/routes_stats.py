@@ -0,0 +1,98 @@
+"""Cooking statistics endpoint for Matplanerare API."""
+
+from typing import Dict, Optional
+from datetime import date
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+import auth
+import cache
+import models
+import rollups
+import schemas
+import utils
+from database import get_db
+
+router = APIRouter(prefix="/api", tags=["stats"])
+
+MAX_RECIPES = 100
+
+_stats_cache = cache.get_cache("plan_stats")
+
+
+@router.get("/plans/{plan_id}/stats", response_model=schemas.PlanStats)
+def get_plan_stats(
+    plan_id: int,
+    months: Optional[int] = 12,
+    limit: int = 10,
+    decoded_token: Dict = Depends(auth.verify_token),
+    db: Session = Depends(get_db),
+) -> schemas.PlanStats:
+    """Most cooked recipes, meals per tag and per month.
+
+    Covers the last `months` months including the current one (everything
+    when omitted or 0) and counts lunches and dinners, archived ones
+    included. Answered from the monthly rollups, so the cost does not grow
+    with the plan's history of slots. Results are cached per plan version.
+
+    User must have access to the plan.
+    """
+    user = auth.get_user(decoded_token, db)
+
+    if not utils.can_view_plan(user.id, plan_id, db):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="You do not have access to this meal plan",
+        )
+
+    limit = max(1, min(limit, MAX_RECIPES))
+    since = None
+    if months and months > 0:
+        today = date.today()
+        index = today.year * 12 + today.month - months
+        since = date(index // 12, index % 12 + 1, 1)
+
+    cache_key = (plan_id, since, limit, cache.plan_version(plan_id))
+    cached = _stats_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    stats = rollups.month_stats(db, plan_id).c
+    filters = [stats.meal_plan_id == plan_id, stats.standard_meals > 0]
+    if since is not None:
+        filters.append(stats.month >= since)
+    meals = func.sum(stats.standard_meals)
+
+    most_cooked = (
+        db.query(models.RecipeDB.id, models.RecipeDB.name, meals, func.max(stats.last_date))
+        .join(models.RecipeDB, models.RecipeDB.id == stats.recipe_id)
+        .filter(*filters)
+        .group_by(models.RecipeDB.id, models.RecipeDB.name)
+        .order_by(meals.desc(), models.RecipeDB.name)
+        .limit(limit)
+        .all()
+    )
+    tags = (
+        db.query(models.Tag.name, meals)
+        .join(models.recipe_tags, models.recipe_tags.c.recipe_id == stats.recipe_id)
+        .join(models.Tag, models.Tag.id == models.recipe_tags.c.tag_id)
+        .filter(*filters)
+        .group_by(models.Tag.name)
+        .order_by(meals.desc(), models.Tag.name)
+        .all()
+    )
+    per_month = db.query(stats.month, meals).filter(*filters).group_by(stats.month).order_by(stats.month).all()
+
+    result = schemas.PlanStats(
+        since=since,
+        total_meals=sum(count for _, count in per_month),
+        most_cooked=[
+            schemas.RecipeStat(recipe_id=recipe_id, name=name, meals=count, last_cooked_date=last_date)
+            for recipe_id, name, count, last_date in most_cooked
+        ],
+        tags=[schemas.TagStat(tag=name, meals=count) for name, count in tags],
+        months=[schemas.MonthStat(month=month, meals=count) for month, count in per_month],
+    )
+    _stats_cache.set(cache_key, result)
+    return result
@@ -1,6 +1,6 @@
 """Pydantic schemas for API request/response validation."""
 
-from typing import Optional, List
+from typing import Dict, Optional, List
 from datetime import date, datetime
 from enum import Enum
 
@@ -89,6 +89,7 @@ class Recipe(BaseModel):
     vote_count: int
     meal_count: int = 0  # Number of times recipe appears in planner
     tags: List[Tag] = []  # Full Tag objects for response
+    version: int = 1  # For If-Match on updates
     created_at: datetime
     updated_at: datetime
 
@@ -96,6 +97,23 @@ class Recipe(BaseModel):
         from_attributes = True
 
 
+class LinkMetadata(BaseModel):
+    """What a recipe link says about the recipe, to prefill a new one."""
+
+    url: str
+    title: Optional[str] = None
+    image_url: Optional[str] = None
+    servings: Optional[int] = None
+
+
+class LinkImageBackfill(BaseModel):
+    """Recipes with a link but no image, and how many got the link's image."""
+
+    checked: int
+    updated: int
+    failed: int
+
+
 class PlanSlot(BaseModel):
     """Complete plan slot schema for responses."""
 
@@ -105,6 +123,7 @@ class PlanSlot(BaseModel):
     extra_id: Optional[str] = None
     person: Person
     recipe_id: Optional[int] = None
+    version: int = 1  # For If-Match on updates
     created_at: datetime
     updated_at: datetime
 
@@ -112,6 +131,21 @@ class PlanSlot(BaseModel):
         from_attributes = True
 
 
+class PlanSlotsCompact(BaseModel):
+    """Plan slots of a date range as parallel arrays (`format=compact`).
+
+    Slot i is on `start_date + days[i]`, for `meal_type_ids[i]` and person
+    `persons[i]` (0 = A, 1 = B).
+    """
+
+    start_date: date
+    days: List[int]
+    meal_type_ids: List[int]
+    persons: List[int]
+    recipe_ids: List[Optional[int]]
+    extra_ids: List[Optional[str]]
+
+
 class PlanSlotUpdate(BaseModel):
     """Schema for updating meal plan slots."""
 
@@ -135,6 +169,26 @@ class MealPlan(BaseModel):
         from_attributes = True
 
 
+class PlanImportResult(BaseModel):
+    """A plan created from an NDJSON export, with what it got."""
+
+    plan: MealPlan
+    recipes: int
+    slots: int
+
+
+class PlanCloneRequest(BaseModel):
+    """Schema for starting a new plan from an existing one.
+
+    With `week_start`, the slots of that week are copied too, moved to the
+    week of `target_week_start` (default: the same week).
+    """
+
+    name: str
+    week_start: Optional[date] = None
+    target_week_start: Optional[date] = None
+
+
 class MealPlanWithAccess(MealPlan):
     """Meal plan with user's permission level."""
 
@@ -171,3 +225,134 @@ class UserInPlan(BaseModel):
 
     class Config:
         from_attributes = True
+
+
+class PlanBootstrap(BaseModel):
+    """Everything the planner needs when a plan is opened, in one response."""
+
+    plan: MealPlanWithAccess
+    settings: MealPlanSettings
+    meal_types: List[MealType]
+    week_start: date
+    week_end: date
+    slots: List[PlanSlot]
+    recipes: List[Recipe]
+
+
+class MealBatch(BaseModel):
+    """A recipe batch (matlåda) and how many of its portions are planned."""
+
+    recipe_id: int
+    recipe_name: str
+    image_url: Optional[str] = None
+    is_placeholder: bool = False
+    default_portions: int
+    target_portions: int
+    used_portions: int
+    remaining_portions: int
+
+
+class MealBatchUpdate(BaseModel):
+    """Schema for setting the target portions of a batch in a week."""
+
+    week_start: date
+    recipe_id: int
+    target_portions: int
+
+
+class Ingredient(BaseModel):
+    """Ingredient line of a recipe, for the recipe's default portions."""
+
+    name: str
+    quantity: Optional[float] = None
+    unit: Optional[str] = None
+
+    class Config:
+        from_attributes = True
+
+
+class ShoppingListItem(BaseModel):
+    """Aggregated ingredient on a shopping list."""
+
+    name: str
+    quantity: Optional[float] = None
+    unit: Optional[str] = None
+    recipe_ids: List[int] = []
+
+
+class ShoppingList(BaseModel):
+    """Shopping list for the batches of a date range."""
+
+    start_date: date
+    end_date: date
+    items: List[ShoppingListItem]
+
+
+class RecipeRecommendation(BaseModel):
+    """A recommended recipe with its score."""
+
+    recipe_id: int
+    name: str
+    score: float
+    vote_count: int
+    last_cooked_date: Optional[date] = None
+
+
+class PersonPreferences(BaseModel):
+    """Tag preferences of one person for automatic planning."""
+
+    prefer_tags: List[str] = []
+    avoid_tags: List[str] = []
+
+
+class AutoPlanRequest(BaseModel):
+    """Schema for automatically filling the empty slots of one or more weeks."""
+
+    week_start: date
+    weeks: int = 1
+    no_repeat_days: int = 14
+    placeholder_quota: int = 0
+    max_batch_days: int = 3
+    preferences: Dict[Person, PersonPreferences] = {}
+    dry_run: bool = False
+
+
+class AutoPlanResult(BaseModel):
+    """Slots filled by the automatic planner."""
+
+    filled: int
+    empty: int
+    slots: List[PlanSlotUpdate]
+
+
+class RecipeStat(BaseModel):
+    """Meals of one recipe within a statistics period."""
+
+    recipe_id: int
+    name: str
+    meals: int
+    last_cooked_date: Optional[date] = None
+
+
+class TagStat(BaseModel):
+    """Meals with recipes of one tag within a statistics period."""
+
+    tag: str
+    meals: int
+
+
+class MonthStat(BaseModel):
+    """Meals in one month."""
+
+    month: date
+    meals: int
+
+
+class PlanStats(BaseModel):
+    """Cooking statistics of a plan, counting standard meals."""
+
+    since: Optional[date] = None
+    total_meals: int
+    most_cooked: List[RecipeStat]
+    tags: List[TagStat]
+    months: List[MonthStat]
@@ -0,0 +1,120 @@
+"""Share codes and invite links of meal plans.
+
+Codes are cut from one `secrets.token_bytes` call per batch instead of a
+`secrets.choice` call per character. A new share takes the first candidate
+of a batch that is not taken yet; a code taken concurrently fails the unique
+index on `share_code` and the next candidate is tried.
+
+Joining resolves the share, its plan's name and the user's existing access
+in one query (`resolve`), and a one-time invite is consumed with a
+conditional update, so two users cannot both use it (`consume`).
+"""
+
+import secrets
+import string
+from datetime import datetime
+from typing import List, Optional
+
+from sqlalchemy import and_, select, update
+from sqlalchemy.engine import Row
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+import models
+
+SHARE_CODE_ALPHABET = string.ascii_uppercase + string.digits
+TOKEN_ALPHABET = string.ascii_letters + string.digits
+TOKEN_LENGTH = 32
+# Candidates per lookup, and lookups before giving up
+CANDIDATES = 8
+MAX_ATTEMPTS = 5
+
+_shares = models.MealPlanShare.__table__
+
+
+def random_codes(alphabet: str, length: int, count: int) -> List[str]:
+    """`count` random codes of `length` characters from `alphabet`.
+
+    Bytes at or above the largest multiple of the alphabet size are dropped,
+    so every character is equally likely.
+    """
+    size = len(alphabet)
+    limit = 256 - 256 % size
+    needed = length * count
+    chars: List[str] = []
+    while len(chars) < needed:
+        missing = needed - len(chars)
+        chars += [alphabet[byte % size] for byte in secrets.token_bytes(missing + missing // 8 + 8) if byte < limit]
+    text = "".join(chars[:needed])
+    return [text[i : i + length] for i in range(0, needed, length)]
+
+
+def create(
+    db: Session,
+    meal_plan_id: int,
+    permission: models.Permission,
+    is_one_time: bool,
+    created_by_user_id: int,
+    alphabet: str = TOKEN_ALPHABET,
+    length: int = TOKEN_LENGTH,
+) -> str:
+    """Create and commit a share with a new unique code; returns the code.
+
+    Rolls back the session on a collision, so call it without other pending
+    changes.
+    """
+    for _ in range(MAX_ATTEMPTS):
+        candidates = random_codes(alphabet, length, CANDIDATES)
+        taken = set(db.scalars(select(_shares.c.share_code).where(_shares.c.share_code.in_(candidates))))
+        for code in candidates:
+            if code in taken:
+                continue
+            share = models.MealPlanShare(
+                meal_plan_id=meal_plan_id,
+                share_code=code,
+                permission=permission,
+                is_one_time=is_one_time,
+                created_by_user_id=created_by_user_id,
+            )
+            db.add(share)
+            try:
+                db.commit()
+            except IntegrityError:
+                # Taken since the lookup
+                db.rollback()
+                continue
+            return code
+    raise RuntimeError(f"No free share code after {MAX_ATTEMPTS * CANDIDATES} candidates")
+
+
+def resolve(db: Session, share_code: str, user_id: int) -> Optional[Row]:
+    """A share with its plan's name and the user's access id (None without access)."""
+    plans = models.MealPlan.__table__
+    access = models.UserMealPlanAccess.__table__
+    return db.execute(
+        select(
+            _shares.c.id,
+            _shares.c.meal_plan_id,
+            _shares.c.permission,
+            _shares.c.is_one_time,
+            _shares.c.consumed_at,
+            plans.c.name.label("plan_name"),
+            access.c.id.label("access_id"),
+        )
+        .join(plans, plans.c.id == _shares.c.meal_plan_id)
+        .outerjoin(access, and_(access.c.meal_plan_id == _shares.c.meal_plan_id, access.c.user_id == user_id))
+        .where(_shares.c.share_code == share_code)
+    ).first()
+
+
+def consume(db: Session, share_id: int) -> bool:
+    """Mark a one-time invite as used; False if it already was.
+
+    Part of the caller's transaction.
+    """
+    result = db.execute(
+        update(_shares)
+        .where(_shares.c.id == share_id, _shares.c.consumed_at.is_(None))
+        .values(consumed_at=datetime.utcnow())
+    )
+    return result.rowcount == 1
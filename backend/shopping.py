@@ -0,0 +1,100 @@
+"""Shopping list aggregation for Matplanerare.
+
+Ingredient quantities are scaled from a recipe's default portions to the
+portions of its batch, converted to a base unit per dimension (grams,
+millilitres, pieces) and merged by ingredient name.
+"""
+
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import schemas
+
+# Unit aliases mapped to (base unit, factor to base unit)
+UNIT_CONVERSIONS: Dict[str, Tuple[str, float]] = {
+    "mg": ("g", 0.001),
+    "g": ("g", 1.0),
+    "gram": ("g", 1.0),
+    "hg": ("g", 100.0),
+    "kg": ("g", 1000.0),
+    "ml": ("ml", 1.0),
+    "krm": ("ml", 1.0),
+    "tsk": ("ml", 5.0),
+    "msk": ("ml", 15.0),
+    "cl": ("ml", 10.0),
+    "dl": ("ml", 100.0),
+    "l": ("ml", 1000.0),
+    "liter": ("ml", 1000.0),
+    "st": ("st", 1.0),
+    "st.": ("st", 1.0),
+    "styck": ("st", 1.0),
+    "pcs": ("st", 1.0),
+}
+
+
+def normalize_unit(quantity: Optional[float], unit: Optional[str]) -> Tuple[Optional[float], Optional[str]]:
+    """Convert a quantity to the base unit of its dimension.
+
+    Unknown units are kept as-is (lowercased) so they still merge with
+    identical units.
+    """
+    key = (unit or "").strip().lower()
+    if not key:
+        return quantity, None
+    if key not in UNIT_CONVERSIONS:
+        return quantity, key
+    base_unit, factor = UNIT_CONVERSIONS[key]
+    return (quantity * factor if quantity is not None else None), base_unit
+
+
+def display_unit(quantity: Optional[float], unit: Optional[str]) -> Tuple[Optional[float], Optional[str]]:
+    """Convert a base-unit quantity to a readable unit (kg, l, dl)."""
+    if quantity is not None:
+        if unit == "g" and quantity >= 1000:
+            quantity, unit = quantity / 1000, "kg"
+        elif unit == "ml" and quantity >= 1000:
+            quantity, unit = quantity / 1000, "l"
+        elif unit == "ml" and quantity >= 100:
+            quantity, unit = quantity / 100, "dl"
+        quantity = round(quantity, 2)
+    return quantity, unit
+
+
+def aggregate_ingredients(
+    scaled_ingredients: Iterable[Tuple[int, float, schemas.Ingredient]],
+) -> List[schemas.ShoppingListItem]:
+    """Merge scaled ingredients into shopping list items.
+
+    Args:
+        scaled_ingredients: (recipe_id, scale factor, ingredient) triples
+
+    Returns:
+        Items sorted by name, one per ingredient name and unit dimension
+    """
+    merged: Dict[Tuple[str, Optional[str]], dict] = {}
+
+    for recipe_id, factor, ingredient in scaled_ingredients:
+        name = " ".join(ingredient.name.split()).lower()
+        if not name:
+            continue
+
+        quantity = ingredient.quantity * factor if ingredient.quantity is not None else None
+        quantity, unit = normalize_unit(quantity, ingredient.unit)
+
+        item = merged.setdefault((name, unit), {"quantity": None, "recipe_ids": []})
+        if quantity is not None:
+            item["quantity"] = (item["quantity"] or 0) + quantity
+        if recipe_id not in item["recipe_ids"]:
+            item["recipe_ids"].append(recipe_id)
+
+    items = []
+    for (name, unit), item in sorted(merged.items(), key=lambda kv: (kv[0][0], kv[0][1] or "")):
+        quantity, shown_unit = display_unit(item["quantity"], unit)
+        items.append(
+            schemas.ShoppingListItem(
+                name=name,
+                quantity=quantity,
+                unit=shown_unit,
+                recipe_ids=item["recipe_ids"],
+            )
+        )
+    return items
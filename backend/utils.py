@@ -1,10 +1,18 @@
 """Utility functions for Matplanerare API."""
 
-import secrets
-import string
 from typing import Optional
 from sqlalchemy.orm import Session
+import cache
+import invalidation
 import models
+import profiling
+import shares
+
+# (user_id, meal_plan_id) -> permission or None; dropped for a plan whenever
+# its members change, the TTL only guards against missed events
+_permission_cache = cache.get_cache("permissions", maxsize=4096, ttl=300)
+# Marks a cached "no access" since the cache returns None on a miss
+_NO_ACCESS = "none"
 
 
 def generate_share_code(length: int = 6) -> str:
@@ -18,8 +26,7 @@ def generate_share_code(length: int = 6) -> str:
     Returns:
         Random alphanumeric code
     """
-    chars = string.ascii_uppercase + string.digits
-    return "".join(secrets.choice(chars) for _ in range(length))
+    return shares.random_codes(shares.SHARE_CODE_ALPHABET, length, 1)[0]
 
 
 def generate_token(length: int = 24) -> str:
@@ -27,10 +34,10 @@ def generate_token(length: int = 24) -> str:
 
     Uses uppercase/lowercase letters and digits with secure randomness.
     """
-    chars = string.ascii_letters + string.digits
-    return "".join(secrets.choice(chars) for _ in range(length))
+    return shares.random_codes(shares.TOKEN_ALPHABET, length, 1)[0]
 
 
+@profiling.timed("perm")
 def get_user_permission_for_plan(user_id: int, meal_plan_id: int, db: Session) -> Optional[models.Permission]:
     """Get the permission level for a user on a specific meal plan.
 
@@ -42,15 +49,36 @@ def get_user_permission_for_plan(user_id: int, meal_plan_id: int, db: Session) -
     Returns:
         Permission enum or None if no access
     """
-    access = (
-        db.query(models.UserMealPlanAccess)
+    cached = _permission_cache.get((user_id, meal_plan_id))
+    if cached is not None:
+        return None if cached == _NO_ACCESS else cached
+
+    permission = (
+        db.query(models.UserMealPlanAccess.permission)
         .filter(
             models.UserMealPlanAccess.user_id == user_id,
             models.UserMealPlanAccess.meal_plan_id == meal_plan_id,
         )
-        .first()
+        .scalar()
     )
-    return access.permission if access else None
+    _permission_cache.set((user_id, meal_plan_id), permission or _NO_ACCESS)
+    return permission
+
+
+def invalidate_plan_permissions(meal_plan_id: int) -> None:
+    """Forget cached permissions on a plan after its members changed.
+
+    Call after the commit.
+    """
+    invalidation.publish("permissions", meal_plan_id)
+
+
+def _drop_plan_permissions(key: str) -> None:
+    meal_plan_id = int(key)
+    _permission_cache.discard(lambda cache_key: cache_key[1] == meal_plan_id)
+
+
+invalidation.subscribe("permissions", _drop_plan_permissions)
 
 
 def can_edit_plan(user_id: int, meal_plan_id: int, db: Session) -> bool:
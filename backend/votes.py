@@ -0,0 +1,156 @@
+"""Write-behind vote counter.
+
+Voting used to increment `recipes.vote_count` in the request, so quick votes
+from several household members queued up on the recipe row (and on SQLite's
+single writer) and could overwrite each other. A vote is now an insert into
+the append-only `recipe_votes` table. Every `MATBURK_VOTE_FLUSH_MS` a
+background thread claims the pending votes and adds them with one
+`UPDATE recipes SET vote_count = vote_count + n` per recipe, in the same
+transaction, so a vote is counted exactly once even with several workers
+flushing.
+
+Until then reads add the pending votes themselves (`pending`,
+`pending_counts`, `apply`). Cooking a recipe resets its votes; `discard`
+drops the pending ones with it.
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from typing import Dict, Iterable, Optional
+
+from sqlalchemy import bindparam, delete, func, insert, select, update
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
+
+import invalidation
+import metrics
+import models
+
+FLUSH_SECONDS = float(os.getenv("MATBURK_VOTE_FLUSH_MS", "1000")) / 1000
+
+logger = logging.getLogger(__name__)
+
+_votes = models.RecipeVote.__table__
+_recipes = models.RecipeDB.__table__
+_last_flush = 0
+# Set by `start`, for the pending votes gauge
+_engine: Optional[Engine] = None
+
+
+def cast(db: Session, meal_plan_id: int, recipe_id: int) -> None:
+    """Record a vote; it is part of the caller's transaction."""
+    db.execute(insert(_votes).values(meal_plan_id=meal_plan_id, recipe_id=recipe_id))
+
+
+def pending(db: Session, meal_plan_id: int, recipe_id: Optional[int] = None) -> Dict[int, int]:
+    """Votes per recipe of a plan that are not in `vote_count` yet."""
+    query = (
+        select(_votes.c.recipe_id, func.count())
+        .where(_votes.c.meal_plan_id == meal_plan_id)
+        .group_by(_votes.c.recipe_id)
+    )
+    if recipe_id is not None:
+        query = query.where(_votes.c.recipe_id == recipe_id)
+    return dict(db.execute(query).all())
+
+
+def pending_counts(meal_plan_id: int):
+    """Subquery of (recipe_id, votes) pending for a plan's recipes."""
+    return (
+        select(_votes.c.recipe_id, func.count().label("votes"))
+        .where(_votes.c.meal_plan_id == meal_plan_id)
+        .group_by(_votes.c.recipe_id)
+        .subquery()
+    )
+
+
+def apply(recipes: Iterable[models.RecipeDB], counts: Dict[int, int]) -> None:
+    """Add pending votes to loaded recipes without marking them modified."""
+    if not counts:
+        return
+    for recipe in recipes:
+        if recipe.id in counts:
+            set_committed_value(recipe, "vote_count", (recipe.vote_count or 0) + counts[recipe.id])
+
+
+def discard(db: Session, recipe_id: int) -> None:
+    """Drop a recipe's pending votes, when its vote count is reset.
+
+    Call before changing the recipe row, so the reset locks the votes before
+    the recipe like a flush does.
+    """
+    db.execute(delete(_votes).where(_votes.c.recipe_id == recipe_id))
+
+
+def _claim(conn) -> Counter:
+    """Delete all pending votes and count them per (plan, recipe)."""
+    if conn.dialect.delete_returning:
+        return Counter(
+            tuple(row) for row in conn.execute(delete(_votes).returning(_votes.c.meal_plan_id, _votes.c.recipe_id))
+        )
+    # SQLite before 3.35: another worker may have flushed since the select
+    rows = conn.execute(select(_votes.c.id, _votes.c.meal_plan_id, _votes.c.recipe_id)).all()
+    deleted = conn.execute(delete(_votes).where(_votes.c.id.in_([vote_id for vote_id, _, _ in rows]))).rowcount
+    if deleted != len(rows):
+        raise RuntimeError("Pending votes were flushed concurrently")
+    return Counter((meal_plan_id, recipe_id) for _, meal_plan_id, recipe_id in rows)
+
+
+def flush(engine: Engine) -> int:
+    """Move the pending votes into `recipes.vote_count`; returns their number.
+
+    Votes bump neither the plan version nor `recipes.version`. Caches that
+    hold vote counts are dropped once per flush instead, through the "votes"
+    invalidation.
+    """
+    global _last_flush
+    # Skip the write transaction when there is nothing to do
+    with engine.connect() as conn:
+        if conn.execute(select(_votes.c.id).limit(1)).first() is None:
+            _last_flush = 0
+            return 0
+
+    with engine.begin() as conn:
+        counts = _claim(conn)
+        if counts:
+            conn.execute(
+                update(_recipes)
+                .where(_recipes.c.id == bindparam("recipe"))
+                .values(vote_count=func.coalesce(_recipes.c.vote_count, 0) + bindparam("votes")),
+                [{"recipe": recipe_id, "votes": votes} for (_, recipe_id), votes in sorted(counts.items())],
+            )
+    for meal_plan_id in sorted({meal_plan_id for meal_plan_id, _ in counts}):
+        invalidation.publish("votes", meal_plan_id)
+    _last_flush = sum(counts.values())
+    return _last_flush
+
+
+def _flush_loop(engine: Engine) -> None:
+    while True:
+        time.sleep(FLUSH_SECONDS)
+        try:
+            flush(engine)
+        except Exception:  # noqa: BLE001 - the votes stay pending for the next round
+            logger.exception("Vote flush failed")
+
+
+def _pending_total() -> int:
+    if _engine is None:
+        return 0
+    with _engine.connect() as conn:
+        return conn.execute(select(func.count()).select_from(_votes)).scalar()
+
+
+metrics.register_gauge("matburk_vote_flush_size", "Votes added by the last flush", lambda: _last_flush)
+metrics.register_gauge("matburk_votes_pending", "Votes not yet added to vote_count", _pending_total)
+
+
+def start(engine: Engine) -> None:
+    """Flush pending votes in the background."""
+    global _engine
+    _engine = engine
+    threading.Thread(target=_flush_loop, args=(engine,), name="vote-flush", daemon=True).start()
@@ -1,6 +1,6 @@
-import { useState, useEffect, useCallback } from 'react';
+import { useState, useEffect, useCallback, useRef } from 'react';
 import axios from 'axios';
-import { startOfWeek, endOfWeek, format, addWeeks, subWeeks } from 'date-fns';
+import { startOfWeek, format, addWeeks, subWeeks, parseISO } from 'date-fns';
 import { Plus, Settings, X } from 'lucide-react';
 import { useAuth, useUser, useClerk } from '@clerk/clerk-react';
 import { SignIn } from '@clerk/clerk-react';
@@ -49,6 +49,9 @@ function App() {
   const [currentWeekStart, setCurrentWeekStart] = useState(
     startOfWeek(new Date(), { weekStartsOn: 1 })
   );
+  // Slots of loaded weeks by plan and Monday, shown at once when navigating
+  const weekSlotsRef = useRef(new Map());
+  const shownWeekRef = useRef(null);
 
   // Sorting
   const [sortField, setSortField] = useState('total_meals');
@@ -245,21 +248,39 @@ function App() {
     [selectedPlanId, sortField, sortOrder]
   );
 
-  // Fetch meal plan slots for selected plan
+  // Fetch meal plan slots for selected plan, with the weeks before and after
   const fetchPlanSlots = useCallback(async () => {
     if (!selectedPlanId) return;
 
-    try {
-      const startStr = format(currentWeekStart, 'yyyy-MM-dd');
-      const endStr = format(
-        endOfWeek(currentWeekStart, { weekStartsOn: 1 }),
-        'yyyy-MM-dd'
-      );
+    const weekKey = (monday) =>
+      `${selectedPlanId}:${format(monday, 'yyyy-MM-dd')}`;
+    const shownWeek = weekKey(currentWeekStart);
+    shownWeekRef.current = shownWeek;
 
+    // Show the prefetched week right away, then refresh it
+    const prefetched = weekSlotsRef.current.get(shownWeek);
+    if (prefetched) setPlan(prefetched);
+
+    try {
+      const startStr = format(subWeeks(currentWeekStart, 1), 'yyyy-MM-dd');
       const res = await axios.get(
-        `${API_URL}/plans/${selectedPlanId}/plan?start_date=${startStr}&end_date=${endStr}`
+        `${API_URL}/plans/${selectedPlanId}/plan?start_date=${startStr}&weeks=3`
       );
-      setPlan(res.data);
+
+      const weeks = new Map();
+      for (const offset of [-1, 0, 1]) {
+        weeks.set(weekKey(addWeeks(currentWeekStart, offset)), []);
+      }
+      for (const slot of res.data) {
+        const monday = startOfWeek(parseISO(slot.plan_date), {
+          weekStartsOn: 1,
+        });
+        weeks.get(weekKey(monday))?.push(slot);
+      }
+      weeks.forEach((slots, key) => weekSlotsRef.current.set(key, slots));
+
+      // Skip if the user navigated on while loading
+      if (shownWeekRef.current === shownWeek) setPlan(weeks.get(shownWeek));
     } catch (error) {
       console.error('Kunde inte hämta planslots', error);
     }
@@ -571,6 +592,7 @@ function App() {
             recipes={recipes}
             plan={plan}
             onUpdateSlot={handleUpdateSlot}
+            onRefreshPlan={fetchPlanSlots}
             apiUrl={API_URL}
             planId={selectedPlanId}
             onVote={handleVote}
@@ -10,7 +10,7 @@ import BulkImportRecipes from './BulkImportRecipes';
  *
  * Handles recipe creation with:
  * - Basic info (name, portions)
- * - Tags, notes, and recipe link
+ * - Tags, notes, and recipe link (prefills name, image and portions)
  * - Image upload (file or URL)
  * - Form submission and validation
  */
@@ -38,6 +38,24 @@ export default function AddRecipe({ onAdded, apiUrl, planId }) {
     setImageUrl('');
   }, []);
 
+  /**
+   * Fill empty fields from the recipe page's metadata when a link is entered
+   */
+  const handleLinkBlur = useCallback(async () => {
+    if (!link || (name && imageUrl)) return;
+    try {
+      const { data } = await axios.get(`${apiUrl}/link-metadata`, {
+        params: { url: link },
+      });
+      if (data.title) setName((current) => current || data.title);
+      if (data.image_url) setImageUrl((current) => current || data.image_url);
+      if (data.servings && !name) setPortions(data.servings);
+    } catch (error) {
+      // Not every link can be read; the fields are filled in by hand then
+      console.warn('Could not read recipe link:', error);
+    }
+  }, [link, name, imageUrl, apiUrl]);
+
   /**
    * Handle form submission - POST new recipe to backend
    */
@@ -145,6 +163,7 @@ export default function AddRecipe({ onAdded, apiUrl, planId }) {
               placeholder="https://..."
               value={link}
               onChange={(e) => setLink(e.target.value)}
+              onBlur={handleLinkBlur}
               aria-label="Länk till originalrecept"
             />
           </div>
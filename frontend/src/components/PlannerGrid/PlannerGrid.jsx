@@ -24,6 +24,7 @@ export default function PlannerGrid({
   recipes,
   plan,
   onUpdateSlot,
+  onRefreshPlan,
   apiUrl,
   planId,
   onVote,
@@ -60,7 +61,7 @@ export default function PlannerGrid({
     updateBatchPortions,
     removeFromPlanning,
     getAllocatedCount,
-  } = useMealBatches(recipes, plan, currentWeekStart);
+  } = useMealBatches(apiUrl, planId, plan, currentWeekStart);
 
   // ========== COMPUTED VALUES ==========
   /** Placeholder recipes (quick add buttons) - sorted by ID for stability */
@@ -178,9 +179,9 @@ export default function PlannerGrid({
    */
   const handleRemoveFromPlanning = useCallback(
     (e, id) => {
-      removeFromPlanning(e, id, onUpdateSlot);
+      removeFromPlanning(e, id, onRefreshPlan);
     },
-    [removeFromPlanning, onUpdateSlot]
+    [removeFromPlanning, onRefreshPlan]
   );
 
   /**
@@ -1,128 +1,119 @@
 import { useState, useEffect, useCallback } from 'react';
-import { format, addDays } from 'date-fns';
+import axios from 'axios';
+import { format } from 'date-fns';
+
+const toBatch = (batch) => ({
+  recipeId: batch.recipe_id,
+  recipeName: batch.recipe_name,
+  image: batch.image_url,
+  imageUrl: batch.image_url,
+  targetPortions: batch.target_portions,
+  usedPortions: batch.used_portions,
+  remainingPortions: batch.remaining_portions,
+});
 
 /**
- * Hook to manage meal batches with automatic syncing based on plan
+ * Hook to manage the meal batches of a week.
+ *
+ * The server derives the batches from the plan slots and stores their target
+ * portions, so they are refetched whenever the week's slots change.
  */
-export function useMealBatches(recipes, plan, currentWeekStart) {
+export function useMealBatches(apiUrl, planId, plan, currentWeekStart) {
   const [batches, setBatches] = useState([]);
   const [selectedBatchId, setSelectedBatchId] = useState(null);
-  const [removedRecipeIds, setRemovedRecipeIds] = useState([]);
+
+  const weekStr = format(currentWeekStart, 'yyyy-MM-dd');
+  const batchesUrl = `${apiUrl}/plans/${planId}/batches`;
 
   /**
-   * Synchronize meal batches with current week's plan
+   * Fetch the week's batches when the plan or its slots change
    */
   useEffect(() => {
-    if (!recipes.length) return;
-
-    const startStr = format(currentWeekStart, 'yyyy-MM-dd');
-    const endStr = format(addDays(currentWeekStart, 6), 'yyyy-MM-dd');
-
-    const currentWeekSlots = plan.filter(
-      (p) => p.plan_date >= startStr && p.plan_date <= endStr
-    );
+    if (!planId) return undefined;
 
-    const recipeIdsInWeek = [
-      ...new Set(currentWeekSlots.map((p) => p.recipe_id)),
-    ].filter(Boolean);
-
-    setBatches((prevBatches) => {
-      const newBatches = [];
-
-      recipeIdsInWeek.forEach((rId) => {
-        if (removedRecipeIds.includes(rId)) return;
-
-        const recipe = recipes.find((r) => r.id === rId);
-        if (recipe) {
-          const currentUsage = currentWeekSlots.filter(
-            (p) => p.recipe_id === rId
-          ).length;
-          const existing = prevBatches.find((b) => b.recipeId === rId);
-
-          newBatches.push({
-            recipeId: recipe.id,
-            recipeName: recipe.name,
-            image: recipe.image_url,
-            targetPortions: existing
-              ? existing.targetPortions
-              : Math.max(recipe.default_portions, currentUsage),
-          });
-        }
-      });
-
-      prevBatches.forEach((prev) => {
-        const alreadyAdded = newBatches.find(
-          (b) => b.recipeId === prev.recipeId
+    let cancelled = false;
+    const fetchBatches = async () => {
+      try {
+        const response = await axios.get(
+          `${batchesUrl}?start_date=${weekStr}`
         );
-        if (!alreadyAdded && !removedRecipeIds.includes(prev.recipeId)) {
-          newBatches.push(prev);
-        }
-      });
+        if (!cancelled) setBatches(response.data.map(toBatch));
+      } catch (error) {
+        console.error('Kunde inte hämta matlådor', error);
+      }
+    };
+    fetchBatches();
 
-      return newBatches;
-    });
-  }, [plan, recipes, currentWeekStart, removedRecipeIds]);
+    return () => {
+      cancelled = true;
+    };
+  }, [batchesUrl, planId, weekStr, plan]);
 
   // Reset when week changes
   useEffect(() => {
     setSelectedBatchId(null);
     setBatches([]);
-  }, [currentWeekStart]);
-
-  const addToPlanning = useCallback((recipe) => {
-    setRemovedRecipeIds((prev) => prev.filter((id) => id !== recipe.id));
-
-    setBatches((prevBatches) => {
-      const exists = prevBatches.find((b) => b.recipeId === recipe.id);
-      if (!exists) {
-        return [
-          ...prevBatches,
-          {
-            recipeId: recipe.id,
-            targetPortions: recipe.default_portions,
-            recipeName: recipe.name,
-            image: recipe.image_url,
-            imageUrl: recipe.image_url,
-          },
-        ];
-      }
-      return prevBatches;
-    });
+  }, [weekStr]);
 
-    setSelectedBatchId(recipe.id);
-  }, []);
-
-  const updateBatchPortions = useCallback((id, change) => {
+  const replaceBatch = useCallback((batch) => {
     setBatches((prevBatches) =>
-      prevBatches.map((b) =>
-        b.recipeId === id
-          ? { ...b, targetPortions: Math.max(1, b.targetPortions + change) }
-          : b
-      )
+      prevBatches.some((b) => b.recipeId === batch.recipeId)
+        ? prevBatches.map((b) => (b.recipeId === batch.recipeId ? batch : b))
+        : [...prevBatches, batch]
     );
   }, []);
 
+  const saveTarget = useCallback(
+    async (recipeId, targetPortions) => {
+      try {
+        const response = await axios.post(batchesUrl, {
+          week_start: weekStr,
+          recipe_id: recipeId,
+          target_portions: targetPortions,
+        });
+        replaceBatch(toBatch(response.data));
+      } catch (error) {
+        console.error('Kunde inte spara matlåda', error);
+      }
+    },
+    [batchesUrl, weekStr, replaceBatch]
+  );
+
+  const addToPlanning = useCallback(
+    (recipe) => {
+      if (!batches.some((b) => b.recipeId === recipe.id)) {
+        saveTarget(recipe.id, Math.max(1, recipe.default_portions || 1));
+      }
+      setSelectedBatchId(recipe.id);
+    },
+    [batches, saveTarget]
+  );
+
+  const updateBatchPortions = useCallback(
+    (id, change) => {
+      const batch = batches.find((b) => b.recipeId === id);
+      if (!batch) return;
+      saveTarget(id, Math.max(1, batch.targetPortions + change));
+    },
+    [batches, saveTarget]
+  );
+
   const removeFromPlanning = useCallback(
-    (e, id, onUpdateSlot) => {
+    async (e, id, onRefreshPlan) => {
       e.stopPropagation();
 
-      setRemovedRecipeIds((prev) => [...prev, id]);
       setBatches((prevBatches) => prevBatches.filter((b) => b.recipeId !== id));
       setSelectedBatchId((current) => (current === id ? null : current));
 
-      // Clear all slots with this recipe
-      plan.forEach((slot) => {
-        if (slot.recipe_id === id) {
-          onUpdateSlot({
-            plan_date: slot.plan_date,
-            meal_type: slot.meal_type,
-            person: slot.person,
-            recipe_id: null,
-          });
-        }
-      });
+      // The server clears the week's slots with this recipe as well
+      try {
+        await axios.delete(`${batchesUrl}/${id}?start_date=${weekStr}`);
+      } catch (error) {
+        console.error('Kunde inte ta bort matlåda', error);
+      }
+      onRefreshPlan();
     },
-    [plan]
+    [batchesUrl, weekStr]
   );
 
   const getAllocatedCount = useCallback(